@@ -0,0 +1,145 @@
+"""
+دسترسی async به پایگاه داده از یک thread اختصاصی
+
+handler های ربات به جای صدا زدن مستقیم Database (و متوقف کردن event loop
+در زمان نوشتن روی دیسک) فراخوانی را await می‌کنند. تمام فراخوانی‌هایی که در
+یک دور event loop ثبت می‌شوند با هم به thread پایگاه داده فرستاده شده و در
+یک تراکنش اجرا می‌شوند (هر فراخوانی یک SAVEPOINT جدا دارد، پس خطای یکی
+کار بقیه را خراب نمی‌کند). تراکنش دسته با BEGIN IMMEDIATE شروع می‌شود تا
+نوشتن اتصال‌های دیگر وسط دسته باعث رد شدن نوشتن‌های آن نشود.
+
+کلاس Database بدون تغییر برای اسکریپت‌های هم‌زمان (مثل setup_admin.py) باقی است.
+"""
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, List, Tuple
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# (متد، args، kwargs، future)
+Call = Tuple[Callable, tuple, dict, asyncio.Future]
+
+
+class AsyncDatabase:
+    """
+    نمای async کلاس Database
+
+    هر متد Database با همان نام و آرگومان‌ها به صورت coroutine در دسترس است:
+        settings = await adb.get_user_settings(user_id)
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._requests: queue.SimpleQueue = queue.SimpleQueue()
+        self._pending: List[Call] = []
+        self._flush_scheduled = False
+        self._thread = None
+        self.stats = {'calls': 0, 'batches': 0, 'max_batch': 0, 'fallbacks': 0}
+
+    def __getattr__(self, name: str):
+        method = getattr(self.db, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.submit(method, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        setattr(self, name, call)
+        return call
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='database', daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        """اجرای فراخوانی‌های باقی‌مانده و توقف thread"""
+        if self._thread is None:
+            return
+        if self._pending:
+            self._flush()
+        self._requests.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    def submit(self, method: Callable, *args, **kwargs) -> asyncio.Future:
+        """ثبت فراخوانی برای دسته دور فعلی event loop"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((method, args, kwargs, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            # بعد از اجرای بقیه callback های همین دور فرستاده می‌شود
+            loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        batch, self._pending = self._pending, []
+        self._flush_scheduled = False
+        if batch:
+            self._requests.put((asyncio.get_running_loop(), batch))
+
+    def _run(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            loop, batch = item
+            results = self._execute(batch)
+            loop.call_soon_threadsafe(self._resolve, batch, results)
+        self.db.close_connection()
+
+    def _execute(self, batch: List[Call]) -> List[Tuple[Any, BaseException]]:
+        self.stats['calls'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+        if len(batch) == 1:
+            return [self._call(*batch[0][:3])]
+
+        conn = self.db.get_connection()
+        try:
+            conn.begin_batch()
+            try:
+                results = []
+                for method, args, kwargs, _ in batch:
+                    conn.begin_call()
+                    try:
+                        results.append(self._call(method, args, kwargs))
+                    finally:
+                        conn.end_call()
+            finally:
+                conn.batch = False
+            conn.commit()
+            return results
+        except sqlite3.Error as e:
+            # مثلاً قفل بودن پایگاه داده هنگام commit: اجرای تک‌تک فراخوانی‌ها
+            logger.warning(f"خطا در اجرای دسته‌ای پایگاه داده ({len(batch)} فراخوانی): {e}")
+            conn.close()
+            self.stats['fallbacks'] += 1
+            return [self._call(method, args, kwargs) for method, args, kwargs, _ in batch]
+
+    @staticmethod
+    def _call(method: Callable, args: tuple, kwargs: dict) -> Tuple[Any, BaseException]:
+        try:
+            return method(*args, **kwargs), None
+        except Exception as e:
+            return None, e
+
+    @staticmethod
+    def _resolve(batch: List[Call], results: List[Tuple[Any, BaseException]]):
+        for (_, _, _, future), (result, error) in zip(batch, results):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
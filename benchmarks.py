@@ -0,0 +1,401 @@
+"""
+بنچمارک‌های عملکرد ربات (بدون نیاز به توکن و اتصال به تلگرام)
+
+نحوه اجرا:
+    python benchmarks.py delivery --messages 2000
+    python benchmarks.py webhook --updates 2000 --file recorded_updates.jsonl
+    python benchmarks.py snapshot --reads 20000
+    python benchmarks.py router --taps 100000
+    python benchmarks.py db --ops 5000 --threads 4
+    python benchmarks.py messagelog --rows 10000
+"""
+import argparse
+import asyncio
+import functools
+import json
+import random
+import time
+
+
+class StubBot:
+    """Bot API ساختگی با تاخیر شبکه و flood wait تصادفی"""
+
+    def __init__(self, latency: float = 0.05, flood_rate: float = 0.0, flood_wait: int = 1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        from telegram.error import RetryAfter
+
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and random.random() < self.flood_rate:
+            raise RetryAfter(self.flood_wait)
+        self.sent += 1
+        return chat_id
+
+
+async def bench_delivery(args):
+    """توان عملیاتی صف ارسال در برابر ارسال ترتیبی قدیمی"""
+    from delivery import DeliveryQueue
+
+    bot = StubBot(latency=args.latency, flood_rate=args.flood_rate)
+    queue = DeliveryQueue(workers=args.workers, rate=args.rate)
+    await queue.start()
+
+    started = time.perf_counter()
+    futures = [
+        queue.submit(chat_id, functools.partial(bot.send_message, chat_id=chat_id, text='benchmark'))
+        for chat_id in range(args.messages)
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    sequential = args.messages * (args.latency + 0.1)
+
+    print(f"پیام‌ها: {args.messages:,} | worker ها: {args.workers} | سقف نرخ: {args.rate}/s")
+    print(f"زمان صف ارسال: {elapsed:.2f}s ({args.messages / elapsed:.1f} msg/s)")
+    print(f"ناموفق: {failed:,} | RetryAfter: {queue.stats['retry_after']:,}")
+    print(f"تخمین روش ترتیبی قبلی (sleep 0.1): {sequential:.2f}s")
+
+
+def synthetic_updates(count: int, users: int):
+    """ساخت update های ساختگی (فشردن دکمه قیمت‌ها توسط کاربران مختلف)"""
+    now = int(time.time())
+    for update_id in range(1, count + 1):
+        user_id = 1000 + update_id % users
+        yield {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': now,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+                'text': '📤 ارسال قیمت الان'
+            }
+        }
+
+
+async def bench_webhook(args):
+    """زمان پاسخ و زمان کامل پردازش update ها در حالت webhook (ارسال update های ضبط شده)"""
+    import aiohttp
+    from telegram import Bot
+
+    from priority import WaitHistogram
+    from update_processor import UserSerializingProcessor
+    from webhook import SECRET_HEADER, WebhookServer
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = list(synthetic_updates(args.updates, args.users))
+
+    secret = 'benchmark-secret'
+    queue = asyncio.Queue()
+    server = WebhookServer(Bot('123456:benchmark'), queue, secret_token=secret,
+                           host='127.0.0.1', port=args.port)
+    processor = UserSerializingProcessor(concurrency=args.concurrency,
+                                         max_pending=len(updates), overload_timeout=60)
+    processor.on_processed = server.mark_processed
+    await processor.initialize()
+    await server.start()
+
+    async def handler():
+        await asyncio.sleep(args.handler_latency)
+
+    # معادل update fetcher در Application: برداشتن از صف و پردازش هم‌زمان
+    tasks = set()
+
+    async def fetcher():
+        while True:
+            update = await queue.get()
+            task = asyncio.create_task(processor.process_update(update, handler()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    fetcher_task = asyncio.create_task(fetcher())
+    client_latency = WaitHistogram()
+    url = f'http://127.0.0.1:{args.port}{server.path}'
+    limit = asyncio.Semaphore(args.clients)
+
+    async def post(session, data):
+        async with limit:
+            started = time.perf_counter()
+            async with session.post(url, json=data, headers={SECRET_HEADER: secret}) as response:
+                await response.read()
+                client_latency.observe(time.perf_counter() - started)
+                return response.status
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        statuses = await asyncio.gather(*(post(session, data) for data in updates))
+    while server.handler_latency.count < statuses.count(200):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    fetcher_task.cancel()
+    await server.stop()
+
+    ack = client_latency.summary()
+    handled = server.handler_latency.summary()
+    print(f"update ها: {len(updates):,} | کلاینت هم‌زمان: {args.clients} | پردازش هم‌زمان: {args.concurrency}")
+    print(f"زمان کل: {elapsed:.2f}s ({len(updates) / elapsed:.1f} update/s) | خطا: {len(statuses) - statuses.count(200):,}")
+    print(f"زمان پاسخ HTTP: p50 {ack['p50_ms']:.0f}ms | p95 {ack['p95_ms']:.0f}ms | max {ack['max_ms']:.0f}ms")
+    print(f"زمان کامل پردازش: p50 {handled['p50_ms']:.0f}ms | p95 {handled['p95_ms']:.0f}ms | max {handled['max_ms']:.0f}ms")
+
+
+def snapshot_writer(path: str, interval: float, stop):
+    """پردازه نویسنده: انتشار مداوم snapshot با قیمت یکسان برای همه اقلام"""
+    from config import CRYPTO_SYMBOLS
+    from market_snapshot import MarketSnapshot
+
+    snapshot = MarketSnapshot(path)
+    version = 0
+    while not stop.is_set():
+        version += 1
+        snapshot.publish({'cryptos': {
+            crypto_id: {'price': version, 'change_24h': 0, 'price_toman': version}
+            for crypto_id in CRYPTO_SYMBOLS
+        }})
+        time.sleep(interval)
+
+
+async def bench_snapshot(args):
+    import multiprocessing
+    import os
+    import tempfile
+
+    from market_snapshot import MarketSnapshot
+
+    path = os.path.join(tempfile.mkdtemp(), 'market_snapshot.bin')
+    stop = multiprocessing.Event()
+    writer = multiprocessing.Process(target=snapshot_writer, args=(path, args.interval, stop))
+    writer.start()
+
+    reader = MarketSnapshot(path)
+    while reader.read() is None:
+        await asyncio.sleep(0.01)
+
+    torn = 0
+    started = time.perf_counter()
+    for _ in range(args.reads):
+        prices = reader.read()
+        values = {data['price'] for data in prices['cryptos'].values()}
+        values |= {data['price_toman'] for data in prices['cryptos'].values()}
+        if len(values) != 1:
+            torn += 1
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    writer.join()
+    os.remove(path)
+
+    print(f"خواندن: {args.reads:,} | زمان کل: {elapsed:.2f}s ({elapsed / args.reads * 1e6:.1f}µs برای هر خواندن)")
+    print(f"تلاش مجدد seqlock: {reader.stats['retries']:,} | خواندن ناسازگار: {torn:,}")
+
+
+# مسیرهای callback ربات به ترتیب ثبت در bot.py (پیشوندها با * مشخص شده‌اند)
+CALLBACK_ROUTES = [
+    'check_membership', 'refresh_prices', 'select_assets_main', 'asset_type_crypto', 'crypto_top5',
+    'crypto_top10', 'crypto_manual', 'toggle_crypto_*', 'asset_type_gold_silver', 'asset_type_usd',
+    'asset_type_fiat', 'asset_type_gold_coins', 'asset_type_gold_items', 'asset_type_stock',
+    'toggle_asset_*', 'toggle_fiat_*', 'toggle_coin_*', 'toggle_gold_item_*', 'setup_schedule',
+    'add_schedule_time', 'manage_schedules', 'toggle_schedule_*', 'toggle_status_*', 'schedule_mode_*',
+    'delete_schedule_*', 'set_time_*', 'timezone_menu', 'set_tz_*', 'remove_assets',
+    'disable_notification', 'open_settings', 'back_to_main', 'send_prices_now', 'admin_panel',
+    'admin_stats_general', 'admin_stats_users', 'admin_stats_messages', 'admin_stats_popular_cryptos',
+    'admin_stats_activity', 'admin_recent_users', 'admin_system_status', 'admin_broadcast',
+    'admin_broadcast_confirm', 'admin_broadcast_cancel', 'admin_close'
+]
+
+
+async def bench_router(args):
+    from telegram import CallbackQuery, Update, User
+    from telegram.ext import CallbackQueryHandler
+
+    from callback_router import CallbackRouter
+
+    async def callback(update, context):
+        pass
+
+    router = CallbackRouter()
+    handlers = []
+    samples = []
+    for route in CALLBACK_ROUTES:
+        if route.endswith('*'):
+            prefix = route[:-1]
+            router.add_prefix(prefix, callback)
+            handlers.append(CallbackQueryHandler(callback, pattern=f'^{prefix}'))
+            samples.append(f'{prefix}12345')
+        else:
+            router.add(route, callback)
+            handlers.append(CallbackQueryHandler(callback, pattern=f'^{route}$'))
+            samples.append(route)
+
+    user = User(1, 'a', False)
+    updates = [
+        Update(i, callback_query=CallbackQuery(str(i), user, 'instance', data=samples[i % len(samples)]))
+        for i in range(args.taps)
+    ]
+
+    def linear(update):
+        for handler in handlers:
+            if handler.check_update(update):
+                return handler
+        return None
+
+    for name, check in (('regex ترتیبی', linear), ('router', router.check_update)):
+        started = time.perf_counter()
+        for update in updates:
+            if not check(update):
+                raise RuntimeError(f"مسیر پیدا نشد: {update.callback_query.data}")
+        elapsed = time.perf_counter() - started
+        print(f"{name}: {elapsed / args.taps * 1e6:.2f}µs برای هر کلیک ({len(CALLBACK_ROUTES)} مسیر)")
+
+    # بدترین حالت مسیریابی ترتیبی: آخرین مسیر ثبت شده
+    last = Update(0, callback_query=CallbackQuery('0', user, 'instance', data=samples[-1]))
+    for name, check in (('regex ترتیبی (آخرین مسیر)', linear), ('router (آخرین مسیر)', router.check_update)):
+        started = time.perf_counter()
+        for _ in range(args.taps):
+            check(last)
+        elapsed = time.perf_counter() - started
+        print(f"{name}: {elapsed / args.taps * 1e6:.2f}µs")
+
+
+def db_workload(db, user_ids, ops, seed):
+    """ترکیب درخواست‌های یک کلیک: خواندن تنظیمات، ثبت پیام، تغییر انتخاب"""
+    rng = random.Random(seed)
+    failed = 0
+    for i in range(ops):
+        user_id = rng.choice(user_ids)
+        if db.get_user_settings(user_id) is None:
+            failed += 1
+        if i % 2 == 0 and not db.log_message(user_id, 'price_request'):
+            failed += 1
+        if i % 5 == 0 and not db.update_selected_cryptos(user_id, ['bitcoin', 'ethereum']):
+            failed += 1
+    return failed
+
+
+async def bench_db(args):
+    import os
+    import sqlite3
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from database import Database
+
+    class ConnectPerCallDatabase(Database):
+        """الگوی قبلی: اتصال جدید برای هر فراخوانی"""
+
+        def get_connection(self):
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        def close(self):
+            pass
+
+    user_ids = list(range(1, args.users + 1))
+    for name, cls in (('اتصال در هر فراخوانی', ConnectPerCallDatabase), ('اتصال ماندگار + WAL', Database)):
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        db = cls(path)
+        for user_id in user_ids:
+            db.add_user(user_id, f'user{user_id}')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            results = list(pool.map(
+                lambda seed: db_workload(db, user_ids, args.ops // args.threads, seed), range(args.threads)
+            ))
+        elapsed = time.perf_counter() - started
+        db.close()
+
+        print(f"{name}: {elapsed:.2f}s ({args.ops / elapsed:,.0f} کلیک/s) | "
+              f"خطا: {sum(results):,} | thread ها: {args.threads}")
+
+
+async def bench_messagelog(args):
+    import os
+    import tempfile
+
+    from async_database import AsyncDatabase
+    from database import Database
+    from message_log import MessageLogBuffer
+
+    adb = AsyncDatabase(Database(os.path.join(tempfile.mkdtemp(), 'bench.db')))
+
+    # روش قبلی: یک INSERT و commit برای هر پیام (مثل ارسال یک دقیقه پرطرفدار)
+    started = time.perf_counter()
+    for user_id in range(args.rows):
+        await adb.log_message(user_id, 'scheduled_notification')
+    single = time.perf_counter() - started
+
+    buffer = MessageLogBuffer(adb, batch_size=args.batch_size)
+    await buffer.start()
+    started = time.perf_counter()
+    for user_id in range(args.rows):
+        await buffer.log(user_id, 'scheduled_notification')
+    logged = time.perf_counter() - started
+    await buffer.stop()
+    drained = time.perf_counter() - started
+    await adb.stop()
+
+    print(f"ردیف‌ها: {args.rows:,}")
+    print(f"ثبت تک‌تک: {single:.2f}s ({single / args.rows * 1e6:.0f}µs برای هر پیام)")
+    print(f"بافر: {logged / args.rows * 1e6:.1f}µs برای هر پیام | تا ثبت کامل: {drained:.2f}s "
+          f"در {buffer.stats['batches']:,} تراکنش")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='بنچمارک‌های ربات ارزَلان')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    delivery_parser = subparsers.add_parser('delivery', help='توان عملیاتی صف ارسال')
+    delivery_parser.add_argument('--messages', type=int, default=1000)
+    delivery_parser.add_argument('--workers', type=int, default=16)
+    delivery_parser.add_argument('--rate', type=float, default=28)
+    delivery_parser.add_argument('--latency', type=float, default=0.05)
+    delivery_parser.add_argument('--flood-rate', type=float, default=0.0)
+    delivery_parser.set_defaults(func=bench_delivery)
+
+    webhook_parser = subparsers.add_parser('webhook', help='زمان پاسخ و پردازش در حالت webhook')
+    webhook_parser.add_argument('--file', help='فایل JSONL شامل update های ضبط شده')
+    webhook_parser.add_argument('--updates', type=int, default=1000)
+    webhook_parser.add_argument('--users', type=int, default=200)
+    webhook_parser.add_argument('--clients', type=int, default=40)
+    webhook_parser.add_argument('--concurrency', type=int, default=32)
+    webhook_parser.add_argument('--handler-latency', type=float, default=0.05)
+    webhook_parser.add_argument('--port', type=int, default=8089)
+    webhook_parser.set_defaults(func=bench_webhook)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='خواندن snapshot بازار هم‌زمان با نوشتن پردازه دیگر')
+    snapshot_parser.add_argument('--reads', type=int, default=20000)
+    snapshot_parser.add_argument('--interval', type=float, default=0.0005)
+    snapshot_parser.set_defaults(func=bench_snapshot)
+
+    router_parser = subparsers.add_parser('router', help='هزینه مسیریابی callback ها')
+    router_parser.add_argument('--taps', type=int, default=100000)
+    router_parser.set_defaults(func=bench_router)
+
+    db_parser = subparsers.add_parser('db', help='اتصال ماندگار در برابر اتصال جدید برای هر فراخوانی')
+    db_parser.add_argument('--ops', type=int, default=5000)
+    db_parser.add_argument('--users', type=int, default=1000)
+    db_parser.add_argument('--threads', type=int, default=4)
+    db_parser.set_defaults(func=bench_db)
+
+    messagelog_parser = subparsers.add_parser('messagelog', help='ثبت تاریخچه پیام‌ها تک‌تک در برابر بافر')
+    messagelog_parser.add_argument('--rows', type=int, default=10000)
+    messagelog_parser.add_argument('--batch-size', type=int, default=500)
+    messagelog_parser.set_defaults(func=bench_messagelog)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
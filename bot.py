@@ -2,20 +2,23 @@
 ربات تلگرام دستیار ارزَلان - اطلاع‌رسانی قیمت ارزهای دیجیتال
 """
 import asyncio
+import functools
 import logging
+import signal
 import sys
-from datetime import datetime, time
+from datetime import datetime
 from typing import List
 
 
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
-    CallbackQueryHandler,
+    ChatMemberHandler,
     ConversationHandler,
     ContextTypes,
+    TypeHandler,
     filters
 )
 from telegram.error import TelegramError
@@ -23,11 +26,37 @@ import pytz
 
 from config import (
     TELEGRAM_BOT_TOKEN, CHANNEL_ID, TIMEZONE, CRYPTO_SYMBOLS,
-    DEFAULT_CRYPTOS, TOP_5_CRYPTOS, TOP_10_CRYPTOS, PRESET_TIMES,
-    FIAT_CURRENCIES, GOLD_COINS, GOLD_ITEMS
+    DEFAULT_CRYPTOS, TOP_5_CRYPTOS, TOP_10_CRYPTOS,
+    SCHEDULE_CHANGE_MODES, TIMEZONE_CHOICES,
+    SIGNIFICANT_CHANGE_THRESHOLD, OUTBOX_BATCH_SIZE, OUTBOX_RESUME_MAX_AGE,
+    OUTBOX_RETENTION_DAYS, PRIORITY_FETCH_CONCURRENCY, PRIORITY_BULK_SHARE,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+    WORKER_COUNT, WORKER_ID, LEADER_LEASE_TTL, SCHEDULE_RESYNC_INTERVAL, MARKET_SNAPSHOT_INTERVAL,
+    USER_ASSETS_BACKFILL_BATCH, USER_ASSETS_BACKFILL_INTERVAL, HISTORY_RETENTION_INTERVAL
 )
+from async_database import AsyncDatabase
+from callback_router import CallbackRouter
+from cluster import LeaderLease
 from database import Database
+from delivery import DeliveryQueue, QueueStopped, UnreachableChat
+from keyboards import (
+    MAIN_MENU_KEYBOARD, MAIN_MENU_INLINE_KEYBOARD, MEMBERSHIP_KEYBOARD, ASSET_TYPES_KEYBOARD,
+    CRYPTO_MENU_KEYBOARD, CRYPTO_TOP5_KEYBOARD, SCHEDULES_KEYBOARD, SCHEDULES_EMPTY_KEYBOARD,
+    PRESET_TIMES_KEYBOARD, SCHEDULE_ADDED_KEYBOARD, SETUP_SCHEDULE_KEYBOARD, SETTINGS_KEYBOARD,
+    BACK_TO_SETTINGS_KEYBOARD, CRYPTO_PICKER, TOP_10_PICKER, FIAT_PICKER, GOLD_COIN_PICKER,
+    GOLD_ITEM_PICKER, GOLD_SILVER_PICKER, USD_PICKER, price_keyboard, scheduled_price_keyboard,
+    timezone_keyboard
+)
+from market_snapshot import MarketSnapshot
+from membership import MEMBER_STATUSES, MembershipCache
+from message_log import MessageLogBuffer
 from price_fetcher import PriceFetcher
+from retention import HistoryArchiver
+from selection_drafts import SelectionDrafts
+from priority import BULK, INTERACTIVE, PriorityGate, format_lane_stats
+from scheduler import ScheduleManager, minute_key, spread_window, split_by_slot
+from update_processor import UserSerializingProcessor
+from webhook import WebhookServer
 
 # تنظیم لاگ
 logging.basicConfig(
@@ -36,13 +65,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# نام نمایشی حالت‌های ارسال زمان‌بندی
+SCHEDULE_CHANGE_MODE_NAMES = {
+    'always': '📨 همیشه ارسال شود',
+    'skip': '🔕 فقط در صورت تغییر مهم',
+    'brief': '✂️ پیام کوتاه در صورت نبود تغییر مهم'
+}
+
 # وضعیت‌های مکالمه
 WAITING_FOR_TIME = range(1)
 WAITING_FOR_BROADCAST_MESSAGE = range(1)
 
+# callback های منوهای چند انتخابی که فقط پیش‌نویس انتخاب را تغییر می‌دهند
+SELECTION_DRAFT_CALLBACKS = tuple(
+    picker.callback_prefix for picker in (CRYPTO_PICKER, FIAT_PICKER, GOLD_COIN_PICKER, GOLD_ITEM_PICKER)
+)
+
 # نمونه‌های global
 db = Database()
+adb = AsyncDatabase(db)
+message_log = MessageLogBuffer(adb)
+selection_drafts = SelectionDrafts(adb)
+history_archiver = HistoryArchiver(db)
 price_fetcher = PriceFetcher()
+delivery_queue = DeliveryQueue()
+fetch_gate = PriorityGate(PRIORITY_FETCH_CONCURRENCY, PRIORITY_BULK_SHARE)
+update_processor = UserSerializingProcessor()
+membership_cache = MembershipCache()
+
+# حالت چند worker: قیمت‌ها از snapshot مشترکی که leader منتشر می‌کند خوانده می‌شوند
+if WORKER_COUNT > 1:
+    price_fetcher.snapshot = MarketSnapshot()
 
 
 class ArzalanBot:
@@ -50,16 +103,30 @@ class ArzalanBot:
 
     def __init__(self):
         self.application = None
+        self.webhook_server = None
+        self.scheduler = ScheduleManager(adb, self.send_scheduled_price)
+        # در حالت چند worker فقط دارنده lease زمان‌بندی‌ها را اجرا می‌کند
+        self.leader_lease = LeaderLease(adb) if WORKER_COUNT > 1 else None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader_lease is None or self.leader_lease.is_leader
 
     async def is_admin(self, user_id: int) -> bool:
         """چک کردن ادمین بودن کاربر"""
-        return db.is_admin(user_id)
+        return await adb.is_admin(user_id)
 
     async def check_channel_membership(self, user_id: int) -> bool:
-        """چک کردن عضویت کاربر در کانال"""
+        """چک کردن عضویت کاربر در کانال (با کش)"""
+        is_member = membership_cache.get(user_id)
+        if is_member is not None:
+            return is_member
+
         try:
             member = await self.application.bot.get_chat_member(CHANNEL_ID, user_id)
-            return member.status in ['member', 'administrator', 'creator']
+            is_member = member.status in MEMBER_STATUSES
+            membership_cache.set(user_id, is_member)
+            return is_member
         except TelegramError as e:
             logger.error(f"خطا در چک عضویت کانال: {e}")
             return True  # در صورت خطا، اجازه ادامه بده
@@ -78,11 +145,7 @@ class ArzalanBot:
             membership_message = """برای استفاده از دستیار ارزَلان کافیه در کانال اصلی اون عضو بشی.
 خبری از تبلیغات نیست کانال خودمونه."""
 
-            keyboard = [
-                [InlineKeyboardButton("🔗 عضویت در کانال", url=f"https://t.me/{CHANNEL_ID.replace('@', '')}")],
-                [InlineKeyboardButton("✅ عضو شدم", callback_data='check_membership')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = MEMBERSHIP_KEYBOARD
 
             # بررسی اینکه آیا از callback آمده یا message
             if update.callback_query:
@@ -97,13 +160,7 @@ class ArzalanBot:
 
     def get_main_menu_keyboard(self):
         """منوی اصلی با دکمه‌های keyboard"""
-        keyboard = [
-            ['📤 ارسال قیمت الان'],
-            ['🕒 تنظیم زمان ارسال روزانه پیام', '🔔 اعلان تغییر قیمت'],
-            ['❓ راهنما', '⚙️ تنظیمات'],
-            ['👤 پشتیبانی']
-        ]
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return MAIN_MENU_KEYBOARD
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """دستور /start - پیام خوش‌آمد و چک عضویت"""
@@ -111,7 +168,7 @@ class ArzalanBot:
         user_id = user.id
 
         # ثبت یا به‌روزرسانی کاربر
-        db.add_user(
+        await adb.add_user(
             user_id=user_id,
             username=user.username,
             first_name=user.first_name,
@@ -119,6 +176,12 @@ class ArzalanBot:
             language_code=user.language_code
         )
 
+        # کاربری که قبلاً ربات را بلاک کرده بود برگشته است
+        if await adb.reactivate_user(user_id):
+            await self.scheduler.sync_buckets(
+                schedule['utc_minute'] for schedule in await adb.get_user_schedules(user_id)
+            )
+
         # پیام خوش‌آمد
         welcome_message = f"""📲 به دستیار ابزار ارز دیجیتال ارزَلان خوش اومدی!
 
@@ -140,11 +203,7 @@ class ArzalanBot:
             membership_message = """برای استفاده از دستیار ارزَلان کافیه در کانال اصلی اون عضو بشی.
 خبری از تبلیغات نیست کانال خودمونه."""
 
-            keyboard = [
-                [InlineKeyboardButton("🔗 عضویت در کانال", url=f"https://t.me/{CHANNEL_ID.replace('@', '')}")],
-                [InlineKeyboardButton("✅ عضو شدم", callback_data='check_membership')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = MEMBERSHIP_KEYBOARD
             await update.message.reply_text(membership_message, reply_markup=reply_markup)
         else:
             # نمایش منوی اصلی و ارسال لیست قیمت‌ها
@@ -155,6 +214,8 @@ class ArzalanBot:
         query = update.callback_query
         user_id = update.effective_user.id
 
+        # کاربر می‌گوید تازه عضو شده؛ نتیجه کش شده قبلی معتبر نیست
+        membership_cache.invalidate(user_id)
         is_member = await self.check_channel_membership(user_id)
 
         if is_member:
@@ -166,6 +227,15 @@ class ArzalanBot:
         else:
             await query.answer("❌ برای ادامه باید عضو کانال باشی", show_alert=True)
 
+    async def channel_member_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """به‌روزرسانی کش عضویت وقتی تلگرام عضویت یا خروج کاربری از کانال را گزارش می‌کند"""
+        chat_member = update.chat_member
+        chat = chat_member.chat
+        if CHANNEL_ID not in (str(chat.id), f'@{chat.username}'):
+            return
+
+        membership_cache.update_status(chat_member.new_chat_member.user.id, chat_member.new_chat_member.status)
+
     async def show_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """نمایش منوی اصلی و ارسال قیمت‌ها"""
         # نمایش منوی keyboard
@@ -204,7 +274,7 @@ class ArzalanBot:
 
         try:
             # دریافت تنظیمات کاربر
-            settings = db.get_user_settings(user_id)
+            settings = await adb.get_user_settings(user_id)
 
             if not settings:
                 crypto_ids = DEFAULT_CRYPTOS
@@ -223,45 +293,29 @@ class ArzalanBot:
                 gold_coin_ids = settings.get('selected_gold_coins', [])
                 gold_item_ids = settings.get('selected_gold_items', [])
 
-            # دریافت قیمت‌ها
-            prices = await price_fetcher.get_all_prices(
-                crypto_ids=crypto_ids,
-                include_gold=include_gold,
-                include_silver=include_silver,
-                include_usd=include_usd,
-                fiat_currency_ids=fiat_currency_ids,
-                gold_coin_ids=gold_coin_ids,
-                gold_item_ids=gold_item_ids
-            )
+            # دریافت قیمت‌ها (جلوتر از ارسال‌های زمان‌بندی شده)
+            async with fetch_gate.slot(INTERACTIVE):
+                prices = await price_fetcher.get_all_prices(
+                    crypto_ids=crypto_ids,
+                    include_gold=include_gold,
+                    include_silver=include_silver,
+                    include_usd=include_usd,
+                    fiat_currency_ids=fiat_currency_ids,
+                    gold_coin_ids=gold_coin_ids,
+                    gold_item_ids=gold_item_ids
+                )
 
             # فرمت کردن پیام
             message, has_error = price_fetcher.format_price_message(prices)
 
-            # ایجاد دکمه‌های inline
-            if has_error:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            else:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = price_keyboard(has_error)
 
             # حذف پیام پردازش و ارسال پیام اصلی
             await processing_msg.delete()
             await update.message.reply_text(message, reply_markup=reply_markup)
 
             # ثبت در تاریخچه
-            db.log_message(user_id, 'price_request')
+            await message_log.log(user_id, 'price_request')
 
         except Exception as e:
             logger.error(f"خطا در دریافت قیمت: {e}")
@@ -273,7 +327,7 @@ class ArzalanBot:
         """ارسال قیمت‌ها به کاربر (برای callback)"""
         try:
             # دریافت تنظیمات کاربر
-            settings = db.get_user_settings(user_id)
+            settings = await adb.get_user_settings(user_id)
 
             if not settings:
                 crypto_ids = DEFAULT_CRYPTOS
@@ -292,48 +346,33 @@ class ArzalanBot:
                 gold_coin_ids = settings.get('selected_gold_coins', [])
                 gold_item_ids = settings.get('selected_gold_items', [])
 
-            # دریافت قیمت‌ها
-            prices = await price_fetcher.get_all_prices(
-                crypto_ids=crypto_ids,
-                include_gold=include_gold,
-                include_silver=include_silver,
-                include_usd=include_usd,
-                fiat_currency_ids=fiat_currency_ids,
-                gold_coin_ids=gold_coin_ids,
-                gold_item_ids=gold_item_ids
-            )
+            # دریافت قیمت‌ها (جلوتر از ارسال‌های زمان‌بندی شده)
+            async with fetch_gate.slot(INTERACTIVE):
+                prices = await price_fetcher.get_all_prices(
+                    crypto_ids=crypto_ids,
+                    include_gold=include_gold,
+                    include_silver=include_silver,
+                    include_usd=include_usd,
+                    fiat_currency_ids=fiat_currency_ids,
+                    gold_coin_ids=gold_coin_ids,
+                    gold_item_ids=gold_item_ids
+                )
 
             # فرمت کردن پیام
             message, has_error = price_fetcher.format_price_message(prices)
 
-            # ایجاد دکمه‌های inline
-            if has_error:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            else:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
-            # ارسال پیام
-            await context.bot.send_message(
+            reply_markup = price_keyboard(has_error)
+
+            # ارسال پیام (جلوتر از پیام‌های انبوه در صف ارسال)
+            await delivery_queue.submit(user_id, functools.partial(
+                context.bot.send_message,
                 chat_id=user_id,
                 text=message,
                 reply_markup=reply_markup
-            )
+            ), lane=INTERACTIVE)
 
             # ثبت در تاریخچه
-            db.log_message(user_id, 'price_request')
+            await message_log.log(user_id, 'price_request')
 
         except Exception as e:
             logger.error(f"خطا در ارسال قیمت: {e}")
@@ -352,7 +391,7 @@ class ArzalanBot:
 
         try:
             # دریافت تنظیمات کاربر
-            settings = db.get_user_settings(user_id)
+            settings = await adb.get_user_settings(user_id)
 
             if not settings:
                 crypto_ids = DEFAULT_CRYPTOS
@@ -371,38 +410,22 @@ class ArzalanBot:
                 gold_coin_ids = settings.get('selected_gold_coins', [])
                 gold_item_ids = settings.get('selected_gold_items', [])
 
-            # دریافت قیمت‌های جدید
-            prices = await price_fetcher.get_all_prices(
-                crypto_ids=crypto_ids,
-                include_gold=include_gold,
-                include_silver=include_silver,
-                include_usd=include_usd,
-                fiat_currency_ids=fiat_currency_ids,
-                gold_coin_ids=gold_coin_ids,
-                gold_item_ids=gold_item_ids
-            )
+            # دریافت قیمت‌های جدید (جلوتر از ارسال‌های زمان‌بندی شده)
+            async with fetch_gate.slot(INTERACTIVE):
+                prices = await price_fetcher.get_all_prices(
+                    crypto_ids=crypto_ids,
+                    include_gold=include_gold,
+                    include_silver=include_silver,
+                    include_usd=include_usd,
+                    fiat_currency_ids=fiat_currency_ids,
+                    gold_coin_ids=gold_coin_ids,
+                    gold_item_ids=gold_item_ids
+                )
 
             # فرمت کردن پیام
             message, has_error = price_fetcher.format_price_message(prices)
 
-            # ایجاد دکمه‌های inline
-            if has_error:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            else:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = price_keyboard(has_error)
 
             # به‌روزرسانی پیام
             await query.edit_message_text(message, reply_markup=reply_markup)
@@ -425,19 +448,7 @@ class ArzalanBot:
 
         message = "چه نوع دارایی می‌خوای اضافه کنی؟"
 
-        keyboard = [
-            [InlineKeyboardButton("💰 ارز دیجیتال (Cryptocurrency)", callback_data='asset_type_crypto')],
-            [InlineKeyboardButton("🥇 طلا و نقره", callback_data='asset_type_gold_silver')],
-            [InlineKeyboardButton("💵 دلار", callback_data='asset_type_usd')],
-            [InlineKeyboardButton("💱 ارزهای فیات", callback_data='asset_type_fiat')],
-            [InlineKeyboardButton("🪙 سکه‌های طلا", callback_data='asset_type_gold_coins')],
-            [InlineKeyboardButton("✨ طلا (گرمی، مثقال، اونس)", callback_data='asset_type_gold_items')],
-            [InlineKeyboardButton("📊 بورس ایران (به زودی)", callback_data='asset_type_stock')],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data='back_to_main')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=ASSET_TYPES_KEYBOARD)
 
     async def asset_type_crypto_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب ارزهای دیجیتال"""
@@ -446,15 +457,7 @@ class ArzalanBot:
 
         message = """ارزهای خود را به صورت دستی یا با انتخاب گزینه های زیر انتخاب کنید."""
 
-        keyboard = [
-            [InlineKeyboardButton("⭐️ ۵ ارز برتر بازار", callback_data='crypto_top5')],
-            [InlineKeyboardButton("🔟 ارزهای منتخب بازار", callback_data='crypto_top10')],
-            [InlineKeyboardButton("✍️ انتخاب دستی", callback_data='crypto_manual')],
-            [InlineKeyboardButton("🔙 بازگشت", callback_data='select_assets_main')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=CRYPTO_MENU_KEYBOARD)
 
     async def crypto_top5_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب 5 ارز برتر"""
@@ -462,7 +465,7 @@ class ArzalanBot:
         user_id = update.effective_user.id
 
         # ذخیره 5 ارز برتر
-        db.update_selected_cryptos(user_id, TOP_5_CRYPTOS)
+        await adb.update_selected_cryptos(user_id, TOP_5_CRYPTOS)
 
         await query.answer("✅ 5 ارز برتر بازار انتخاب شد")
 
@@ -475,13 +478,7 @@ class ArzalanBot:
 ☑️ BNB
 ☑️ SOL"""
 
-        keyboard = [
-            [InlineKeyboardButton("✍️ ویرایش دستی", callback_data='crypto_manual')],
-            [InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=CRYPTO_TOP5_KEYBOARD)
 
     async def crypto_top10_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای نمایش ارزهای منتخب بازار (10 ارز)"""
@@ -489,7 +486,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         current_cryptos = settings['selected_cryptos'] if settings else DEFAULT_CRYPTOS
 
@@ -497,19 +494,7 @@ class ArzalanBot:
 
 ارزهای منتخب بازار:"""
 
-        # ساخت دکمه‌های ارزها
-        keyboard = []
-
-        for crypto in TOP_10_CRYPTOS:
-            symbol = CRYPTO_SYMBOLS.get(crypto, crypto.upper())
-            is_selected = crypto in current_cryptos
-            button_text = f"{'☑️' if is_selected else '⬜️'} {symbol}"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'toggle_crypto_{crypto}')])
-
-        keyboard.append([InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=TOP_10_PICKER.keyboard(current_cryptos))
 
     async def crypto_manual_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب دستی ارزها"""
@@ -517,7 +502,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         current_cryptos = settings['selected_cryptos'] if settings else DEFAULT_CRYPTOS
 
@@ -525,58 +510,27 @@ class ArzalanBot:
 
 روی هر ارز کلیک کنید تا انتخاب/لغو شود."""
 
-        # ساخت دکمه‌های تمام ارزها
-        keyboard = []
-        available_cryptos = list(CRYPTO_SYMBOLS.keys())
-
-        for i in range(0, len(available_cryptos), 2):
-            row = []
-            for j in range(2):
-                if i + j < len(available_cryptos):
-                    crypto = available_cryptos[i + j]
-                    symbol = CRYPTO_SYMBOLS[crypto]
-                    is_selected = crypto in current_cryptos
-                    button_text = f"{'☑️' if is_selected else '⬜️'} {symbol}"
-                    row.append(InlineKeyboardButton(button_text, callback_data=f'toggle_crypto_{crypto}'))
-            keyboard.append(row)
-
-        keyboard.append([InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=CRYPTO_PICKER.keyboard(current_cryptos))
 
     async def toggle_crypto_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """callback برای تغییر وضعیت ارز"""
+        """callback برای تغییر وضعیت ارز (در پیش‌نویس؛ با خروج از منو ذخیره می‌شود)"""
         query = update.callback_query
         crypto_id = query.data.split('_', 2)[2]
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
-
-        current_cryptos = settings['selected_cryptos'] if settings else DEFAULT_CRYPTOS.copy()
-
-        # toggle کردن ارز
-        if crypto_id in current_cryptos:
-            current_cryptos.remove(crypto_id)
-        else:
-            current_cryptos.append(crypto_id)
 
-        # حداقل یک ارز باید انتخاب شده باشد
-        if len(current_cryptos) == 0:
+        # toggle کردن ارز (حداقل یک ارز باید انتخاب شده باشد)
+        current_cryptos = await selection_drafts.toggle(user_id, 'crypto', crypto_id, min_selected=1)
+        if current_cryptos is None:
             await query.answer("حداقل یک ارز باید انتخاب شود!", show_alert=True)
             return
 
-        # ذخیره در دیتابیس
-        db.update_selected_cryptos(user_id, current_cryptos)
-
-        await query.answer("✅ تغییرات ذخیره شد")
+        await query.answer()
 
-        # به‌روزرسانی پیام (بازگشت به همان صفحه)
+        # به‌روزرسانی کیبورد همان صفحه
         # چک کنیم کاربر در کدام لیست بود
-        if crypto_id in TOP_10_CRYPTOS:
-            await self.crypto_top10_callback(update, context)
-        else:
-            await self.crypto_manual_callback(update, context)
+        picker = TOP_10_PICKER if crypto_id in TOP_10_CRYPTOS else CRYPTO_PICKER
+        await query.edit_message_reply_markup(reply_markup=picker.keyboard(current_cryptos))
 
     async def asset_type_gold_silver_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب طلا و نقره"""
@@ -584,27 +538,15 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         include_gold = bool(settings['include_gold']) if settings else True
         include_silver = bool(settings['include_silver']) if settings else True
 
         message = "انتخاب طلا و نقره:"
 
-        keyboard = [
-            [InlineKeyboardButton(
-                f"{'☑️' if include_gold else '⬜️'} 🥇 طلا",
-                callback_data='toggle_asset_gold'
-            )],
-            [InlineKeyboardButton(
-                f"{'☑️' if include_silver else '⬜️'} 🥈 نقره",
-                callback_data='toggle_asset_silver'
-            )],
-            [InlineKeyboardButton("✔️ تأیید و بازگشت", callback_data='select_assets_main')]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        selected = [asset for asset, included in (('gold', include_gold), ('silver', include_silver)) if included]
+        await query.edit_message_text(message, reply_markup=GOLD_SILVER_PICKER.keyboard(selected))
 
     async def asset_type_usd_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب دلار"""
@@ -612,22 +554,13 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         include_usd = bool(settings['include_usd']) if settings else True
 
         message = "انتخاب دلار:"
 
-        keyboard = [
-            [InlineKeyboardButton(
-                f"{'☑️' if include_usd else '⬜️'} 💵 دلار آمریکا",
-                callback_data='toggle_asset_usd'
-            )],
-            [InlineKeyboardButton("✔️ تأیید و بازگشت", callback_data='select_assets_main')]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=USD_PICKER.keyboard(['usd'] if include_usd else []))
 
     async def asset_type_fiat_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب ارزهای فیات"""
@@ -635,7 +568,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         current_fiats = settings.get('selected_fiat_currencies', []) if settings else []
 
@@ -643,25 +576,7 @@ class ArzalanBot:
 
 روی هر ارز کلیک کنید تا انتخاب/لغو شود."""
 
-        # ساخت دکمه‌های ارزهای فیات
-        keyboard = []
-        available_fiats = list(FIAT_CURRENCIES.keys())
-
-        for i in range(0, len(available_fiats), 2):
-            row = []
-            for j in range(2):
-                if i + j < len(available_fiats):
-                    fiat_id = available_fiats[i + j]
-                    fiat_info = FIAT_CURRENCIES[fiat_id]
-                    is_selected = fiat_id in current_fiats
-                    button_text = f"{'☑️' if is_selected else '⬜️'} {fiat_info['flag']} {fiat_info['symbol']}"
-                    row.append(InlineKeyboardButton(button_text, callback_data=f'toggle_fiat_{fiat_id}'))
-            keyboard.append(row)
-
-        keyboard.append([InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=FIAT_PICKER.keyboard(current_fiats))
 
     async def asset_type_gold_coins_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب سکه‌های طلا"""
@@ -669,7 +584,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         current_coins = settings.get('selected_gold_coins', []) if settings else []
 
@@ -677,20 +592,7 @@ class ArzalanBot:
 
 روی هر سکه کلیک کنید تا انتخاب/لغو شود."""
 
-        # ساخت دکمه‌های سکه‌های طلا
-        keyboard = []
-        available_coins = list(GOLD_COINS.keys())
-
-        for coin_id in available_coins:
-            coin_info = GOLD_COINS[coin_id]
-            is_selected = coin_id in current_coins
-            button_text = f"{'☑️' if is_selected else '⬜️'} {coin_info['name']}"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'toggle_coin_{coin_id}')])
-
-        keyboard.append([InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=GOLD_COIN_PICKER.keyboard(current_coins))
 
     async def asset_type_gold_items_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای انتخاب آیتم‌های طلا"""
@@ -698,7 +600,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         current_items = settings.get('selected_gold_items', []) if settings else []
 
@@ -706,20 +608,7 @@ class ArzalanBot:
 
 روی هر آیتم کلیک کنید تا انتخاب/لغو شود."""
 
-        # ساخت دکمه‌های آیتم‌های طلا
-        keyboard = []
-        available_items = list(GOLD_ITEMS.keys())
-
-        for item_id in available_items:
-            item_info = GOLD_ITEMS[item_id]
-            is_selected = item_id in current_items
-            button_text = f"{'☑️' if is_selected else '⬜️'} {item_info['name']}"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'toggle_gold_item_{item_id}')])
-
-        keyboard.append([InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=GOLD_ITEM_PICKER.keyboard(current_items))
 
     async def asset_type_stock_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای بورس ایران (به زودی)"""
@@ -732,7 +621,7 @@ class ArzalanBot:
         asset_type = query.data.split('_', 2)[2]
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         # دریافت وضعیت فعلی
         current_value = bool(settings[f'include_{asset_type}']) if settings else True
@@ -742,7 +631,7 @@ class ArzalanBot:
 
         # ذخیره در دیتابیس
         kwargs = {f'include_{asset_type}': new_value}
-        db.update_asset_preferences(user_id, **kwargs)
+        await adb.update_asset_preferences(user_id, **kwargs)
 
         await query.answer("✅ تغییرات ذخیره شد")
 
@@ -753,76 +642,49 @@ class ArzalanBot:
             await self.asset_type_usd_callback(update, context)
 
     async def toggle_fiat_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """callback برای تغییر وضعیت ارز فیات"""
+        """callback برای تغییر وضعیت ارز فیات (در پیش‌نویس؛ با خروج از منو ذخیره می‌شود)"""
         query = update.callback_query
         fiat_id = query.data.split('_', 2)[2]
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
-
-        current_fiats = settings.get('selected_fiat_currencies', []) if settings else []
 
         # toggle کردن ارز فیات
-        if fiat_id in current_fiats:
-            current_fiats.remove(fiat_id)
-        else:
-            current_fiats.append(fiat_id)
+        selected = await selection_drafts.toggle(user_id, 'fiat', fiat_id)
 
-        # ذخیره در دیتابیس
-        db.update_selected_fiat_currencies(user_id, current_fiats)
-
-        await query.answer("✅ تغییرات ذخیره شد")
+        await query.answer()
 
-        # به‌روزرسانی پیام
-        await self.asset_type_fiat_callback(update, context)
+        # به‌روزرسانی کیبورد
+        await query.edit_message_reply_markup(reply_markup=FIAT_PICKER.keyboard(selected))
 
     async def toggle_coin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """callback برای تغییر وضعیت سکه طلا"""
+        """callback برای تغییر وضعیت سکه طلا (در پیش‌نویس؛ با خروج از منو ذخیره می‌شود)"""
         query = update.callback_query
         coin_id = query.data.split('_', 2)[2]
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
-
-        current_coins = settings.get('selected_gold_coins', []) if settings else []
 
         # toggle کردن سکه
-        if coin_id in current_coins:
-            current_coins.remove(coin_id)
-        else:
-            current_coins.append(coin_id)
-
-        # ذخیره در دیتابیس
-        db.update_selected_gold_coins(user_id, current_coins)
+        selected = await selection_drafts.toggle(user_id, 'coin', coin_id)
 
-        await query.answer("✅ تغییرات ذخیره شد")
+        await query.answer()
 
-        # به‌روزرسانی پیام
-        await self.asset_type_gold_coins_callback(update, context)
+        # به‌روزرسانی کیبورد
+        await query.edit_message_reply_markup(reply_markup=GOLD_COIN_PICKER.keyboard(selected))
 
     async def toggle_gold_item_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """callback برای تغییر وضعیت آیتم طلا"""
+        """callback برای تغییر وضعیت آیتم طلا (در پیش‌نویس؛ با خروج از منو ذخیره می‌شود)"""
         query = update.callback_query
         item_id = query.data.split('_', 3)[3]
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
-
-        current_items = settings.get('selected_gold_items', []) if settings else []
 
         # toggle کردن آیتم
-        if item_id in current_items:
-            current_items.remove(item_id)
-        else:
-            current_items.append(item_id)
+        selected = await selection_drafts.toggle(user_id, 'gold_item', item_id)
 
-        # ذخیره در دیتابیس
-        db.update_selected_gold_items(user_id, current_items)
-
-        await query.answer("✅ تغییرات ذخیره شد")
+        await query.answer()
 
-        # به‌روزرسانی پیام
-        await self.asset_type_gold_items_callback(update, context)
+        # به‌روزرسانی کیبورد
+        await query.edit_message_reply_markup(reply_markup=GOLD_ITEM_PICKER.keyboard(selected))
 
     async def setup_schedule_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای تنظیم زمان‌بندی (نمایش لیست تایم‌های فعلی)"""
@@ -837,7 +699,7 @@ class ArzalanBot:
         user_id = update.effective_user.id
 
         # دریافت لیست زمان‌بندی‌های فعلی
-        schedules = db.get_user_schedules(user_id)
+        schedules = await adb.get_user_schedules(user_id)
 
         message = """⏰ مدیریت زمان‌بندی ارسال پیام
 
@@ -854,16 +716,7 @@ class ArzalanBot:
 
         message += "برای اضافه کردن زمان جدید، روی دکمه زیر کلیک کنید."
 
-        keyboard = [
-            [InlineKeyboardButton("➕ افزودن زمان جدید", callback_data='add_schedule_time')]
-        ]
-
-        if schedules:
-            keyboard.append([InlineKeyboardButton("🗑 مدیریت تایم‌ها", callback_data='manage_schedules')])
-
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data='back_to_main')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = SCHEDULES_KEYBOARD if schedules else SCHEDULES_EMPTY_KEYBOARD
         await query.edit_message_text(message, reply_markup=reply_markup)
 
     async def add_schedule_time_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -879,19 +732,7 @@ class ArzalanBot:
 فرمت: HH:MM (مثال: 09:00 یا 14:30)"""
 
         # دکمه‌های ساعت پیش‌فرض
-        keyboard = []
-        for i in range(0, len(PRESET_TIMES), 2):
-            row = []
-            for j in range(2):
-                if i + j < len(PRESET_TIMES):
-                    time_str = PRESET_TIMES[i + j]
-                    row.append(InlineKeyboardButton(f"🕐 {time_str}", callback_data=f'set_time_{time_str}'))
-            keyboard.append(row)
-
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data='setup_schedule')])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=PRESET_TIMES_KEYBOARD)
 
         # ذخیره وضعیت برای دریافت زمان دستی
         context.user_data['waiting_for_time'] = True
@@ -902,7 +743,7 @@ class ArzalanBot:
         await query.answer()
 
         user_id = update.effective_user.id
-        schedules = db.get_user_schedules(user_id)
+        schedules = await adb.get_user_schedules(user_id)
 
         message = """🗑 مدیریت زمان‌بندی‌ها
 
@@ -926,11 +767,17 @@ class ArzalanBot:
 
         await query.answer()
 
+        schedule = await adb.get_schedule(schedule_id)
+        change_mode = (schedule.get('change_mode') if schedule else None) or 'always'
+
         # نمایش گزینه‌های مدیریت
-        message = "چه کاری می‌خوای انجام بدی؟"
+        message = f"""چه کاری می‌خوای انجام بدی؟
+
+📉 حالت ارسال: {SCHEDULE_CHANGE_MODE_NAMES[change_mode]}"""
 
         keyboard = [
             [InlineKeyboardButton("🔄 فعال/غیرفعال کردن", callback_data=f'toggle_status_{schedule_id}')],
+            [InlineKeyboardButton("📉 تغییر حالت ارسال", callback_data=f'schedule_mode_{schedule_id}')],
             [InlineKeyboardButton("🗑 حذف", callback_data=f'delete_schedule_{schedule_id}')],
             [InlineKeyboardButton("🔙 بازگشت", callback_data='manage_schedules')]
         ]
@@ -943,31 +790,57 @@ class ArzalanBot:
         query = update.callback_query
         schedule_id = int(query.data.split('_', 2)[2])
 
-        db.toggle_schedule_status(schedule_id)
+        schedule = await adb.get_schedule(schedule_id)
+        await adb.toggle_schedule_status(schedule_id)
 
-        # به‌روزرسانی job queue
-        await self.reload_all_schedules()
+        # به‌روزرسانی job همان دقیقه
+        if schedule:
+            await self.scheduler.sync_bucket(schedule['utc_minute'])
 
         await query.answer("✅ وضعیت تغییر کرد")
 
         # بازگشت به لیست مدیریت
         await self.manage_schedules_callback(update, context)
 
+    async def schedule_mode_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تغییر چرخشی حالت ارسال تایم (همیشه / فقط تغییرات مهم / پیام کوتاه)"""
+        query = update.callback_query
+        schedule_id = int(query.data.split('_', 2)[2])
+
+        schedule = await adb.get_schedule(schedule_id)
+        if not schedule or schedule['user_id'] != update.effective_user.id:
+            await query.answer("❌ زمان‌بندی یافت نشد", show_alert=True)
+            return
+
+        current_mode = schedule.get('change_mode') or 'always'
+        next_mode = SCHEDULE_CHANGE_MODES[
+            (SCHEDULE_CHANGE_MODES.index(current_mode) + 1) % len(SCHEDULE_CHANGE_MODES)
+        ]
+        # حالت ارسال در لحظه اجرا از دیتابیس خوانده می‌شود و job تغییری نمی‌کند
+        await adb.update_schedule_change_mode(schedule_id, next_mode, schedule.get('change_threshold'))
+
+        await query.answer(f"✅ {SCHEDULE_CHANGE_MODE_NAMES[next_mode]}")
+
+        # نمایش دوباره گزینه‌های همین تایم
+        await self.toggle_schedule_callback(update, context)
+
     async def delete_schedule_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """حذف تایم"""
         query = update.callback_query
         schedule_id = int(query.data.split('_', 2)[2])
 
-        db.remove_notification_schedule(schedule_id)
+        schedule = await adb.get_schedule(schedule_id)
+        await adb.remove_notification_schedule(schedule_id)
 
-        # به‌روزرسانی job queue
-        await self.reload_all_schedules()
+        # به‌روزرسانی job همان دقیقه
+        if schedule:
+            await self.scheduler.sync_bucket(schedule['utc_minute'])
 
         await query.answer("✅ تایم حذف شد")
 
         # بازگشت به لیست مدیریت
         user_id = update.effective_user.id
-        schedules = db.get_user_schedules(user_id)
+        schedules = await adb.get_user_schedules(user_id)
 
         if schedules:
             await self.manage_schedules_callback(update, context)
@@ -982,10 +855,11 @@ class ArzalanBot:
         user_id = update.effective_user.id
 
         # افزودن زمان جدید به لیست
-        db.add_notification_schedule(user_id, time_str)
+        utc_minute = await self.scheduler.user_utc_minute(user_id, time_str)
+        await adb.add_notification_schedule(user_id, time_str, utc_minute)
 
-        # برنامه‌ریزی job جدید
-        await self.reload_all_schedules()
+        # برنامه‌ریزی job همان دقیقه (در صورت نبود)
+        await self.scheduler.sync_bucket(utc_minute)
 
         await query.answer("✅ زمان‌بندی اضافه شد")
 
@@ -993,13 +867,7 @@ class ArzalanBot:
 
 🕐 هر روز در ساعت {time_str} گزارش قیمت‌ها برای شما ارسال می‌شود."""
 
-        keyboard = [
-            [InlineKeyboardButton("➕ افزودن تایم دیگر", callback_data='add_schedule_time')],
-            [InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_main')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=SCHEDULE_ADDED_KEYBOARD)
 
     async def receive_schedule_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """دریافت زمان دستی از کاربر"""
@@ -1021,10 +889,12 @@ class ArzalanBot:
             return
 
         # افزودن زمان جدید به لیست
-        db.add_notification_schedule(user_id, time_text)
+        time_text = f'{hour:02d}:{minute:02d}'
+        utc_minute = await self.scheduler.user_utc_minute(user_id, time_text)
+        await adb.add_notification_schedule(user_id, time_text, utc_minute)
 
-        # برنامه‌ریزی job جدید
-        await self.reload_all_schedules()
+        # برنامه‌ریزی job همان دقیقه (در صورت نبود)
+        await self.scheduler.sync_bucket(utc_minute)
 
         context.user_data['waiting_for_time'] = False
 
@@ -1040,7 +910,7 @@ class ArzalanBot:
             return
 
         user_id = update.effective_user.id
-        settings = db.get_user_settings(user_id)
+        settings = await adb.get_user_settings(user_id)
 
         if not settings:
             message = "شما هنوز تنظیماتی ندارید."
@@ -1049,25 +919,20 @@ class ArzalanBot:
         else:
             notification_status = "✅ فعال" if settings['notification_enabled'] else "❌ غیرفعال"
             notification_time = settings['notification_time']
+            timezone = settings.get('timezone') or TIMEZONE
 
             message = f"""⚙️ تنظیمات شما:
 
 🔔 وضعیت اعلان: {notification_status}
 🕐 زمان ارسال: {notification_time}
+🌍 منطقه زمانی: {TIMEZONE_CHOICES.get(timezone, timezone)}
 🪙 تعداد ارزها: {len(settings['selected_cryptos'])}
 🥇 طلا: {'✅' if settings['include_gold'] else '❌'}
 🥈 نقره: {'✅' if settings['include_silver'] else '❌'}
 💵 دلار: {'✅' if settings['include_usd'] else '❌'}"""
 
         # دکمه‌های تنظیمات
-        keyboard = [
-            [InlineKeyboardButton("🗑 حذف دارایی از لیست", callback_data='remove_assets')],
-            [InlineKeyboardButton("🕒 تغییر زمان ارسال", callback_data='setup_schedule')],
-            [InlineKeyboardButton("🔕 حذف اعلان تغییر قیمت", callback_data='disable_notification')],
-            [InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_main')]
-        ]
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = SETTINGS_KEYBOARD
 
         # بررسی اینکه آیا از command آمده یا callback
         if update.callback_query:
@@ -1075,6 +940,38 @@ class ArzalanBot:
         else:
             await update.message.reply_text(message, reply_markup=reply_markup)
 
+    async def timezone_menu_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """نمایش لیست منطقه‌های زمانی قابل انتخاب"""
+        query = update.callback_query
+        await query.answer()
+
+        settings = await adb.get_user_settings(update.effective_user.id)
+        current = (settings or {}).get('timezone') or TIMEZONE
+
+        message = """🌍 منطقه زمانی خود را انتخاب کنید:
+
+زمان‌بندی‌های ارسال روزانه بر اساس ساعت محلی همین منطقه اجرا می‌شوند."""
+
+        await query.edit_message_text(message, reply_markup=timezone_keyboard(current))
+
+    async def set_timezone_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تغییر منطقه زمانی کاربر"""
+        query = update.callback_query
+        timezone = query.data.split('_', 2)[2]
+        user_id = update.effective_user.id
+
+        if timezone not in TIMEZONE_CHOICES:
+            await query.answer("❌ منطقه زمانی نامعتبر است", show_alert=True)
+            return
+
+        await adb.update_user_timezone(user_id, timezone)
+
+        # محاسبه دوباره دقیقه UTC زمان‌بندی‌های همین کاربر
+        await self.scheduler.sync_user(user_id)
+
+        await query.answer(f"✅ {TIMEZONE_CHOICES[timezone]}")
+        await self.settings_command(update, context)
+
     async def remove_assets_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """callback برای حذف دارایی‌ها"""
         query = update.callback_query
@@ -1089,7 +986,7 @@ class ArzalanBot:
         user_id = update.effective_user.id
 
         # غیرفعال کردن نوتیفیکیشن
-        db.update_notification_settings(user_id, enabled=False)
+        await adb.update_notification_settings(user_id, enabled=False)
 
         # حذف job زمان‌بندی
         if self.application and self.application.job_queue:
@@ -1102,12 +999,7 @@ class ArzalanBot:
 
         message = "✅ اعلان‌های خودکار غیرفعال شدند."
 
-        keyboard = [
-            [InlineKeyboardButton("🔙 بازگشت به تنظیمات", callback_data='open_settings')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=BACK_TO_SETTINGS_KEYBOARD)
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """دستور /help یا دکمه راهنما"""
@@ -1175,9 +1067,7 @@ class ArzalanBot:
             await context.bot.send_message(
                 chat_id=user.id,
                 text="برای تنظیم زمان‌بندی روی دکمه زیر کلیک کنید:",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⏰ تنظیم زمان‌بندی", callback_data='setup_schedule')]
-                ])
+                reply_markup=SETUP_SCHEDULE_KEYBOARD
             )
         elif text == '🔔 اعلان تغییر قیمت':
             await update.message.reply_text("این قابلیت به زودی اضافه می‌شود...")
@@ -1188,6 +1078,18 @@ class ArzalanBot:
         elif text == '👤 پشتیبانی':
             await self.support_command(update, context)
 
+    async def save_selection_drafts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ذخیره پیش‌نویس انتخاب‌های کاربر با خروج از منوی انتخاب (هر update غیر از toggle)"""
+        user = update.effective_user
+        if user is None or user.id not in selection_drafts:
+            return
+
+        query = update.callback_query
+        if query and query.data and query.data.startswith(SELECTION_DRAFT_CALLBACKS):
+            return
+
+        await selection_drafts.save(user.id)
+
     async def back_to_main_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """بازگشت به منوی اصلی"""
         query = update.callback_query
@@ -1195,15 +1097,7 @@ class ArzalanBot:
 
         message = "منوی اصلی"
 
-        keyboard = [
-            [InlineKeyboardButton("📤 ارسال قیمت الان", callback_data='send_prices_now')],
-            [InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main')],
-            [InlineKeyboardButton("⏰ زمان‌بندی", callback_data='setup_schedule')],
-            [InlineKeyboardButton("⚙️ تنظیمات", callback_data='open_settings')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(message, reply_markup=reply_markup)
+        await query.edit_message_text(message, reply_markup=MAIN_MENU_INLINE_KEYBOARD)
 
     async def send_prices_now_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """ارسال قیمت‌ها از طریق callback"""
@@ -1219,7 +1113,7 @@ class ArzalanBot:
 
         try:
             # دریافت تنظیمات کاربر
-            settings = db.get_user_settings(user_id)
+            settings = await adb.get_user_settings(user_id)
 
             if not settings:
                 crypto_ids = DEFAULT_CRYPTOS
@@ -1238,43 +1132,27 @@ class ArzalanBot:
                 gold_coin_ids = settings.get('selected_gold_coins', [])
                 gold_item_ids = settings.get('selected_gold_items', [])
 
-            # دریافت قیمت‌ها
-            prices = await price_fetcher.get_all_prices(
-                crypto_ids=crypto_ids,
-                include_gold=include_gold,
-                include_silver=include_silver,
-                include_usd=include_usd,
-                fiat_currency_ids=fiat_currency_ids,
-                gold_coin_ids=gold_coin_ids,
-                gold_item_ids=gold_item_ids
-            )
+            # دریافت قیمت‌ها (جلوتر از ارسال‌های زمان‌بندی شده)
+            async with fetch_gate.slot(INTERACTIVE):
+                prices = await price_fetcher.get_all_prices(
+                    crypto_ids=crypto_ids,
+                    include_gold=include_gold,
+                    include_silver=include_silver,
+                    include_usd=include_usd,
+                    fiat_currency_ids=fiat_currency_ids,
+                    gold_coin_ids=gold_coin_ids,
+                    gold_item_ids=gold_item_ids
+                )
 
             # فرمت کردن پیام
             message, has_error = price_fetcher.format_price_message(prices)
 
-            # ایجاد دکمه‌های inline
-            if has_error:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            else:
-                keyboard = [
-                    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')],
-                    [
-                        InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
-                        InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
-                    ]
-                ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = price_keyboard(has_error)
 
             await query.edit_message_text(message, reply_markup=reply_markup)
 
             # ثبت در تاریخچه
-            db.log_message(user_id, 'price_request')
+            await message_log.log(user_id, 'price_request')
 
         except Exception as e:
             logger.error(f"خطا در دریافت قیمت: {e}")
@@ -1282,80 +1160,156 @@ class ArzalanBot:
                 "❌ متأسفانه در دریافت قیمت‌ها خطایی رخ داد."
             )
 
-    async def reload_all_schedules(self):
-        """بازنویسی کامل job queue با زمان‌بندی‌های جدید"""
+    def bucket_members(self, schedules: List[dict]):
+        """لیست کاربران یک نوبت ارسال به همراه تنظیمات حالت ارسال هر کاربر"""
+        user_ids = []
+        change_options = {}
+        for schedule in schedules:
+            user_ids.append(schedule['user_id'])
+            if schedule.get('change_mode') and schedule['change_mode'] != 'always':
+                change_options[schedule['user_id']] = {
+                    'mode': schedule['change_mode'],
+                    'threshold': schedule.get('change_threshold') or SIGNIFICANT_CHANGE_THRESHOLD
+                }
+        return user_ids, change_options
+
+    async def reload_all_schedules(self, resync_interval: int = None):
+        """هماهنگ‌سازی کامل job های زمان‌بندی با دیتابیس (هنگام راه‌اندازی؛ در حالت چند worker فقط leader)"""
+        try:
+            count = await self.scheduler.activate(resync_interval)
+            logger.info(f"تعداد {count} دقیقه زمان‌بندی (UTC) بارگذاری شد")
+        except Exception as e:
+            logger.error(f"خطا در بازنویسی زمان‌بندی‌ها: {e}")
+
+    async def send_scheduled_price(self, context: ContextTypes.DEFAULT_TYPE):
+        """ارسال قیمت‌ها در زمان برنامه‌ریزی شده"""
+        if not self.is_leader:
+            return
         try:
-            if not self.application or not self.application.job_queue:
-                logger.error("JobQueue در دسترس نیست")
+            # job فقط دقیقه UTC را نگه می‌دارد؛ اعضا در همین لحظه از دیتابیس خوانده می‌شوند
+            utc_minute = context.job.data['minute']
+            schedules = await adb.get_bucket_schedules(utc_minute)
+
+            if not schedules:
+                # همه زمان‌بندی‌های این دقیقه حذف یا غیرفعال شده‌اند
+                await self.scheduler.sync_bucket(utc_minute)
                 return
 
-            # حذف تمام job های قبلی
-            current_jobs = self.application.job_queue.jobs()
-            for job in current_jobs:
-                if job.name and job.name.startswith('schedule_'):
-                    job.schedule_removal()
+            user_ids, change_options = self.bucket_members(schedules)
 
-            # دریافت تمام زمان‌بندی‌های فعال
-            schedules = db.get_all_active_schedules()
+            # کلید یکتای این نوبت ارسال (تاریخ UTC + دقیقه)
+            today = datetime.now(pytz.utc).strftime('%Y-%m-%d')
+            job_key = f'schedule:{today}:{minute_key(utc_minute)}Z'
 
-            # گروه‌بندی بر اساس زمان
-            time_groups = {}
-            for schedule in schedules:
-                time_str = schedule['notification_time']
-                if time_str not in time_groups:
-                    time_groups[time_str] = []
-                time_groups[time_str].append(schedule['user_id'])
-
-            # ایجاد job برای هر زمان
-            for time_str, user_ids in time_groups.items():
-                hour, minute = map(int, time_str.split(':'))
-                tz = pytz.timezone(TIMEZONE)
-                scheduled_time = time(hour=hour, minute=minute, tzinfo=tz)
-
-                job_name = f'schedule_{time_str.replace(":", "")}'
-
-                self.application.job_queue.run_daily(
-                    self.send_scheduled_price,
-                    time=scheduled_time,
-                    data={'time': time_str, 'user_ids': user_ids},
-                    name=job_name
+            # پخش کاربران نوبت‌های شلوغ در چند دقیقه متوالی
+            window = spread_window(len(user_ids))
+            slots = split_by_slot(user_ids, window)
+            if window > 1:
+                logger.info(
+                    f"نوبت {minute_key(utc_minute)} UTC با {len(user_ids)} کاربر در {window} دقیقه پخش می‌شود"
                 )
 
-                logger.info(f"زمان‌بندی {time_str} با {len(user_ids)} کاربر ایجاد شد")
+            # اقلام دقیقه‌های بعدی از همین حالا در outbox ثبت می‌شوند تا بعد از ری‌استارت از دست نروند
+            for slot, slot_user_ids in slots.items():
+                if slot == 0:
+                    continue
+                slot_key = f'{job_key}+{slot}'
+                await adb.create_outbox_job(
+                    slot_key, 'schedule', {'minute': utc_minute, 'slot': slot}, slot_user_ids
+                )
+                self.schedule_spread_slot(slot_key, utc_minute, slot * 60)
 
-            logger.info(f"تعداد {len(schedules)} زمان‌بندی بارگذاری شد")
+            if slots.get(0):
+                await self.deliver_scheduled_bucket(
+                    context.bot, job_key, utc_minute, slots[0], change_options
+                )
 
         except Exception as e:
-            logger.error(f"خطا در بازنویسی زمان‌بندی‌ها: {e}")
+            logger.error(f"خطا در ارسال گزارش برنامه‌ریزی شده: {e}")
 
-    async def send_scheduled_price(self, context: ContextTypes.DEFAULT_TYPE):
-        """ارسال قیمت‌ها در زمان برنامه‌ریزی شده"""
+    def schedule_spread_slot(self, job_key: str, utc_minute: int, delay: float):
+        """زمان‌بندی ارسال یک دقیقه از پنجره پخش (job تکراری با همین کلید ساخته نمی‌شود)"""
+        name = f'spread_{job_key}'
+        if self.application.job_queue.get_jobs_by_name(name):
+            return
+        self.application.job_queue.run_once(
+            self.send_spread_slot, when=delay,
+            data={'minute': utc_minute, 'job_key': job_key},
+            name=name
+        )
+
+    async def send_spread_slot(self, context: ContextTypes.DEFAULT_TYPE):
+        """ارسال یک دقیقه از پنجره پخش نوبت زمان‌بندی"""
+        if not self.is_leader:
+            # اقلام در outbox می‌مانند و leader جدید آن‌ها را از سر می‌گیرد
+            return
         try:
-            # دریافت user_ids از job data
-            job_data = context.job.data
-            user_ids = job_data['user_ids']
-            time_str = job_data['time']
+            utc_minute = context.job.data['minute']
+            job_key = context.job.data['job_key']
 
-            logger.info(f"شروع ارسال برنامه‌ریزی شده برای {len(user_ids)} کاربر در ساعت {time_str}")
+            pending = await adb.get_outbox_pending(job_key)
+            if not pending:
+                await adb.complete_outbox_job(job_key)
+                return
 
-            # ارسال پیام به هر کاربر
-            for user_id in user_ids:
-                try:
-                    # دریافت تنظیمات کاربر
-                    settings = db.get_user_settings(user_id)
+            # کاربرانی که در این فاصله زمان‌بندی را حذف یا غیرفعال کرده‌اند ارسال نمی‌شوند
+            user_ids, change_options = self.bucket_members(await adb.get_bucket_schedules(utc_minute))
+            members = set(user_ids)
+            await adb.mark_outbox_items(job_key, {
+                user_id: 'skipped' for user_id in pending if user_id not in members
+            })
 
-                    if not settings:
-                        continue
+            await self.deliver_scheduled_bucket(
+                context.bot, job_key, utc_minute,
+                [user_id for user_id in pending if user_id in members], change_options
+            )
+
+        except Exception as e:
+            logger.error(f"خطا در ارسال بخش پخش شده زمان‌بندی: {e}")
+
+    async def deliver_scheduled_bucket(self, bot, job_key: str, utc_minute: int,
+                                       user_ids: List[int], change_options: dict):
+        """ارسال گزارش یک نوبت زمان‌بندی از طریق outbox (قابل از سرگیری و بدون ارسال تکراری)"""
+        time_str = f'{minute_key(utc_minute)} UTC'
+
+        # ثبت دسته‌ای اقلام در outbox و حذف کاربرانی که قبلاً دریافت کرده‌اند
+        await adb.create_outbox_job(job_key, 'schedule', {'minute': utc_minute}, user_ids)
+        pending = set(await adb.get_outbox_pending(job_key))
+        user_ids = [user_id for user_id in user_ids if user_id in pending]
+
+        if not delivery_queue.accepting:
+            # ربات در حال توقف است؛ اقلام در انتظار می‌مانند و بعد از ری‌استارت از سر گرفته می‌شوند
+            logger.info(f"ارسال نوبت {time_str} به دلیل توقف ربات به بعد موکول شد")
+            return
+
+        logger.info(f"شروع ارسال برنامه‌ریزی شده برای {len(user_ids)} کاربر در ساعت {time_str}")
+
+        # تنظیمات و آخرین قیمت‌های ارسال شده برای کل این زمان‌بندی (کوئری‌های دسته‌ای)
+        settings_by_user = await adb.get_users_settings(user_ids)
+        last_prices = await adb.get_last_delivered_prices(user_ids)
+        delivered_prices = {}
+        deliveries = {}
+        statuses = {}
+
+        # آماده‌سازی پیام هر کاربر
+        for user_id in user_ids:
+            try:
+                settings = settings_by_user.get(user_id)
+
+                if not settings:
+                    statuses[user_id] = 'skipped'
+                    continue
 
-                    crypto_ids = settings['selected_cryptos']
-                    include_gold = bool(settings['include_gold'])
-                    include_silver = bool(settings['include_silver'])
-                    include_usd = bool(settings['include_usd'])
-                    fiat_currency_ids = settings.get('selected_fiat_currencies', [])
-                    gold_coin_ids = settings.get('selected_gold_coins', [])
-                    gold_item_ids = settings.get('selected_gold_items', [])
+                crypto_ids = settings['selected_cryptos']
+                include_gold = bool(settings['include_gold'])
+                include_silver = bool(settings['include_silver'])
+                include_usd = bool(settings['include_usd'])
+                fiat_currency_ids = settings.get('selected_fiat_currencies', [])
+                gold_coin_ids = settings.get('selected_gold_coins', [])
+                gold_item_ids = settings.get('selected_gold_items', [])
 
-                    # دریافت قیمت‌ها
+                # دریافت قیمت‌ها (فقط سهم محدودی از ظرفیت برای کارهای انبوه)
+                async with fetch_gate.slot(BULK):
                     prices = await price_fetcher.get_all_prices(
                         crypto_ids=crypto_ids,
                         include_gold=include_gold,
@@ -1366,58 +1320,228 @@ class ArzalanBot:
                         gold_item_ids=gold_item_ids
                     )
 
-                    # فرمت کردن پیام
-                    formatted_message, has_error = price_fetcher.format_price_message(prices)
-                    message = "📊 گزارش روزانه شما:\n\n" + formatted_message
-
-                    # ایجاد دکمه‌های inline
-                    if has_error:
-                        keyboard = [
-                            [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')],
-                        ]
-                    else:
-                        keyboard = [
-                            [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')],
-                        ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-
-                    # ارسال پیام
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=message,
-                        reply_markup=reply_markup
+                # فرمت کردن پیام
+                formatted_message, has_error = price_fetcher.format_price_message(prices)
+                message = "📊 گزارش روزانه شما:\n\n" + formatted_message
+
+                # بررسی تغییر قابل توجه نسبت به آخرین گزارش ارسال شده
+                price_vector = price_fetcher.price_vector(prices)
+                options = change_options.get(user_id)
+                is_significant = True
+                if options and not has_error and user_id in last_prices:
+                    max_change = price_fetcher.max_change_percent(last_prices[user_id], price_vector)
+                    is_significant = max_change >= options['threshold']
+
+                if not is_significant:
+                    if options['mode'] == 'skip':
+                        statuses[user_id] = 'skipped'
+                        continue
+                    message = (
+                        "📊 گزارش روزانه شما:\n\n"
+                        f"➡️ از آخرین گزارش، قیمت دارایی‌های شما بیش از {options['threshold']:g}٪ تغییر نکرده است."
                     )
 
-                    # ثبت در تاریخچه
-                    db.log_message(user_id, 'scheduled_notification')
+                reply_markup = scheduled_price_keyboard(has_error)
+
+                # ثبت در صف ارسال (ارسال هم‌زمان با رعایت محدودیت نرخ)
+                future = delivery_queue.submit(user_id, functools.partial(
+                    bot.send_message,
+                    chat_id=user_id,
+                    text=message,
+                    reply_markup=reply_markup
+                ))
+
+                # فقط گزارش کامل مبنای مقایسه بعدی است
+                deliveries[user_id] = (future, price_vector if is_significant and not has_error else None)
+
+            except QueueStopped:
+                # کاربران باقی‌مانده در outbox در انتظار می‌مانند
+                logger.info(f"ارسال نوبت {time_str} با توقف صف ارسال نیمه‌تمام ماند")
+                break
+            except Exception as e:
+                logger.error(f"خطا در آماده‌سازی پیام کاربر {user_id}: {e}")
+                statuses[user_id] = 'failed'
+                continue
+
+        # کاربرانی که پیامی برایشان ارسال نمی‌شود
+        await adb.mark_outbox_items(job_key, statuses)
+
+        # انتظار برای نتیجه ارسال‌ها و ثبت دسته‌ای در outbox
+        results = await self.collect_outbox_results(
+            job_key, {user_id: future for user_id, (future, _) in deliveries.items()}
+        )
+
+        sent_count = 0
+        for user_id, (_, price_vector) in deliveries.items():
+            if isinstance(results.get(user_id), Exception):
+                continue
 
-                    logger.info(f"گزارش برنامه‌ریزی شده برای کاربر {user_id} ارسال شد")
+            sent_count += 1
 
-                    # تاخیر کوچک بین ارسال پیام‌ها
-                    await asyncio.sleep(0.1)
+            # ثبت در تاریخچه
+            await message_log.log(user_id, 'scheduled_notification')
 
-                except Exception as e:
-                    logger.error(f"خطا در ارسال به کاربر {user_id}: {e}")
+            if price_vector is not None:
+                delivered_prices[user_id] = price_vector
+
+        # ذخیره آخرین قیمت‌های ارسال شده (یک تراکنش)
+        await adb.save_last_delivered_prices(delivered_prices)
+        await adb.complete_outbox_job(job_key)
+
+        skipped_count = sum(1 for status in statuses.values() if status == 'skipped')
+        logger.info(f"گزارش برنامه‌ریزی شده ساعت {time_str} برای {sent_count} کاربر ارسال شد")
+
+        if skipped_count:
+            logger.info(f"{skipped_count} گزارش بدون تغییر مهم در ساعت {time_str} ارسال نشد")
+
+    async def collect_outbox_results(self, job_key: str, futures: dict) -> dict:
+        """انتظار برای نتیجه ارسال‌ها و ثبت وضعیت در outbox به صورت دسته‌ای"""
+        results = {}
+        unreachable = []
+        items = list(futures.items())
+
+        for i in range(0, len(items), OUTBOX_BATCH_SIZE):
+            batch = items[i:i + OUTBOX_BATCH_SIZE]
+            batch_results = await asyncio.gather(*(future for _, future in batch), return_exceptions=True)
+
+            statuses = {}
+            for (user_id, _), result in zip(batch, batch_results):
+                results[user_id] = result
+                if isinstance(result, QueueStopped):
+                    # ارسال انجام نشده؛ قلم در انتظار می‌ماند تا resume_outbox آن را بفرستد
                     continue
+                elif isinstance(result, UnreachableChat):
+                    statuses[user_id] = 'unreachable'
+                elif isinstance(result, Exception):
+                    logger.error(f"خطا در ارسال به کاربر {user_id}: {result}")
+                    statuses[user_id] = 'failed'
+                else:
+                    statuses[user_id] = 'done'
+
+            await adb.mark_outbox_items(job_key, statuses)
+            unreachable.extend(user_id for user_id, status in statuses.items() if status == 'unreachable')
+
+        # غیرفعال کردن دسته‌ای کاربرانی که ربات را بلاک کرده‌اند یا حسابشان حذف شده
+        if unreachable:
+            # job هایی که خالی شوند در اجرای بعدی خودشان حذف می‌شوند
+            deactivated = await adb.deactivate_users(unreachable)
+            logger.info(f"{deactivated} کاربر غیرقابل دسترس غیرفعال شدند")
+
+        return results
+
+    async def resume_outbox(self):
+        """از سرگیری ارسال‌های نیمه‌تمام بعد از ری‌استارت"""
+        try:
+            jobs = await adb.get_unfinished_outbox_jobs()
+            if jobs:
+                logger.info(f"از سرگیری {len(jobs)} ارسال نیمه‌تمام")
+
+            for job in jobs:
+                job_key = job['job_key']
+                pending = await adb.get_outbox_pending(job_key)
+
+                if not pending:
+                    await adb.complete_outbox_job(job_key)
+                elif job['job_type'] == 'schedule':
+                    # دقیقه‌های بعدی پنجره پخش همراه با دقیقه اول ثبت شده‌اند؛ تاخیر نسبت به
+                    # زمان خود همان دقیقه سنجیده می‌شود
+                    delay = job['payload'].get('slot', 0) * 60 - job['age_seconds']
+
+                    # گزارش روزانه‌ای که خیلی دیر شده دیگر ارسال نمی‌شود
+                    if -delay > OUTBOX_RESUME_MAX_AGE:
+                        logger.info(f"ارسال {job_key} منقضی شد ({len(pending)} کاربر)")
+                        await adb.complete_outbox_job(job_key, expire_pending=True)
+                        continue
+
+                    utc_minute = job['payload'].get('minute')
+                    if utc_minute is None:
+                        # job های ثبت شده پیش از زمان‌بندی بر اساس دقیقه UTC
+                        await adb.complete_outbox_job(job_key, expire_pending=True)
+                        continue
+
+                    if delay > 0:
+                        # دقیقه پخش هنوز نرسیده؛ ارسال در زمان خودش (send_spread_slot)
+                        self.schedule_spread_slot(job_key, utc_minute, delay)
+                        continue
+
+                    _, change_options = self.bucket_members(await adb.get_bucket_schedules(utc_minute))
+                    await self.deliver_scheduled_bucket(
+                        self.application.bot, job_key, utc_minute, pending, change_options
+                    )
+                elif job['job_type'] == 'broadcast':
+                    await self.deliver_broadcast(self.application.bot, job_key, job['payload'], pending)
+
+            await adb.purge_outbox(OUTBOX_RETENTION_DAYS)
 
         except Exception as e:
-            logger.error(f"خطا در ارسال گزارش برنامه‌ریزی شده: {e}")
+            logger.error(f"خطا در از سرگیری outbox: {e}")
 
-    def load_scheduled_notifications(self):
+    async def load_scheduled_notifications(self):
         """بارگذاری تمام زمان‌بندی‌های ذخیره شده"""
+        if self.leader_lease:
+            # در حالت چند worker زمان‌بندی‌ها بعد از گرفتن leadership بارگذاری می‌شوند
+            self.application.job_queue.run_repeating(
+                self.leadership_job, interval=LEADER_LEASE_TTL / 3, first=0, name='leader_lease'
+            )
+            return
+
         try:
-            # استفاده از asyncio برای فراخوانی reload_all_schedules
-            import asyncio
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(self.reload_all_schedules())
-            loop.close()
+            await self.reload_all_schedules()
 
             logger.info("زمان‌بندی‌ها بارگذاری شدند")
 
         except Exception as e:
             logger.error(f"خطا در بارگذاری زمان‌بندی‌ها: {e}")
 
+    async def backfill_user_assets_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """انتقال یک دسته از انتخاب‌های JSON کاربران به user_assets"""
+        await adb.backfill_user_assets(USER_ASSETS_BACKFILL_BATCH)
+        if await adb.is_backfill_complete('user_assets'):
+            context.job.schedule_removal()
+            logger.info("انتقال انتخاب‌های کاربران به user_assets کامل شد")
+
+    async def history_retention_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """نگهداری پایگاه داده (بایگانی تاریخچه قدیمی و ANALYZE) در یک thread جدا (فقط leader)"""
+        if not self.is_leader:
+            return
+        try:
+            await asyncio.to_thread(history_archiver.run_once)
+        except Exception as e:
+            logger.error(f"خطا در بایگانی تاریخچه پیام‌ها: {e}")
+
+    async def leadership_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """تمدید lease و شروع یا توقف وظایف leader"""
+        was_leader = self.leader_lease.is_leader
+        try:
+            is_leader = await self.leader_lease.renew()
+        except Exception as e:
+            logger.error(f"خطا در تمدید lease: {e}")
+            is_leader = False
+            self.leader_lease.is_leader = False
+
+        if is_leader and not was_leader:
+            logger.info(f"worker {WORKER_ID} leader شد")
+            await self.reload_all_schedules(SCHEDULE_RESYNC_INTERVAL)
+            context.job_queue.run_repeating(
+                self.publish_market_snapshot, interval=MARKET_SNAPSHOT_INTERVAL,
+                first=0, name='market_snapshot'
+            )
+            context.application.create_task(self.resume_outbox())
+        elif was_leader and not is_leader:
+            logger.warning(f"worker {WORKER_ID} leadership را از دست داد")
+            self.scheduler.deactivate()
+            for job in context.job_queue.get_jobs_by_name('market_snapshot'):
+                job.schedule_removal()
+
+    async def publish_market_snapshot(self, context: ContextTypes.DEFAULT_TYPE):
+        """دریافت قیمت تمام اقلام و انتشار آن برای worker های دیگر (فقط leader)"""
+        try:
+            async with fetch_gate.slot(BULK):
+                prices = await price_fetcher.get_market_snapshot()
+            price_fetcher.snapshot.publish(prices)
+        except Exception as e:
+            logger.error(f"خطا در انتشار snapshot بازار: {e}")
+
     # توابع پنل ادمین
 
     async def admin_panel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1444,6 +1568,7 @@ class ArzalanBot:
             [InlineKeyboardButton("🔥 محبوب‌ترین ارزها", callback_data='admin_stats_popular_cryptos')],
             [InlineKeyboardButton("📈 فعالیت کاربران", callback_data='admin_stats_activity')],
             [InlineKeyboardButton("👤 کاربران اخیر", callback_data='admin_recent_users')],
+            [InlineKeyboardButton("🩺 وضعیت سیستم", callback_data='admin_system_status')],
             [InlineKeyboardButton("📢 ارسال پیام همگانی", callback_data='admin_broadcast')],
             [InlineKeyboardButton("🔙 بستن پنل", callback_data='admin_close')]
         ]
@@ -1466,13 +1591,14 @@ class ArzalanBot:
 
         await query.answer()
 
-        # دریافت آمار
-        total_users = db.get_total_users_count()
-        active_users = db.get_active_users_count()
-        new_users_7d = db.get_new_users_count(7)
-        new_users_30d = db.get_new_users_count(30)
-        total_messages = db.get_total_messages_count()
-        active_notifications = db.get_active_notifications_count()
+        # دریافت آمار (از جداول تجمیعی)
+        stats = await adb.get_stats_summary()
+        total_users = stats.get('total_users', 0)
+        active_users = stats.get('active_users', 0)
+        new_users_7d = stats.get('new_users_7d', 0)
+        new_users_30d = stats.get('new_users_30d', 0)
+        total_messages = stats.get('total_messages', 0)
+        active_notifications = stats.get('active_notifications', 0)
 
         message = f"""📊 آمار کلی ربات
 
@@ -1508,13 +1634,15 @@ class ArzalanBot:
 
         await query.answer()
 
-        # دریافت آمار
-        total_users = db.get_total_users_count()
-        active_users = db.get_active_users_count()
+        # دریافت آمار (از جداول تجمیعی)
+        stats = await adb.get_stats_summary()
+        total_users = stats.get('total_users', 0)
+        active_users = stats.get('active_users', 0)
         inactive_users = total_users - active_users
-        new_users_24h = db.get_new_users_count(1)
-        new_users_7d = db.get_new_users_count(7)
-        new_users_30d = db.get_new_users_count(30)
+        unreachable_users = (await adb.get_unreachable_stats()).get('unreachable_users', 0)
+        new_users_24h = stats.get('new_users_1d', 0)
+        new_users_7d = stats.get('new_users_7d', 0)
+        new_users_30d = stats.get('new_users_30d', 0)
 
         message = f"""👥 آمار تفصیلی کاربران
 
@@ -1522,9 +1650,10 @@ class ArzalanBot:
 • کل کاربران: {total_users:,}
 • کاربران فعال: {active_users:,}
 • کاربران غیرفعال: {inactive_users:,}
+• غیرقابل دسترس (بلاک/حذف حساب): {unreachable_users:,}
 
 🆕 کاربران جدید:
-• امروز (24 ساعت): {new_users_24h:,}
+• امروز: {new_users_24h:,}
 • 7 روز اخیر: {new_users_7d:,}
 • 30 روز اخیر: {new_users_30d:,}
 
@@ -1552,9 +1681,10 @@ class ArzalanBot:
 
         await query.answer()
 
-        # دریافت آمار
-        total_messages = db.get_total_messages_count()
-        messages_by_type = db.get_messages_by_type()
+        # دریافت آمار (از جداول تجمیعی)
+        stats = await adb.get_stats_summary()
+        total_messages = stats.get('total_messages', 0)
+        messages_by_type = stats.get('messages_by_type', {})
 
         message = f"""📨 آمار پیام‌ها
 
@@ -1595,7 +1725,7 @@ class ArzalanBot:
         await query.answer()
 
         # دریافت محبوب‌ترین ارزها
-        popular_cryptos = db.get_popular_cryptos(limit=10)
+        popular_cryptos = await adb.get_popular_cryptos(limit=10)
 
         message = """🔥 محبوب‌ترین ارزهای انتخاب شده
 
@@ -1630,8 +1760,8 @@ class ArzalanBot:
 
         await query.answer()
 
-        # دریافت آمار فعالیت
-        activity_stats = db.get_user_activity_stats()
+        # دریافت آمار فعالیت (آخرین فعالیت هر کاربر)
+        activity_stats = await adb.get_stats_summary()
 
         message = f"""📈 آمار فعالیت کاربران
 
@@ -1663,7 +1793,7 @@ class ArzalanBot:
         await query.answer()
 
         # دریافت کاربران اخیر
-        recent_users = db.get_recent_users(limit=10)
+        recent_users = await adb.get_recent_users(limit=10)
 
         message = """👤 کاربران اخیر (10 نفر آخر)
 
@@ -1686,6 +1816,93 @@ class ArzalanBot:
 
         await query.edit_message_text(message, reply_markup=reply_markup)
 
+    async def admin_system_status_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """نمایش وضعیت سیستم (صف‌های ارسال)"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+
+        # چک ادمین بودن
+        if not await self.is_admin(user_id):
+            await query.answer("⛔️ دسترسی غیرمجاز", show_alert=True)
+            return
+
+        await query.answer()
+
+        outbox_stats = await adb.get_outbox_stats()
+        unreachable_stats = await adb.get_unreachable_stats()
+
+        message = f"""🩺 وضعیت سیستم
+
+📮 صف پایدار ارسال (outbox):
+• اقلام در انتظار: {outbox_stats.get('pending', 0):,}
+• قدمت قدیمی‌ترین قلم: {outbox_stats.get('oldest_age_seconds', 0):,} ثانیه
+• ارسال‌های نیمه‌تمام: {outbox_stats.get('unfinished_jobs', 0):,}
+
+🚚 صف ارسال:
+• در حال ارسال: {delivery_queue.pending:,}
+• ارسال موفق: {delivery_queue.stats['sent']:,}
+• ارسال ناموفق: {delivery_queue.stats['failed']:,}
+• محدودیت نرخ (RetryAfter): {delivery_queue.stats['retry_after']:,}
+• تلاش مجدد خطاهای موقت: {delivery_queue.stats['retried']:,}
+
+⚙️ پردازش update ها:
+• در حال اجرا: {update_processor.current_concurrent_updates:,} (سقف هم‌زمان {update_processor.concurrency})
+• کاربران فعال: {update_processor.active_users:,}
+• پردازش شده: {update_processor.stats['processed']:,}
+• رد شده به دلیل شلوغی: {update_processor.stats['rejected']:,}
+
+👥 کش عضویت کانال:
+• کاربران در کش: {len(membership_cache):,} | نرخ برخورد: {membership_cache.hit_rate():.1f}%
+• به‌روزرسانی از تلگرام: {membership_cache.stats['updates']:,} | حذف LRU: {membership_cache.stats['evictions']:,}
+
+🗄 پایگاه داده:
+• فراخوانی‌ها: {adb.stats['calls']:,} در {adb.stats['batches']:,} دسته | بزرگ‌ترین دسته: {adb.stats['max_batch']:,}
+• تاریخچه پیام در انتظار ثبت: {len(message_log):,} | ثبت شده: {message_log.stats['written']:,} در {message_log.stats['batches']:,} دسته | کنار گذاشته: {message_log.stats['dropped']:,}
+• پیش‌نویس انتخاب در انتظار ذخیره: {len(selection_drafts):,} کاربر | کلیک‌ها: {selection_drafts.stats['toggles']:,} | نوشتن: {selection_drafts.stats['writes']:,}
+• کش تنظیمات ({db.settings_cache.mode}): {len(db.settings_cache):,} کاربر | نرخ برخورد: {db.settings_cache.hit_rate():.1f}% | نسخه قدیمی: {db.settings_cache.stats['stale']:,} | حذف LRU: {db.settings_cache.stats['evictions']:,}
+
+{self.webhook_status_text()}{self.cluster_status_text()}⏱ زمان انتظار در صف ارسال:
+{chr(10).join(format_lane_stats(delivery_queue.lane_stats()))}
+
+⏱ زمان انتظار دریافت قیمت ({fetch_gate.in_use}/{fetch_gate.capacity} در حال اجرا):
+{chr(10).join(format_lane_stats(fetch_gate.stats()))}
+
+🚫 ظرفیت آزاد شده (کاربران غیرقابل دسترس):
+• کاربران غیرفعال شده: {unreachable_stats.get('unreachable_users', 0):,}
+• زمان‌بندی‌های متوقف شده: {unreachable_stats.get('disabled_schedules', 0):,}"""
+
+        keyboard = [
+            [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='admin_system_status')],
+            [InlineKeyboardButton("🔙 بازگشت به پنل", callback_data='admin_panel')]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        await query.edit_message_text(message, reply_markup=reply_markup)
+
+    def cluster_status_text(self) -> str:
+        """خلاصه وضعیت worker ها برای صفحه وضعیت سیستم (در حالت تک worker خالی)"""
+        if not self.leader_lease:
+            return ''
+        role = 'leader' if self.is_leader else 'follower'
+        return f"""🧩 worker ها:
+• این worker: {WORKER_ID + 1} از {WORKER_COUNT} ({role})
+• ارسال شده به worker های دیگر: {self.webhook_server.stats['forwarded']:,} | ناموفق: {self.webhook_server.stats['forward_failed']:,}
+
+"""
+
+    def webhook_status_text(self) -> str:
+        """خلاصه وضعیت webhook برای صفحه وضعیت سیستم (در حالت polling خالی)"""
+        if not self.webhook_server:
+            return ''
+        ack = self.webhook_server.ack_latency.summary()
+        handler = self.webhook_server.handler_latency.summary()
+        return f"""🌐 webhook:
+• دریافت شده: {self.webhook_server.stats['received']:,} | نامعتبر: {self.webhook_server.stats['invalid']:,} | غیرمجاز: {self.webhook_server.stats['unauthorized']:,}
+• زمان پاسخ: p50 {ack['p50_ms']:.0f}ms | p95 {ack['p95_ms']:.0f}ms
+• زمان کامل پردازش: p50 {handler['p50_ms']:.0f}ms | p95 {handler['p95_ms']:.0f}ms
+
+"""
+
     async def admin_panel_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """بازگشت به پنل ادمین"""
         query = update.callback_query
@@ -1718,7 +1935,7 @@ class ArzalanBot:
         await query.answer()
 
         # دریافت تعداد کاربران فعال
-        active_users_count = db.get_active_users_count()
+        active_users_count = await adb.get_active_users_count()
 
         message = f"""📢 ارسال پیام همگانی
 
@@ -1758,7 +1975,7 @@ class ArzalanBot:
         context.user_data['waiting_for_broadcast'] = False
 
         # نمایش پیش‌نمایش و درخواست تایید
-        active_users_count = db.get_active_users_count()
+        active_users_count = await adb.get_active_users_count()
 
         preview_message = f"""✅ پیام دریافت شد!
 
@@ -1798,68 +2015,15 @@ class ArzalanBot:
         await query.edit_message_text("⏳ در حال ارسال پیام به کاربران...")
 
         # دریافت لیست کاربران فعال
-        try:
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT user_id FROM users WHERE is_active = 1')
-            users = [row['user_id'] for row in cursor.fetchall()]
-            conn.close()
-        except Exception as e:
-            logger.error(f"خطا در دریافت کاربران: {e}")
-            await query.edit_message_text("❌ خطا در دریافت لیست کاربران")
-            return
+        users = await adb.get_active_user_ids()
 
-        # ارسال پیام به کاربران
-        success_count = 0
-        failed_count = 0
+        # ثبت در outbox و ارسال از طریق صف ارسال
+        job_key = f'broadcast:{broadcast_message.chat_id}:{broadcast_message.message_id}'
+        payload = self.broadcast_payload(broadcast_message)
+        await adb.create_outbox_job(job_key, 'broadcast', payload, users)
+        pending = await adb.get_outbox_pending(job_key)
 
-        for target_user_id in users:
-            try:
-                # ارسال پیام بر اساس نوع
-                if broadcast_message.text:
-                    await context.bot.send_message(
-                        chat_id=target_user_id,
-                        text=broadcast_message.text
-                    )
-                elif broadcast_message.photo:
-                    await context.bot.send_photo(
-                        chat_id=target_user_id,
-                        photo=broadcast_message.photo[-1].file_id,
-                        caption=broadcast_message.caption
-                    )
-                elif broadcast_message.video:
-                    await context.bot.send_video(
-                        chat_id=target_user_id,
-                        video=broadcast_message.video.file_id,
-                        caption=broadcast_message.caption
-                    )
-                elif broadcast_message.document:
-                    await context.bot.send_document(
-                        chat_id=target_user_id,
-                        document=broadcast_message.document.file_id,
-                        caption=broadcast_message.caption
-                    )
-                elif broadcast_message.audio:
-                    await context.bot.send_audio(
-                        chat_id=target_user_id,
-                        audio=broadcast_message.audio.file_id,
-                        caption=broadcast_message.caption
-                    )
-                elif broadcast_message.voice:
-                    await context.bot.send_voice(
-                        chat_id=target_user_id,
-                        voice=broadcast_message.voice.file_id,
-                        caption=broadcast_message.caption
-                    )
-
-                success_count += 1
-
-                # تاخیر کوچک برای جلوگیری از rate limit
-                await asyncio.sleep(0.05)
-
-            except Exception as e:
-                logger.error(f"خطا در ارسال به {target_user_id}: {e}")
-                failed_count += 1
+        success_count, failed_count = await self.deliver_broadcast(context.bot, job_key, payload, pending)
 
         # نمایش نتیجه
         result_message = f"""✅ ارسال پیام همگانی تکمیل شد
@@ -1879,6 +2043,61 @@ class ArzalanBot:
         # پاک کردن پیام از context
         context.user_data.pop('broadcast_message', None)
 
+    def broadcast_payload(self, broadcast_message) -> dict:
+        """استخراج محتوای قابل ذخیره پیام همگانی (برای از سرگیری بعد از ری‌استارت)"""
+        if broadcast_message.text:
+            return {'kind': 'text', 'text': broadcast_message.text}
+        elif broadcast_message.photo:
+            return {'kind': 'photo', 'file_id': broadcast_message.photo[-1].file_id,
+                    'caption': broadcast_message.caption}
+        elif broadcast_message.video:
+            return {'kind': 'video', 'file_id': broadcast_message.video.file_id,
+                    'caption': broadcast_message.caption}
+        elif broadcast_message.document:
+            return {'kind': 'document', 'file_id': broadcast_message.document.file_id,
+                    'caption': broadcast_message.caption}
+        elif broadcast_message.audio:
+            return {'kind': 'audio', 'file_id': broadcast_message.audio.file_id,
+                    'caption': broadcast_message.caption}
+        elif broadcast_message.voice:
+            return {'kind': 'voice', 'file_id': broadcast_message.voice.file_id,
+                    'caption': broadcast_message.caption}
+        return {}
+
+    async def send_broadcast_payload(self, bot, chat_id: int, payload: dict):
+        """ارسال پیام همگانی به یک کاربر بر اساس نوع پیام"""
+        kind = payload.get('kind')
+        if kind == 'text':
+            return await bot.send_message(chat_id=chat_id, text=payload['text'])
+        elif kind == 'photo':
+            return await bot.send_photo(chat_id=chat_id, photo=payload['file_id'], caption=payload['caption'])
+        elif kind == 'video':
+            return await bot.send_video(chat_id=chat_id, video=payload['file_id'], caption=payload['caption'])
+        elif kind == 'document':
+            return await bot.send_document(chat_id=chat_id, document=payload['file_id'], caption=payload['caption'])
+        elif kind == 'audio':
+            return await bot.send_audio(chat_id=chat_id, audio=payload['file_id'], caption=payload['caption'])
+        elif kind == 'voice':
+            return await bot.send_voice(chat_id=chat_id, voice=payload['file_id'], caption=payload['caption'])
+
+    async def deliver_broadcast(self, bot, job_key: str, payload: dict, user_ids: List[int]):
+        """ارسال پیام همگانی به کاربران در انتظار یک job و ثبت نتیجه در outbox"""
+        futures = {}
+        for target_user_id in user_ids:
+            try:
+                futures[target_user_id] = delivery_queue.submit(
+                    target_user_id,
+                    functools.partial(self.send_broadcast_payload, bot, target_user_id, payload)
+                )
+            except QueueStopped:
+                # کاربران باقی‌مانده در outbox در انتظار می‌مانند
+                break
+        results = await self.collect_outbox_results(job_key, futures)
+        await adb.complete_outbox_job(job_key)
+
+        failed_count = sum(1 for result in results.values() if isinstance(result, Exception))
+        return len(results) - failed_count, failed_count
+
     async def admin_broadcast_cancel_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """لغو ارسال پیام همگانی"""
         query = update.callback_query
@@ -1893,142 +2112,103 @@ class ArzalanBot:
         # بازگشت به پنل ادمین
         await self.show_admin_panel(update, context)
 
+    async def start_webhook(self):
+        """راه‌اندازی سرور webhook داخلی و ثبت آدرس آن در تلگرام"""
+        self.webhook_server = WebhookServer(self.application.bot, self.application.update_queue)
+        update_processor.on_processed = self.webhook_server.mark_processed
+        await self.webhook_server.start()
+
+        if WORKER_ID != 0:
+            # آدرس webhook فقط توسط worker اول ثبت می‌شود
+            return
+
+        await self.application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info(f"webhook روی {WEBHOOK_URL} ثبت شد")
+
     async def run(self):
         """اجرای ربات"""
+        if WORKER_COUNT > 1 and BOT_MODE != 'webhook':
+            logger.error("اجرای چند worker فقط در حالت webhook پشتیبانی می‌شود (BOT_MODE=webhook)")
+            return
+
         # ساخت Application
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # پردازش هم‌زمان update ها (update های هر کاربر به ترتیب اجرا می‌شوند)
+        self.application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(update_processor)
+            .build()
+        )
+        self.scheduler.attach(self.application.job_queue)
 
         # Handler ها
+        # قبل از بقیه handler ها: ذخیره پیش‌نویس انتخاب دارایی‌ها وقتی کاربر از منو خارج می‌شود
+        self.application.add_handler(TypeHandler(Update, self.save_selection_drafts), group=-1)
+
         self.application.add_handler(CommandHandler('start', self.start_command))
         self.application.add_handler(CommandHandler('help', self.help_command))
         self.application.add_handler(CommandHandler('settings', self.settings_command))
         self.application.add_handler(CommandHandler('admin', self.admin_panel_command))
 
-        # Callback handlers
-        self.application.add_handler(CallbackQueryHandler(
-            self.check_membership_callback, pattern='^check_membership$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.refresh_prices_callback, pattern='^refresh_prices$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.select_assets_main_callback, pattern='^select_assets_main$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_crypto_callback, pattern='^asset_type_crypto$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.crypto_top5_callback, pattern='^crypto_top5$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.crypto_top10_callback, pattern='^crypto_top10$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.crypto_manual_callback, pattern='^crypto_manual$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_crypto_callback, pattern='^toggle_crypto_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_gold_silver_callback, pattern='^asset_type_gold_silver$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_usd_callback, pattern='^asset_type_usd$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_fiat_callback, pattern='^asset_type_fiat$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_gold_coins_callback, pattern='^asset_type_gold_coins$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_gold_items_callback, pattern='^asset_type_gold_items$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.asset_type_stock_callback, pattern='^asset_type_stock$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_asset_callback, pattern='^toggle_asset_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_fiat_callback, pattern='^toggle_fiat_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_coin_callback, pattern='^toggle_coin_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_gold_item_callback, pattern='^toggle_gold_item_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.setup_schedule_callback, pattern='^setup_schedule$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.add_schedule_time_callback, pattern='^add_schedule_time$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.manage_schedules_callback, pattern='^manage_schedules$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_schedule_callback, pattern='^toggle_schedule_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.toggle_status_callback, pattern='^toggle_status_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.delete_schedule_callback, pattern='^delete_schedule_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.set_time_callback, pattern='^set_time_'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.remove_assets_callback, pattern='^remove_assets$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.disable_notification_callback, pattern='^disable_notification$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.settings_command, pattern='^open_settings$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.back_to_main_callback, pattern='^back_to_main$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.send_prices_now_callback, pattern='^send_prices_now$'
-        ))
+        # Callback handlers (یک handler با جستجوی dict و trie به جای بررسی ترتیبی regex ها)
+        router = CallbackRouter()
+        router.add('check_membership', self.check_membership_callback)
+        router.add('refresh_prices', self.refresh_prices_callback)
+        router.add('select_assets_main', self.select_assets_main_callback)
+        router.add('asset_type_crypto', self.asset_type_crypto_callback)
+        router.add('crypto_top5', self.crypto_top5_callback)
+        router.add('crypto_top10', self.crypto_top10_callback)
+        router.add('crypto_manual', self.crypto_manual_callback)
+        router.add_prefix('toggle_crypto_', self.toggle_crypto_callback)
+        router.add('asset_type_gold_silver', self.asset_type_gold_silver_callback)
+        router.add('asset_type_usd', self.asset_type_usd_callback)
+        router.add('asset_type_fiat', self.asset_type_fiat_callback)
+        router.add('asset_type_gold_coins', self.asset_type_gold_coins_callback)
+        router.add('asset_type_gold_items', self.asset_type_gold_items_callback)
+        router.add('asset_type_stock', self.asset_type_stock_callback)
+        router.add_prefix('toggle_asset_', self.toggle_asset_callback)
+        router.add_prefix('toggle_fiat_', self.toggle_fiat_callback)
+        router.add_prefix('toggle_coin_', self.toggle_coin_callback)
+        router.add_prefix('toggle_gold_item_', self.toggle_gold_item_callback)
+        router.add('setup_schedule', self.setup_schedule_callback)
+        router.add('add_schedule_time', self.add_schedule_time_callback)
+        router.add('manage_schedules', self.manage_schedules_callback)
+        router.add_prefix('toggle_schedule_', self.toggle_schedule_callback)
+        router.add_prefix('toggle_status_', self.toggle_status_callback)
+        router.add_prefix('schedule_mode_', self.schedule_mode_callback)
+        router.add_prefix('delete_schedule_', self.delete_schedule_callback)
+        router.add_prefix('set_time_', self.set_time_callback)
+        router.add('timezone_menu', self.timezone_menu_callback)
+        router.add_prefix('set_tz_', self.set_timezone_callback)
+        router.add('remove_assets', self.remove_assets_callback)
+        router.add('disable_notification', self.disable_notification_callback)
+        router.add('open_settings', self.settings_command)
+        router.add('back_to_main', self.back_to_main_callback)
+        router.add('send_prices_now', self.send_prices_now_callback)
 
         # Callback handlers برای پنل ادمین
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_panel_callback, pattern='^admin_panel$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_stats_general_callback, pattern='^admin_stats_general$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_stats_users_callback, pattern='^admin_stats_users$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_stats_messages_callback, pattern='^admin_stats_messages$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_stats_popular_cryptos_callback, pattern='^admin_stats_popular_cryptos$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_stats_activity_callback, pattern='^admin_stats_activity$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_recent_users_callback, pattern='^admin_recent_users$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_broadcast_callback, pattern='^admin_broadcast$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_broadcast_confirm_callback, pattern='^admin_broadcast_confirm$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_broadcast_cancel_callback, pattern='^admin_broadcast_cancel$'
-        ))
-        self.application.add_handler(CallbackQueryHandler(
-            self.admin_close_callback, pattern='^admin_close$'
+        router.add('admin_panel', self.admin_panel_callback)
+        router.add('admin_stats_general', self.admin_stats_general_callback)
+        router.add('admin_stats_users', self.admin_stats_users_callback)
+        router.add('admin_stats_messages', self.admin_stats_messages_callback)
+        router.add('admin_stats_popular_cryptos', self.admin_stats_popular_cryptos_callback)
+        router.add('admin_stats_activity', self.admin_stats_activity_callback)
+        router.add('admin_recent_users', self.admin_recent_users_callback)
+        router.add('admin_system_status', self.admin_system_status_callback)
+        router.add('admin_broadcast', self.admin_broadcast_callback)
+        router.add('admin_broadcast_confirm', self.admin_broadcast_confirm_callback)
+        router.add('admin_broadcast_cancel', self.admin_broadcast_cancel_callback)
+        router.add('admin_close', self.admin_close_callback)
+        self.application.add_handler(router)
+
+        # به‌روزرسانی کش عضویت (ربات باید ادمین کانال باشد تا این update ها را دریافت کند)
+        self.application.add_handler(ChatMemberHandler(
+            self.channel_member_update, ChatMemberHandler.CHAT_MEMBER
         ))
 
         # Handler برای دکمه‌های keyboard
@@ -2043,8 +2223,24 @@ class ArzalanBot:
             self.receive_broadcast_message
         ))
 
+        # هشدار برای کوئری‌های پرتکراری که بدون ایندکس کل جدول را می‌خوانند
+        for name, scans in (await adb.check_query_plans()).items():
+            logger.warning(f"اسکن کامل جدول در کوئری {name}: {', '.join(scans)}")
+
+        # انتقال تدریجی انتخاب‌های کاربران به user_assets (بدون توقف ربات)
+        if not await adb.is_backfill_complete('user_assets'):
+            self.application.job_queue.run_repeating(
+                self.backfill_user_assets_job, interval=USER_ASSETS_BACKFILL_INTERVAL, first=1,
+                name='user_assets_backfill'
+            )
+
+        # نگهداری دوره‌ای: بایگانی تاریخچه قدیمی پیام‌ها (اگر HISTORY_RETENTION_DAYS > 0) و به‌روزرسانی آمار پایگاه داده
+        self.application.job_queue.run_repeating(
+            self.history_retention_job, interval=HISTORY_RETENTION_INTERVAL, first=60, name='history_retention'
+        )
+
         # بارگذاری زمان‌بندی‌های ذخیره شده
-        self.load_scheduled_notifications()
+        await self.load_scheduled_notifications()
 
         # اجرای ربات
         logger.info("ربات دستیار ارزَلان در حال اجرا است...")
@@ -2052,18 +2248,47 @@ class ArzalanBot:
         # Initialize and start the application
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await delivery_queue.start()
+        await message_log.start()
+
+        if BOT_MODE == 'webhook':
+            await self.start_webhook()
+        else:
+            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+        # از سرگیری ارسال‌های نیمه‌تمام قبل از ری‌استارت (در حالت چند worker توسط leader)
+        if not self.leader_lease:
+            self.application.create_task(self.resume_outbox())
+
+        # اجرا تا دریافت SIGTERM (cluster.py، systemd) یا SIGINT (Ctrl+C)؛ بدون handler
+        # پردازه با رفتار پیش‌فرض SIGTERM بسته می‌شود و بخش finally اجرا نمی‌شود
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop_event.set)
 
-        # Keep the bot running
         try:
-            # Wait until the application is stopped
-            await asyncio.Event().wait()
-        except (KeyboardInterrupt, SystemExit):
+            await stop_event.wait()
             logger.info("توقف ربات...")
         finally:
-            await self.application.updater.stop()
+            # ابتدا پذیرش ارسال جدید متوقف می‌شود تا نوبت‌های در حال اجرا اقلام باقی‌مانده
+            # را در outbox در انتظار بگذارند (نه ناموفق)
+            delivery_queue.close()
+            if self.webhook_server:
+                await self.webhook_server.stop()
+            if self.application.updater.running:
+                await self.application.updater.stop()
+            # انتظار محدود (DELIVERY_DRAIN_TIMEOUT) برای پیام‌های داخل صف
+            await delivery_queue.stop()
             await self.application.stop()
             await self.application.shutdown()
+            if self.leader_lease:
+                # worker دیگری بدون انتظار برای پایان TTL leader می‌شود
+                await self.leader_lease.release()
+            await selection_drafts.stop()
+            await message_log.stop()
+            await adb.stop()
+            db.close()
 
 
 async def main():
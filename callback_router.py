@@ -0,0 +1,86 @@
+"""
+مسیریابی callback_data دکمه‌های inline با یک handler واحد
+
+به جای بررسی ترتیبی ده‌ها CallbackQueryHandler با regex برای هر کلیک:
+- مقادیر ثابت (مثل admin_panel) با یک جستجوی dict پیدا می‌شوند
+- مقادیر پارامتردار (مثل toggle_crypto_bitcoin) با طولانی‌ترین پیشوند
+  ثبت شده در یک trie پیدا می‌شوند
+
+هزینه هر مسیریابی O(طول callback_data) است و به تعداد مسیرها بستگی ندارد.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+Callback = Callable[..., Awaitable[Any]]
+
+# کلید نگهداری callback در گره‌های trie (هیچ کاراکتری None نیست)
+_HANDLER = None
+
+
+class CallbackRouter(BaseHandler):
+    """handler واحد برای تمام callback query ها"""
+
+    def __init__(self, block: bool = True):
+        super().__init__(self._dispatch, block=block)
+        self._exact: Dict[str, Callback] = {}
+        self._trie: Dict = {}
+        self._prefix_count = 0
+        self.stats = {'dispatched': 0, 'unmatched': 0}
+
+    async def _dispatch(self, update: Update, context):
+        """اجرای مسیر callback_data (handle_update مسیر پیدا شده در check_update را مستقیم اجرا می‌کند)"""
+        callback = self.resolve(update.callback_query.data)
+        if callback is not None:
+            return await callback(update, context)
+
+    def add(self, data: str, callback: Callback):
+        """ثبت مسیر برای مقدار دقیق callback_data"""
+        if data in self._exact:
+            raise ValueError(f"مسیر تکراری: {data}")
+        self._exact[data] = callback
+
+    def add_prefix(self, prefix: str, callback: Callback):
+        """ثبت مسیر برای تمام callback_data هایی که با prefix شروع می‌شوند"""
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _HANDLER in node:
+            raise ValueError(f"پیشوند تکراری: {prefix}")
+        node[_HANDLER] = callback
+        self._prefix_count += 1
+
+    def resolve(self, data: str) -> Optional[Callback]:
+        """پیدا کردن callback مسیر (مقدار دقیق، سپس طولانی‌ترین پیشوند)"""
+        callback = self._exact.get(data)
+        if callback is not None:
+            return callback
+
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            callback = node.get(_HANDLER, callback)
+        return callback
+
+    def check_update(self, update: object) -> Optional[Callback]:
+        if not (isinstance(update, Update) and update.callback_query):
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+
+        callback = self.resolve(data)
+        if callback is None:
+            self.stats['unmatched'] += 1
+        return callback
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        self.stats['dispatched'] += 1
+        return await check_result(update, context)
+
+    def __len__(self) -> int:
+        return len(self._exact) + self._prefix_count
@@ -0,0 +1,96 @@
+"""
+اجرای چند worker با تقسیم کاربران و یک leader برای زمان‌بندی
+
+- update های هر کاربر بر اساس hash شناسه کاربر فقط در یک worker پردازش می‌شوند
+- فقط worker ی که lease ی leader را در SQLite دارد job های زمان‌بندی،
+  ارسال‌های outbox و به‌روزرسانی snapshot بازار را اجرا می‌کند
+- snapshot بازار در حافظه مشترک (market_snapshot.py) نوشته می‌شود تا
+  worker ها هر کدام جداگانه از APIها قیمت نگیرند
+
+نحوه اجرا (در حالت webhook):
+    WORKER_COUNT=4 python cluster.py
+"""
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import zlib
+
+from config import WORKER_COUNT, WORKER_ID, WORKER_INTERNAL_PORT, LEADER_LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE_NAME = 'scheduler'
+
+
+def shard_for(user_id: int, worker_count: int = WORKER_COUNT) -> int:
+    """worker مسئول یک کاربر"""
+    if worker_count <= 1:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % worker_count
+
+
+def internal_url(worker_id: int, path: str) -> str:
+    """آدرس داخلی webhook یک worker برای ارسال update های متعلق به آن"""
+    return f'http://127.0.0.1:{WORKER_INTERNAL_PORT + worker_id}{path}'
+
+
+class LeaderLease:
+    """انتخاب leader بر اساس یک ردیف lease در SQLite"""
+
+    def __init__(self, database, name: str = LEADER_LEASE_NAME, ttl: float = LEADER_LEASE_TTL):
+        """
+        Args:
+            database: AsyncDatabase
+        """
+        self.db = database
+        self.name = name
+        self.ttl = ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{WORKER_ID}'
+        self.is_leader = False
+
+    async def renew(self) -> bool:
+        """گرفتن یا تمدید lease (باید هر ttl/3 ثانیه فراخوانی شود)"""
+        self.is_leader = await self.db.acquire_lease(self.name, self.owner, self.ttl)
+        return self.is_leader
+
+    async def release(self):
+        if self.is_leader:
+            await self.db.release_lease(self.name, self.owner)
+            self.is_leader = False
+
+
+def main():
+    """اجرای WORKER_COUNT پردازه bot.py با WORKER_ID متفاوت"""
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+    workers = []
+    for worker_id in range(WORKER_COUNT):
+        env = dict(os.environ, WORKER_ID=str(worker_id), WORKER_COUNT=str(WORKER_COUNT))
+        workers.append(subprocess.Popen([sys.executable, bot_path], env=env))
+        logger.info(f"worker {worker_id} اجرا شد (pid {workers[-1].pid})")
+
+    def stop(signum, frame):
+        for process in workers:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    def wait_for_workers(signum, frame):
+        # Ctrl+C به کل گروه پردازه می‌رسد و worker ها خودشان متوقف می‌شوند؛
+        # ارسال SIGTERM دوباره توقف مرتب آن‌ها را نیمه‌کاره می‌گذاشت
+        pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, wait_for_workers)
+
+    exit_code = 0
+    for process in workers:
+        exit_code = process.wait() or exit_code
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,25 @@ CHANNEL_ID = os.getenv('CHANNEL_ID', '@your_channel_id')  # آیدی کانال
 
 # تنظیمات پایگاه داده
 DATABASE_PATH = 'bot_database.db'
+DATABASE_BUSY_TIMEOUT = float(os.getenv('DATABASE_BUSY_TIMEOUT', '5'))  # انتظار برای قفل نوشتن (ثانیه)
+DATABASE_CACHE_SIZE_KB = int(os.getenv('DATABASE_CACHE_SIZE_KB', '16384'))  # حافظه کش صفحات هر اتصال
+DATABASE_MMAP_SIZE = int(os.getenv('DATABASE_MMAP_SIZE', str(128 * 1024 * 1024)))  # بایت
+DATABASE_STATEMENT_CACHE = int(os.getenv('DATABASE_STATEMENT_CACHE', '256'))  # تعداد دستورهای آماده نگهداری شده
+
+# ثبت گروهی تاریخچه پیام‌ها
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv('MESSAGE_LOG_BATCH_SIZE', '500'))  # ثبت بعد از این تعداد ردیف
+MESSAGE_LOG_FLUSH_INTERVAL = float(os.getenv('MESSAGE_LOG_FLUSH_INTERVAL', '1.0'))  # یا بعد از این مدت (ثانیه)
+MESSAGE_LOG_MAX_PENDING = int(os.getenv('MESSAGE_LOG_MAX_PENDING', '50000'))  # حداکثر ردیف‌های در انتظار ثبت
+
+# انتقال تدریجی انتخاب‌های JSON کاربران به جدول user_assets
+USER_ASSETS_BACKFILL_BATCH = int(os.getenv('USER_ASSETS_BACKFILL_BATCH', '500'))  # کاربر در هر دسته
+USER_ASSETS_BACKFILL_INTERVAL = float(os.getenv('USER_ASSETS_BACKFILL_INTERVAL', '1'))  # فاصله دسته‌ها (ثانیه)
+
+# نگهداری تاریخچه پیام‌ها: ردیف‌های قدیمی‌تر در فایل‌های ماهانه CSV فشرده بایگانی و حذف می‌شوند
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))  # 0 = بدون حذف
+HISTORY_ARCHIVE_DIR = os.getenv('HISTORY_ARCHIVE_DIR', 'archive')
+HISTORY_ARCHIVE_BATCH = int(os.getenv('HISTORY_ARCHIVE_BATCH', '5000'))  # ردیف در هر تراکنش حذف
+HISTORY_RETENTION_INTERVAL = int(os.getenv('HISTORY_RETENTION_INTERVAL', '3600'))  # فاصله اجرای بایگانی (ثانیه)
 
 # API endpoints
 COINGECKO_API = 'https://api.coingecko.com/api/v3'
@@ -125,6 +144,19 @@ DEFAULT_GOLD_ITEMS = ['gol18']
 DEFAULT_NOTIFICATION_TIME = '09:00'
 TIMEZONE = 'Asia/Tehran'
 
+# منطقه‌های زمانی قابل انتخاب برای کاربران (نام pytz: نام نمایشی)
+TIMEZONE_CHOICES = {
+    'Asia/Tehran': '🇮🇷 تهران',
+    'Asia/Dubai': '🇦🇪 دبی',
+    'Europe/Istanbul': '🇹🇷 استانبول',
+    'Europe/London': '🇬🇧 لندن',
+    'Europe/Berlin': '🇩🇪 برلین / پاریس',
+    'Europe/Stockholm': '🇸🇪 استکهلم',
+    'America/Toronto': '🇨🇦 تورنتو / نیویورک',
+    'America/Vancouver': '🇨🇦 ونکوور / لس‌آنجلس',
+    'Australia/Sydney': '🇦🇺 سیدنی',
+}
+
 # ساعت‌های پیش‌فرض برای زمان‌بندی
 PRESET_TIMES = [
     '08:00',
@@ -134,3 +166,78 @@ PRESET_TIMES = [
     '18:00',
     '21:00'
 ]
+
+# ترتیب ثابت دارایی‌ها برای آرایه‌های قیمت (هر دارایی یک خانه ثابت دارد)
+ASSET_SLOTS = (
+    ['usd_irr', 'gold', 'silver']
+    + [f'crypto:{crypto_id}' for crypto_id in CRYPTO_SYMBOLS]
+    + [f'crypto_irt:{crypto_id}' for crypto_id in CRYPTO_SYMBOLS]
+    + [f'fiat:{fiat_id}' for fiat_id in FIAT_CURRENCIES]
+    + [f'coin:{coin_id}' for coin_id in GOLD_COINS]
+    + [f'gold_item:{item_id}' for item_id in GOLD_ITEMS]
+)
+
+# حالت‌های ارسال گزارش زمان‌بندی شده
+# always: همیشه ارسال کامل | skip: عدم ارسال بدون تغییر مهم | brief: پیام کوتاه بدون تغییر مهم
+SCHEDULE_CHANGE_MODES = ['always', 'skip', 'brief']
+
+# حداقل درصد تغییر قیمت برای ارسال گزارش کامل (حالت‌های skip و brief)
+SIGNIFICANT_CHANGE_THRESHOLD = float(os.getenv('SIGNIFICANT_CHANGE_THRESHOLD', '1.0'))
+
+# تنظیمات صف ارسال پیام‌ها
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '16'))  # تعداد worker های هم‌زمان
+DELIVERY_RATE_LIMIT = float(os.getenv('DELIVERY_RATE_LIMIT', '28'))  # پیام در ثانیه (سقف تلگرام حدود 30)
+DELIVERY_CHAT_INTERVAL = float(os.getenv('DELIVERY_CHAT_INTERVAL', '1.0'))  # فاصله حداقل دو پیام به یک چت (ثانیه)
+DELIVERY_MAX_RETRIES = int(os.getenv('DELIVERY_MAX_RETRIES', '3'))  # تعداد تلاش مجدد بعد از RetryAfter
+DELIVERY_DRAIN_TIMEOUT = float(os.getenv('DELIVERY_DRAIN_TIMEOUT', '10'))  # حداکثر انتظار برای خالی شدن صف هنگام توقف (ثانیه)
+
+# تنظیمات صف پایدار ارسال (outbox)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))  # تعداد اقلام در هر commit وضعیت
+OUTBOX_RESUME_MAX_AGE = int(os.getenv('OUTBOX_RESUME_MAX_AGE', '3600'))  # حداکثر تاخیر از سرگیری گزارش روزانه (ثانیه)
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))  # نگهداری job های تکمیل شده
+
+# پخش کاربران یک زمان‌بندی پرطرفدار در چند دقیقه متوالی (بر اساس hash شناسه کاربر)
+SCHEDULE_SPREAD_MINUTES = int(os.getenv('SCHEDULE_SPREAD_MINUTES', '1'))  # پنجره پایه (1 = بدون پخش)
+SCHEDULE_SPREAD_MAX_MINUTES = int(os.getenv('SCHEDULE_SPREAD_MAX_MINUTES', '10'))  # سقف پنجره با گسترش خودکار
+SCHEDULE_DELIVERY_SLO = int(os.getenv('SCHEDULE_DELIVERY_SLO', '60'))  # حداکثر زمان ارسال هر دقیقه از پنجره (ثانیه)
+
+# اولویت درخواست‌های تعاملی نسبت به ارسال‌های انبوه
+PRIORITY_FETCH_CONCURRENCY = int(os.getenv('PRIORITY_FETCH_CONCURRENCY', '8'))  # دریافت قیمت هم‌زمان
+PRIORITY_BULK_SHARE = float(os.getenv('PRIORITY_BULK_SHARE', '0.5'))  # سهم کارهای انبوه از ظرفیت
+
+# پردازش هم‌زمان update ها
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))  # update های در حال اجرا به صورت هم‌زمان
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '512'))  # سقف update های پذیرفته شده (اجرا + انتظار)
+UPDATE_OVERLOAD_TIMEOUT = float(os.getenv('UPDATE_OVERLOAD_TIMEOUT', '15'))  # حداکثر انتظار قبل از رد update (ثانیه)
+
+# حالت دریافت update ها: polling (پیش‌فرض) یا webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # آدرس عمومی (مثال: https://bot.example.com)
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # توکن مخفی برای بررسی درخواست‌های تلگرام
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# اجرای چند worker (cluster.py) - فقط در حالت webhook
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+WORKER_ID = int(os.getenv('WORKER_ID', '0'))
+WORKER_INTERNAL_PORT = int(os.getenv('WORKER_INTERNAL_PORT', '9100'))  # پورت داخلی worker اول (بقیه +1، +2، ...)
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', '30'))  # مدت اعتبار lease ی leader (ثانیه)
+SCHEDULE_RESYNC_INTERVAL = int(os.getenv('SCHEDULE_RESYNC_INTERVAL', '60'))  # هماهنگ‌سازی زمان‌بندی‌ها توسط leader (ثانیه)
+MARKET_SNAPSHOT_PATH = os.getenv('MARKET_SNAPSHOT_PATH', 'market_snapshot.bin')
+MARKET_SNAPSHOT_INTERVAL = int(os.getenv('MARKET_SNAPSHOT_INTERVAL', '60'))  # فاصله به‌روزرسانی snapshot (ثانیه)
+MARKET_SNAPSHOT_MAX_AGE = float(os.getenv('MARKET_SNAPSHOT_MAX_AGE', '180'))  # حداکثر قدمت snapshot قابل استفاده
+
+# کش بررسی عضویت در کانال
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', '600'))  # اعتبار نتیجه «عضو است» (ثانیه)
+MEMBERSHIP_CACHE_NEGATIVE_TTL = float(os.getenv('MEMBERSHIP_CACHE_NEGATIVE_TTL', '30'))  # اعتبار نتیجه «عضو نیست» (ثانیه)
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', '50000'))  # حداکثر کاربران در کش
+
+# کش تنظیمات کاربران (write-through)
+SETTINGS_CACHE_SIZE = int(os.getenv('SETTINGS_CACHE_SIZE', '20000'))  # حداکثر کاربران در کش (0 = غیرفعال)
+# local: یک پردازه | version: بررسی settings_version در هر برخورد (چند worker یا اسکریپت‌های جانبی)
+SETTINGS_CACHE_MODE = os.getenv('SETTINGS_CACHE_MODE', 'version' if WORKER_COUNT > 1 else 'local')
+
+# پیش‌نویس انتخاب دارایی‌ها در منوهای چند انتخابی
+SELECTION_DRAFT_IDLE_TIMEOUT = float(os.getenv('SELECTION_DRAFT_IDLE_TIMEOUT', '30'))  # ذخیره خودکار بعد از این مدت بدون کلیک (ثانیه)
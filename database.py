@@ -3,12 +3,343 @@
 """
 import sqlite3
 import json
+import functools
+import threading
+import time
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 from config import (
     DATABASE_PATH, DEFAULT_CRYPTOS, DEFAULT_NOTIFICATION_TIME,
-    DEFAULT_FIAT_CURRENCIES, DEFAULT_COINS, DEFAULT_GOLD_ITEMS
+    DEFAULT_FIAT_CURRENCIES, DEFAULT_COINS, DEFAULT_GOLD_ITEMS, TIMEZONE,
+    DATABASE_BUSY_TIMEOUT, DATABASE_CACHE_SIZE_KB, DATABASE_MMAP_SIZE, DATABASE_STATEMENT_CACHE
 )
+from settings_cache import SettingsCache, copy_settings
+
+# مهاجرت‌های نسخه‌دار (شماره نسخه در PRAGMA user_version)؛ هر مهاجرت فقط یک بار
+# و در یک تراکنش اجرا می‌شود. مهاجرت جدید را همیشه به انتهای لیست اضافه کنید.
+MIGRATIONS = [
+    (1, 'ایندکس کوئری‌های پرتکرار و آمار پنل مدیریت', [
+        # فعالیت کاربران در بازه زمانی (COUNT DISTINCT بدون خواندن جدول)
+        'CREATE INDEX IF NOT EXISTS idx_message_history_sent_user ON message_history (sent_at, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_message_history_type ON message_history (message_type)',
+        # کاربران جدید و اخیر
+        'CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at)',
+        # شمارش کاربران فعال و غیرفعال شده خودکار
+        'CREATE INDEX IF NOT EXISTS idx_users_active ON users (is_active, deactivated_at)',
+        # زمان‌بندی‌های فعال و غیرفعال شده خودکار
+        'CREATE INDEX IF NOT EXISTS idx_schedules_active ON notification_schedules (is_active, auto_disabled, user_id)',
+        # کاربران با اعلان فعال در یک ساعت
+        'CREATE INDEX IF NOT EXISTS idx_settings_notification ON user_settings (notification_enabled, notification_time)',
+    ]),
+    (2, 'جدول user_assets به جای ستون‌های JSON انتخاب دارایی', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_assets (
+            user_id INTEGER NOT NULL,
+            asset_type TEXT NOT NULL,
+            asset_id TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, asset_type, asset_id)
+        ) WITHOUT ROWID
+        ''',
+        # محبوبیت و مشترکین هر دارایی
+        'CREATE INDEX IF NOT EXISTS idx_user_assets_asset ON user_assets (asset_type, asset_id, user_id)',
+        # پیشرفت انتقال‌های تدریجی داده (بدون قفل طولانی روی جدول)
+        '''
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            completed_at TIMESTAMP
+        )
+        ''',
+        "INSERT OR IGNORE INTO backfill_progress (name) VALUES ('user_assets')",
+    ]),
+    (3, 'جداول تجمیعی آمار پنل مدیریت (به‌روز شده با trigger)', [
+        # شمارنده‌های کلی: users، active_users، notifications و messages:<نوع پیام>
+        '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_message_stats (
+            day TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, message_type)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            day TEXT PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        # آخرین فعالیت هر کاربر (کاربران فعال در بازه با شمارش روی ایندکس)
+        '''
+        CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            last_active_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_user_activity_last ON user_activity (last_active_at)',
+
+        # مقداردهی اولیه از داده‌های موجود (فقط یک بار هنگام مهاجرت)
+        "INSERT OR REPLACE INTO stats_counters (name, value) SELECT 'users', COUNT(*) FROM users",
+        "INSERT OR REPLACE INTO stats_counters (name, value) SELECT 'active_users', COUNT(*) FROM users WHERE is_active = 1",
+        '''
+        INSERT OR REPLACE INTO stats_counters (name, value)
+        SELECT 'notifications', COUNT(*) FROM user_settings WHERE notification_enabled = 1
+        ''',
+        '''
+        INSERT OR REPLACE INTO stats_counters (name, value)
+        SELECT 'messages:' || COALESCE(message_type, ''), COUNT(*) FROM message_history GROUP BY message_type
+        ''',
+        '''
+        INSERT OR REPLACE INTO daily_message_stats (day, message_type, count)
+        SELECT date(sent_at), COALESCE(message_type, ''), COUNT(*) FROM message_history GROUP BY 1, 2
+        ''',
+        '''
+        INSERT OR REPLACE INTO daily_user_stats (day, new_users)
+        SELECT date(created_at), COUNT(*) FROM users GROUP BY 1
+        ''',
+        '''
+        INSERT OR REPLACE INTO user_activity (user_id, last_active_at)
+        SELECT user_id, MAX(sent_at) FROM message_history WHERE user_id IS NOT NULL GROUP BY user_id
+        ''',
+
+        # به‌روزرسانی افزایشی هنگام نوشتن (حذف/آرشیو تاریخچه آمار را کم نمی‌کند)
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_message_history_stats AFTER INSERT ON message_history
+        BEGIN
+            INSERT INTO daily_message_stats (day, message_type, count)
+            VALUES (date(NEW.sent_at), COALESCE(NEW.message_type, ''), 1)
+            ON CONFLICT (day, message_type) DO UPDATE SET count = count + 1;
+
+            INSERT INTO stats_counters (name, value)
+            VALUES ('messages:' || COALESCE(NEW.message_type, ''), 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1;
+
+            INSERT INTO user_activity (user_id, last_active_at)
+            SELECT NEW.user_id, NEW.sent_at WHERE NEW.user_id IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET last_active_at = MAX(last_active_at, excluded.last_active_at);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_stats AFTER INSERT ON users
+        BEGIN
+            INSERT INTO daily_user_stats (day, new_users) VALUES (date(NEW.created_at), 1)
+            ON CONFLICT (day) DO UPDATE SET new_users = new_users + 1;
+
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'users';
+            UPDATE stats_counters SET value = value + (NEW.is_active = 1) WHERE name = 'active_users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_active_stats AFTER UPDATE OF is_active ON users
+        WHEN (OLD.is_active = 1) != (NEW.is_active = 1)
+        BEGIN
+            UPDATE stats_counters SET value = value + (NEW.is_active = 1) - (OLD.is_active = 1)
+            WHERE name = 'active_users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_settings_insert_stats AFTER INSERT ON user_settings
+        WHEN NEW.notification_enabled = 1
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'notifications';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_settings_notification_stats AFTER UPDATE OF notification_enabled ON user_settings
+        WHEN (OLD.notification_enabled = 1) != (NEW.notification_enabled = 1)
+        BEGIN
+            UPDATE stats_counters SET value = value + (NEW.notification_enabled = 1) - (OLD.notification_enabled = 1)
+            WHERE name = 'notifications';
+        END
+        ''',
+    ]),
+    (4, 'نسخه تنظیمات کاربران برای کش چند پردازه‌ای', [
+        'ALTER TABLE user_settings ADD COLUMN settings_version INTEGER NOT NULL DEFAULT 0',
+        # هر تغییر ردیف (از هر پردازه یا اسکریپتی) نسخه را یک واحد افزایش می‌دهد
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_settings_version AFTER UPDATE ON user_settings
+        WHEN NEW.settings_version = OLD.settings_version
+        BEGIN
+            UPDATE user_settings SET settings_version = OLD.settings_version + 1 WHERE user_id = NEW.user_id;
+        END
+        ''',
+    ]),
+]
+
+# نوع دارایی در user_assets: (ستون JSON در user_settings، انتخاب پیش‌فرض)
+ASSET_COLUMNS = {
+    'crypto': ('selected_cryptos', DEFAULT_CRYPTOS),
+    'fiat': ('selected_fiat_currencies', DEFAULT_FIAT_CURRENCIES),
+    'coin': ('selected_gold_coins', DEFAULT_COINS),
+    'gold_item': ('selected_gold_items', DEFAULT_GOLD_ITEMS),
+}
+
+USERS_WITH_NOTIFICATIONS_SQL = '''
+    SELECT u.user_id
+    FROM users u
+    JOIN user_settings s ON u.user_id = s.user_id
+    WHERE s.notification_enabled = 1
+    AND s.notification_time = ?
+    AND u.is_active = 1
+'''
+
+NEW_USERS_COUNT_SQL = '''
+    SELECT COUNT(*) as count FROM users
+    WHERE created_at >= datetime('now', '-' || ? || ' days')
+'''
+
+# کاربران فعال در 24 ساعت، 7 روز و 30 روز اخیر با یک بار خواندن ایندکس
+USER_ACTIVITY_SQL = '''
+    SELECT
+        COUNT(DISTINCT CASE WHEN sent_at >= datetime('now', '-1 day') THEN user_id END) as active_24h,
+        COUNT(DISTINCT CASE WHEN sent_at >= datetime('now', '-7 days') THEN user_id END) as active_7d,
+        COUNT(DISTINCT user_id) as active_30d
+    FROM message_history
+    WHERE sent_at >= datetime('now', '-30 days')
+'''
+
+ACTIVE_SCHEDULES_SQL = '''
+    SELECT ns.id, ns.user_id, ns.notification_time,
+           ns.change_mode, ns.change_threshold
+    FROM notification_schedules ns
+    JOIN users u ON ns.user_id = u.user_id
+    WHERE ns.is_active = 1 AND u.is_active = 1
+'''
+
+BUCKET_SCHEDULES_SQL = '''
+    SELECT ns.id, ns.user_id, ns.notification_time,
+           ns.change_mode, ns.change_threshold
+    FROM notification_schedules ns
+    JOIN users u ON ns.user_id = u.user_id
+    WHERE ns.utc_minute = ? AND ns.is_active = 1 AND u.is_active = 1
+'''
+
+USER_SCHEDULES_SQL = '''
+    SELECT id, notification_time, is_active, change_mode, utc_minute, created_at
+    FROM notification_schedules
+    WHERE user_id = ?
+    ORDER BY notification_time
+'''
+
+# حداکثر ردیف نمونه‌برداری شده برای هر ایندکس در ANALYZE (PRAGMA analysis_limit)
+ANALYZE_ROW_LIMIT = 1000
+
+# کوئری‌هایی که هنگام شروع با EXPLAIN QUERY PLAN بررسی می‌شوند: (نام، SQL، پارامتر نمونه)
+HOT_QUERIES = [
+    ('get_user_settings', 'SELECT * FROM user_settings WHERE user_id = ?', (0,)),
+    ('get_user_schedules', USER_SCHEDULES_SQL, (0,)),
+    ('get_bucket_schedules', BUCKET_SCHEDULES_SQL, (0,)),
+    ('get_all_active_schedules', ACTIVE_SCHEDULES_SQL, ()),
+    ('get_users_with_notifications', USERS_WITH_NOTIFICATIONS_SQL, ('09:00',)),
+    ('get_new_users_count', NEW_USERS_COUNT_SQL, (7,)),
+    ('get_user_activity_stats', USER_ACTIVITY_SQL, ()),
+    ('get_active_users_count', 'SELECT COUNT(*) as count FROM users WHERE is_active = 1', ()),
+]
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    اتصال ماندگار هر thread
+
+    متدهای Database بعد از هر کار close() را صدا می‌زنند؛ اینجا اتصال بسته
+    نمی‌شود و فقط تراکنش commit نشده برگردانده می‌شود (همان رفتار بستن اتصال).
+
+    در حالت دسته‌ای (batch) چند فراخوانی در یک تراکنش اجرا می‌شوند و هر
+    فراخوانی یک SAVEPOINT دارد: commit() آن را تأیید و close() کارهای
+    تأیید نشده همان فراخوانی را برمی‌گرداند. متدی که متد دیگری از Database را
+    صدا می‌زند (مثل get_popular_cryptos ← is_backfill_complete) عمق را بالا
+    می‌برد و commit()/close() متد داخلی SAVEPOINT را تمام نمی‌کند؛ فقط
+    بیرونی‌ترین متد و در نهایت end_call() آن را تأیید یا برمی‌گردانند.
+    """
+
+    batch = False
+    call_open = False
+    call_depth = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # کارهای بعد از commit واقعی (مثل write-through کش تنظیمات) و شروع کارهای فراخوانی جاری
+        self._after_commit: List[Callable[[], Any]] = []
+        self._call_mark = 0
+        self._batch_changes = 0
+
+    def begin_batch(self):
+        # قفل نوشتن از ابتدای دسته گرفته می‌شود: با BEGIN معمولی اگر اتصال دیگری بین
+        # یک خواندن و یک نوشتن همین دسته commit کند، نوشتن با SQLITE_BUSY_SNAPSHOT رد
+        # می‌شود و خطا در try/except خود متد (نه در AsyncDatabase) گم می‌شود.
+        # خطای گرفتن قفل اینجا به AsyncDatabase می‌رسد و فراخوانی‌ها تک‌تک اجرا می‌شوند.
+        self.execute('BEGIN IMMEDIATE')
+        self.batch = True
+        self._batch_changes = self.total_changes
+
+    def begin_call(self):
+        self.execute('SAVEPOINT db_call')
+        self.call_open = True
+        self.call_depth = 0
+        self._call_mark = len(self._after_commit)
+
+    def end_call(self):
+        """
+        پایان فراخوانی دسته‌ای: SAVEPOINT تأیید نشده برگردانده می‌شود
+
+        اگر متد داخلی با خطا (بدون close) تمام شده باشد عمق پایین نیامده و commit
+        متد بیرونی اثری نداشته است؛ در این حالت کل فراخوانی برگردانده می‌شود.
+        """
+        if self.call_open:
+            self._rollback_call()
+        self.call_depth = 0
+
+    def _rollback_call(self):
+        self.execute('ROLLBACK TO SAVEPOINT db_call')
+        self.execute('RELEASE SAVEPOINT db_call')
+        self.call_open = False
+        del self._after_commit[self._call_mark:]
+
+    @property
+    def has_uncommitted_writes(self) -> bool:
+        """آیا داده‌های خوانده شده ممکن است شامل تغییرات commit نشده باشند"""
+        if not self.in_transaction:
+            return False
+        return not self.batch or self.total_changes != self._batch_changes
+
+    def after_commit(self, callback: Callable[[], Any]):
+        """اجرای callback بعد از commit تراکنش (در حالت دسته‌ای بعد از commit کل دسته)"""
+        self._after_commit.append(callback)
+
+    def commit(self):
+        if not self.batch:
+            callbacks, self._after_commit = self._after_commit, []
+            super().commit()
+            for callback in callbacks:
+                callback()
+            return
+        if self.call_open and self.call_depth <= 1:
+            self.execute('RELEASE SAVEPOINT db_call')
+            self.call_open = False
+
+    def rollback(self):
+        self._after_commit = []
+        super().rollback()
+
+    def close(self):
+        if self.batch:
+            if self.call_depth > 1:
+                # پایان متد داخلی؛ SAVEPOINT متعلق به متد بیرونی است
+                self.call_depth -= 1
+            elif self.call_open:
+                self._rollback_call()
+        elif self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        """بستن واقعی اتصال"""
+        super().close()
 
 
 class Database:
@@ -17,14 +348,69 @@ class Database:
     def __init__(self, db_path: str = DATABASE_PATH):
         """راه‌اندازی اتصال به پایگاه داده"""
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[PooledConnection] = []
+        self._connections_lock = threading.Lock()
+        self._completed_backfills = set()
+        self.settings_cache = SettingsCache()
         self.init_database()
 
-    def get_connection(self):
-        """ایجاد اتصال به پایگاه داده"""
-        conn = sqlite3.connect(self.db_path)
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.db_path, timeout=DATABASE_BUSY_TIMEOUT,
+            cached_statements=DATABASE_STATEMENT_CACHE, factory=PooledConnection
+        )
         conn.row_factory = sqlite3.Row  # برای دسترسی به ستون‌ها با نام
+        # آزاد کردن تدریجی فضای ردیف‌های حذف شده؛ باید قبل از ساخت فایل تنظیم شود و
+        # روی فایل موجود اثری ندارد (یک بار: python retention.py --enable-incremental-vacuum)
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL: خواننده‌ها نویسنده را متوقف نمی‌کنند و برعکس
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DATABASE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={DATABASE_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def get_connection(self) -> PooledConnection:
+        """اتصال ماندگار thread فعلی (در اولین استفاده ساخته می‌شود)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        elif conn.batch:
+            # ورود به یک متد در فراخوانی دسته‌ای (متدهای تو در تو عمق را بالا می‌برند)
+            conn.call_depth += 1
+        elif conn.in_transaction:
+            # تراکنش نیمه‌کاره متدی که با خطا متوقف شده
+            conn.rollback()
         return conn
 
+    def close_connection(self):
+        """بستن اتصال thread فعلی"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._connections_lock:
+            self._connections.remove(conn)
+        conn.dispose()
+
+    def close(self):
+        """بستن تمام اتصال‌های باز (هنگام خاموش شدن)"""
+        self.close_connection()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.dispose()
+            except sqlite3.ProgrammingError:
+                # اتصال thread دیگر؛ با پایان پردازه بسته می‌شود
+                pass
+        self._local = threading.local()
+
     def init_database(self):
         """ایجاد جداول پایگاه داده"""
         conn = self.get_connection()
@@ -98,9 +484,126 @@ class Database:
             )
         ''')
 
+        # دقیقه UTC هر زمان‌بندی (0 تا 1439) بر اساس منطقه زمانی کاربر
+        self._ensure_column(cursor, 'notification_schedules', 'utc_minute', 'INTEGER')
+
+        # ایندکس برای خواندن اعضای هر دقیقه UTC در لحظه اجرا
+        cursor.execute('DROP INDEX IF EXISTS idx_schedules_time_active')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_schedules_minute_active
+            ON notification_schedules (utc_minute, is_active)
+        ''')
+
+        # غیرفعال‌سازی خودکار کاربرانی که ربات را بلاک کرده‌اند
+        self._ensure_column(cursor, 'users', 'deactivated_at', 'TIMESTAMP')
+        self._ensure_column(cursor, 'notification_schedules', 'auto_disabled', 'INTEGER DEFAULT 0')
+
+        # حالت ارسال فقط در صورت تغییر مهم قیمت (برای هر زمان‌بندی)
+        self._ensure_column(cursor, 'notification_schedules', 'change_mode', "TEXT DEFAULT 'always'")
+        self._ensure_column(cursor, 'notification_schedules', 'change_threshold', 'REAL')
+
+        # جدول آخرین قیمت‌های ارسال شده (JSON شناسه خانه ASSET_SLOTS -> قیمت برای هر کاربر)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS last_delivered_prices (
+                user_id INTEGER PRIMARY KEY,
+                prices TEXT NOT NULL,
+                delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+
+        # صف پایدار ارسال (outbox) برای از سرگیری ارسال‌ها بعد از ری‌استارت
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox_jobs (
+                job_key TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                payload TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP
+            )
+        ''')
+
+        # هر کاربر در هر job فقط یک بار (کلید یکتا: job_key + user_id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                job_key TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (job_key, user_id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, created_at)')
+
+        # lease برای انتخاب leader بین worker ها (فقط یک ردیف برای هر نقش)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leader_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
         conn.commit()
+        self._migrate(conn)
         conn.close()
 
+    def _migrate(self, conn):
+        """اجرای مهاجرت‌هایی که نسخه آن‌ها از user_version پایگاه داده بزرگ‌تر است"""
+        for version, description, statements in MIGRATIONS:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+
+            # IMMEDIATE: اگر چند worker هم‌زمان شروع شوند فقط یکی مهاجرت را اجرا می‌کند
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < version:
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version = {version}')
+                    print(f"مهاجرت پایگاه داده به نسخه {version}: {description}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """
+        بررسی طرح اجرای کوئری‌های پرتکرار
+
+        Returns:
+            نام کوئری‌هایی که کل یک جدول را می‌خوانند و جزئیات آن مرحله‌ها
+        """
+        scans = {}
+        try:
+            conn = self.get_connection()
+            for name, sql, params in HOT_QUERIES:
+                details = [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+                # SCAN بدون USING یعنی خواندن کامل جدول (نه پیمایش ایندکس)
+                full_scans = [detail for detail in details if detail.startswith('SCAN') and 'USING' not in detail]
+                if full_scans:
+                    scans[name] = full_scans
+            conn.close()
+        except Exception as e:
+            print(f"خطا در بررسی طرح اجرای کوئری‌ها: {e}")
+        return scans
+
+    def _ensure_column(self, cursor, table: str, column: str, definition: str):
+        """افزودن ستون به جدول موجود در صورت نبودن"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [row['name'] for row in cursor.fetchall()]
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _replace_user_assets(self, cursor, user_id: int, asset_type: str, asset_ids: List[str]):
+        """نوشتن انتخاب کاربر در user_assets (در همان تراکنش ستون JSON)"""
+        cursor.execute('DELETE FROM user_assets WHERE user_id = ? AND asset_type = ?', (user_id, asset_type))
+        cursor.executemany('''
+            INSERT OR IGNORE INTO user_assets (user_id, asset_type, asset_id, position)
+            VALUES (?, ?, ?, ?)
+        ''', [(user_id, asset_type, asset_id, position) for position, asset_id in enumerate(asset_ids)])
+
     def add_user(self, user_id: int, username: str = None, first_name: str = None,
                  last_name: str = None, phone_number: str = None,
                  language_code: str = None) -> bool:
@@ -131,6 +634,9 @@ class Database:
                   json.dumps(DEFAULT_FIAT_CURRENCIES),
                   json.dumps(DEFAULT_COINS),
                   json.dumps(DEFAULT_GOLD_ITEMS)))
+            if cursor.rowcount:
+                for asset_type, (_, default) in ASSET_COLUMNS.items():
+                    self._replace_user_assets(cursor, user_id, asset_type, default)
 
             conn.commit()
             conn.close()
@@ -176,29 +682,98 @@ class Database:
             return None
 
     def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """دریافت تنظیمات کاربر"""
+        """دریافت تنظیمات کاربر (از کش تنظیمات در صورت وجود)"""
         try:
+            cache = self.settings_cache
             conn = self.get_connection()
             cursor = conn.cursor()
 
+            # در اجرای دسته‌ای، تغییرات commit نشده فراخوانی‌های قبلی هنوز به کش نرسیده‌اند
+            # (write-through بعد از commit)؛ خواندن مستقیم از تراکنش جاری
+            if cache.enabled and not conn.has_uncommitted_writes:
+                version = None
+                if cache.versioned and user_id in cache:
+                    cursor.execute('SELECT settings_version FROM user_settings WHERE user_id = ?', (user_id,))
+                    row = cursor.fetchone()
+                    version = row['settings_version'] if row else -1
+                settings = cache.get(user_id, version)
+                if settings is not None:
+                    conn.close()
+                    return settings
+
+            generation = cache.generation
             cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
             row = cursor.fetchone()
 
-            conn.close()
+            if not row:
+                conn.close()
+                return None
 
-            if row:
-                settings = dict(row)
-                # تبدیل JSON به لیست
-                settings['selected_cryptos'] = json.loads(settings['selected_cryptos']) if settings.get('selected_cryptos') else DEFAULT_CRYPTOS
-                settings['selected_fiat_currencies'] = json.loads(settings['selected_fiat_currencies']) if settings.get('selected_fiat_currencies') else DEFAULT_FIAT_CURRENCIES
-                settings['selected_gold_coins'] = json.loads(settings['selected_gold_coins']) if settings.get('selected_gold_coins') else DEFAULT_COINS
-                settings['selected_gold_items'] = json.loads(settings['selected_gold_items']) if settings.get('selected_gold_items') else DEFAULT_GOLD_ITEMS
-                return settings
-            return None
+            settings = self._decode_settings(row)
+            # داده‌های تراکنش commit نشده (اجرای دسته‌ای) در کش ثبت نمی‌شوند
+            if not conn.has_uncommitted_writes:
+                cache.set(user_id, settings, generation)
+            conn.close()
+            return copy_settings(settings)
         except Exception as e:
             print(f"خطا در دریافت تنظیمات: {e}")
             return None
 
+    def get_users_settings(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """دریافت تنظیمات گروهی از کاربران (مثلاً اعضای یک نوبت زمان‌بندی) با کوئری‌های دسته‌ای"""
+        try:
+            if not user_ids:
+                return {}
+
+            cache = self.settings_cache
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            # در حالت version خواندن کل دسته هزینه‌ای برابر بررسی نسخه‌ها دارد؛ در اجرای
+            # دسته‌ای با تغییرات commit نشده هم کش دور زده می‌شود (مثل get_user_settings)
+            if cache.versioned or conn.has_uncommitted_writes:
+                result = {}
+            else:
+                result = cache.get_many(user_ids)
+            missing = [user_id for user_id in user_ids if user_id not in result]
+
+            generation = cache.generation
+            # تقسیم به بخش‌های کوچک به خاطر محدودیت تعداد پارامترهای SQLite
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(
+                    f'SELECT * FROM user_settings WHERE user_id IN ({placeholders})',
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    result[row['user_id']] = self._decode_settings(row)
+
+            if cache.versioned and not conn.has_uncommitted_writes:
+                for user_id, settings in result.items():
+                    cache.refresh(user_id, copy_settings(settings), generation)
+
+            conn.close()
+            return result
+        except Exception as e:
+            print(f"خطا در دریافت تنظیمات گروهی: {e}")
+            return {}
+
+    def _cache_settings_write(self, conn: PooledConnection, user_id: int, **fields):
+        """write-through کش تنظیمات بعد از commit"""
+        conn.after_commit(functools.partial(self.settings_cache.update, user_id, **fields))
+
+    @staticmethod
+    def _decode_settings(row) -> Dict[str, Any]:
+        """تبدیل ردیف user_settings به dict با لیست‌های JSON باز شده"""
+        settings = dict(row)
+        # تبدیل JSON به لیست
+        settings['selected_cryptos'] = json.loads(settings['selected_cryptos']) if settings.get('selected_cryptos') else DEFAULT_CRYPTOS
+        settings['selected_fiat_currencies'] = json.loads(settings['selected_fiat_currencies']) if settings.get('selected_fiat_currencies') else DEFAULT_FIAT_CURRENCIES
+        settings['selected_gold_coins'] = json.loads(settings['selected_gold_coins']) if settings.get('selected_gold_coins') else DEFAULT_COINS
+        settings['selected_gold_items'] = json.loads(settings['selected_gold_items']) if settings.get('selected_gold_items') else DEFAULT_GOLD_ITEMS
+        return settings
+
     def update_notification_settings(self, user_id: int, enabled: bool,
                                      notification_time: str = None) -> bool:
         """به‌روزرسانی تنظیمات نوتیفیکیشن"""
@@ -218,6 +793,11 @@ class Database:
                     SET notification_enabled = ?
                     WHERE user_id = ?
                 ''', (1 if enabled else 0, user_id))
+            if cursor.rowcount:
+                fields = {'notification_enabled': 1 if enabled else 0}
+                if notification_time:
+                    fields['notification_time'] = notification_time
+                self._cache_settings_write(conn, user_id, **fields)
 
             conn.commit()
             conn.close()
@@ -226,6 +806,27 @@ class Database:
             print(f"خطا در به‌روزرسانی نوتیفیکیشن: {e}")
             return False
 
+    def update_user_timezone(self, user_id: int, timezone: str) -> bool:
+        """تغییر منطقه زمانی کاربر"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                UPDATE user_settings
+                SET timezone = ?
+                WHERE user_id = ?
+            ''', (timezone, user_id))
+            if cursor.rowcount:
+                self._cache_settings_write(conn, user_id, timezone=timezone)
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در تغییر منطقه زمانی: {e}")
+            return False
+
     def update_selected_cryptos(self, user_id: int, cryptos: List[str]) -> bool:
         """به‌روزرسانی ارزهای انتخابی کاربر"""
         try:
@@ -237,6 +838,9 @@ class Database:
                 SET selected_cryptos = ?
                 WHERE user_id = ?
             ''', (json.dumps(cryptos), user_id))
+            if cursor.rowcount:
+                self._cache_settings_write(conn, user_id, selected_cryptos=list(cryptos))
+                self._replace_user_assets(cursor, user_id, 'crypto', cryptos)
 
             conn.commit()
             conn.close()
@@ -254,23 +858,29 @@ class Database:
 
             updates = []
             values = []
+            fields = {}
 
             if include_gold is not None:
                 updates.append('include_gold = ?')
                 values.append(1 if include_gold else 0)
+                fields['include_gold'] = 1 if include_gold else 0
 
             if include_silver is not None:
                 updates.append('include_silver = ?')
                 values.append(1 if include_silver else 0)
+                fields['include_silver'] = 1 if include_silver else 0
 
             if include_usd is not None:
                 updates.append('include_usd = ?')
                 values.append(1 if include_usd else 0)
+                fields['include_usd'] = 1 if include_usd else 0
 
             if updates:
                 values.append(user_id)
                 query = f"UPDATE user_settings SET {', '.join(updates)} WHERE user_id = ?"
                 cursor.execute(query, values)
+                if cursor.rowcount:
+                    self._cache_settings_write(conn, user_id, **fields)
 
                 conn.commit()
 
@@ -286,14 +896,7 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT u.user_id
-                FROM users u
-                JOIN user_settings s ON u.user_id = s.user_id
-                WHERE s.notification_enabled = 1
-                AND s.notification_time = ?
-                AND u.is_active = 1
-            ''', (notification_time,))
+            cursor.execute(USERS_WITH_NOTIFICATIONS_SQL, (notification_time,))
 
             users = [row['user_id'] for row in cursor.fetchall()]
 
@@ -321,6 +924,117 @@ class Database:
             print(f"خطا در ثبت پیام: {e}")
             return False
 
+    def log_messages(self, rows: List[tuple]) -> bool:
+        """ثبت گروهی تاریخچه ارسال پیام در یک تراکنش (user_id، message_type، sent_at)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                INSERT INTO message_history (user_id, message_type, sent_at)
+                VALUES (?, ?, ?)
+            ''', rows)
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در ثبت گروهی پیام‌ها: {e}")
+            return False
+
+    def get_history_batch(self, before: str, limit: int) -> List[Dict[str, Any]]:
+        """قدیمی‌ترین ردیف‌های تاریخچه پیام با sent_at قبل از before (به ترتیب id)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT id, user_id, message_type, sent_at FROM message_history
+                WHERE sent_at < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (before, limit))
+            rows = [dict(row) for row in cursor.fetchall()]
+
+            conn.close()
+            return rows
+        except Exception as e:
+            print(f"خطا در دریافت تاریخچه قدیمی: {e}")
+            return []
+
+    def delete_history_through(self, max_id: int, before: str) -> int:
+        """حذف ردیف‌های بایگانی شده (id تا max_id و sent_at قبل از before)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                DELETE FROM message_history
+                WHERE id <= ? AND sent_at < ?
+            ''', (max_id, before))
+            deleted = cursor.rowcount
+
+            conn.commit()
+            conn.close()
+            return deleted
+        except Exception as e:
+            print(f"خطا در حذف تاریخچه بایگانی شده: {e}")
+            return 0
+
+    def analyze(self, table: str = None) -> bool:
+        """
+        به‌روزرسانی آمار sqlite_stat1 برای انتخاب طرح اجرا (کل پایگاه داده یا یک جدول)
+
+        هر ایندکس با حداکثر ANALYZE_ROW_LIMIT ردیف نمونه‌برداری می‌شود تا روی
+        جدول‌های بزرگ هم سریع باشد. بعد از پر شدن ستون‌های جدید (مثل utc_minute)
+        و به صورت دوره‌ای در کار نگهداری اجرا می‌شود؛ آمار قدیمی می‌تواند باعث
+        خواندن کامل جدول به جای استفاده از ایندکس شود.
+        """
+        try:
+            conn = self.get_connection()
+            conn.execute(f'PRAGMA analysis_limit = {ANALYZE_ROW_LIMIT}')
+            conn.execute(f'ANALYZE "{table}"' if table else 'ANALYZE')
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در به‌روزرسانی آمار پایگاه داده: {e}")
+            return False
+
+    def incremental_vacuum(self, pages: int = 0) -> int:
+        """
+        آزاد کردن صفحات خالی فایل پایگاه داده (0 = همه)
+
+        Returns:
+            تعداد صفحات آزاد شده (در حالت auto_vacuum غیر INCREMENTAL همیشه 0)
+        """
+        try:
+            conn = self.get_connection()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                conn.close()
+                return 0
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # execute() فقط یک گام (یک صفحه) اجرا می‌کند؛ executescript تا پایان
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+            freed = before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.close()
+            return freed
+        except Exception as e:
+            print(f"خطا در incremental vacuum: {e}")
+            return 0
+
+    def enable_incremental_vacuum(self) -> bool:
+        """تبدیل فایل موجود به حالت auto_vacuum=INCREMENTAL (یک VACUUM کامل؛ ربات باید متوقف باشد)"""
+        try:
+            conn = self.get_connection()
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در فعال‌سازی incremental vacuum: {e}")
+            return False
+
     def update_selected_fiat_currencies(self, user_id: int, currencies: List[str]) -> bool:
         """به‌روزرسانی ارزهای فیات انتخابی کاربر"""
         try:
@@ -332,6 +1046,9 @@ class Database:
                 SET selected_fiat_currencies = ?
                 WHERE user_id = ?
             ''', (json.dumps(currencies), user_id))
+            if cursor.rowcount:
+                self._cache_settings_write(conn, user_id, selected_fiat_currencies=list(currencies))
+                self._replace_user_assets(cursor, user_id, 'fiat', currencies)
 
             conn.commit()
             conn.close()
@@ -351,6 +1068,9 @@ class Database:
                 SET selected_gold_coins = ?
                 WHERE user_id = ?
             ''', (json.dumps(coins), user_id))
+            if cursor.rowcount:
+                self._cache_settings_write(conn, user_id, selected_gold_coins=list(coins))
+                self._replace_user_assets(cursor, user_id, 'coin', coins)
 
             conn.commit()
             conn.close()
@@ -370,6 +1090,9 @@ class Database:
                 SET selected_gold_items = ?
                 WHERE user_id = ?
             ''', (json.dumps(items), user_id))
+            if cursor.rowcount:
+                self._cache_settings_write(conn, user_id, selected_gold_items=list(items))
+                self._replace_user_assets(cursor, user_id, 'gold_item', items)
 
             conn.commit()
             conn.close()
@@ -393,6 +1116,21 @@ class Database:
             print(f"خطا در شمارش کاربران: {e}")
             return 0
 
+    def get_active_user_ids(self) -> List[int]:
+        """شناسه تمام کاربران فعال"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT user_id FROM users WHERE is_active = 1')
+            user_ids = [row['user_id'] for row in cursor.fetchall()]
+
+            conn.close()
+            return user_ids
+        except Exception as e:
+            print(f"خطا در دریافت کاربران فعال: {e}")
+            return []
+
     # توابع مدیریت ادمین‌ها
 
     def is_admin(self, user_id: int) -> bool:
@@ -481,10 +1219,7 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM users
-                WHERE created_at >= datetime('now', '-' || ? || ' days')
-            ''', (days,))
+            cursor.execute(NEW_USERS_COUNT_SQL, (days,))
             count = cursor.fetchone()['count']
 
             conn.close()
@@ -548,6 +1283,12 @@ class Database:
 
     def get_popular_cryptos(self, limit: int = 10) -> Dict[str, int]:
         """محبوب‌ترین ارزهای انتخاب شده"""
+        if not self.is_backfill_complete('user_assets'):
+            return self._get_popular_cryptos_from_json(limit)
+        return self.get_asset_popularity('crypto', limit)
+
+    def _get_popular_cryptos_from_json(self, limit: int) -> Dict[str, int]:
+        """شمارش از ستون JSON (تا پایان انتقال به user_assets)"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
@@ -573,6 +1314,126 @@ class Database:
             print(f"خطا در دریافت ارزهای محبوب: {e}")
             return {}
 
+    def get_asset_popularity(self, asset_type: str, limit: int = 10) -> Dict[str, int]:
+        """تعداد کاربران انتخاب کننده هر دارایی (crypto، fiat، coin یا gold_item)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT asset_id, COUNT(*) AS count
+                FROM user_assets
+                WHERE asset_type = ?
+                GROUP BY asset_id
+                ORDER BY count DESC
+                LIMIT ?
+            ''', (asset_type, limit))
+            popularity = {row['asset_id']: row['count'] for row in cursor.fetchall()}
+
+            conn.close()
+            return popularity
+        except Exception as e:
+            print(f"خطا در دریافت محبوبیت دارایی‌ها: {e}")
+            return {}
+
+    def get_asset_subscribers(self, asset_type: str, asset_id: str) -> List[int]:
+        """کاربران فعالی که یک دارایی را انتخاب کرده‌اند"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT ua.user_id
+                FROM user_assets ua
+                JOIN users u ON ua.user_id = u.user_id
+                WHERE ua.asset_type = ? AND ua.asset_id = ? AND u.is_active = 1
+            ''', (asset_type, asset_id))
+            user_ids = [row['user_id'] for row in cursor.fetchall()]
+
+            conn.close()
+            return user_ids
+        except Exception as e:
+            print(f"خطا در دریافت مشترکین دارایی: {e}")
+            return []
+
+    # انتقال تدریجی داده‌ها
+
+    def is_backfill_complete(self, name: str) -> bool:
+        """پایان انتقال تدریجی (نتیجه مثبت کش می‌شود چون دیگر تغییر نمی‌کند)"""
+        if name in self._completed_backfills:
+            return True
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT completed_at FROM backfill_progress WHERE name = ?', (name,))
+            row = cursor.fetchone()
+
+            conn.close()
+            if row and row['completed_at']:
+                self._completed_backfills.add(name)
+                return True
+            return False
+        except Exception as e:
+            print(f"خطا در بررسی وضعیت انتقال {name}: {e}")
+            return False
+
+    def backfill_user_assets(self, batch_size: int = 500) -> int:
+        """
+        انتقال یک دسته از انتخاب‌های JSON کاربران به user_assets
+
+        کاربران به ترتیب user_id و از آخرین نقطه ذخیره شده خوانده می‌شوند؛
+        هر دسته یک تراکنش کوتاه است و ربات در این مدت به کار خود ادامه می‌دهد.
+
+        Returns:
+            تعداد کاربران منتقل شده (0 یعنی انتقال تمام شده است)
+        """
+        if self.is_backfill_complete('user_assets'):
+            return 0
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            # خواندن JSON و نوشتن user_assets در یک تراکنش تا نوشتن هم‌زمان worker دیگری گم نشود
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT last_id FROM backfill_progress WHERE name = 'user_assets'")
+            last_id = cursor.fetchone()['last_id']
+
+            columns = ', '.join(column for column, _ in ASSET_COLUMNS.values())
+            cursor.execute(f'''
+                SELECT user_id, {columns} FROM user_settings
+                WHERE user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+
+            for row in rows:
+                for asset_type, (column, default) in ASSET_COLUMNS.items():
+                    try:
+                        asset_ids = json.loads(row[column]) if row[column] else default
+                    except ValueError:
+                        asset_ids = default
+                    self._replace_user_assets(cursor, row['user_id'], asset_type, asset_ids)
+
+            if rows:
+                cursor.execute(
+                    "UPDATE backfill_progress SET last_id = ? WHERE name = 'user_assets'", (rows[-1]['user_id'],)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE backfill_progress SET completed_at = CURRENT_TIMESTAMP WHERE name = 'user_assets'"
+                )
+                self._completed_backfills.add('user_assets')
+
+            conn.commit()
+            conn.close()
+            return len(rows)
+        except Exception as e:
+            print(f"خطا در انتقال انتخاب‌های کاربران به user_assets: {e}")
+            return 0
+
     def get_recent_users(self, limit: int = 10) -> List[Dict[str, Any]]:
         """کاربران اخیر"""
         try:
@@ -600,50 +1461,78 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            # کاربران فعال در 24 ساعت اخیر
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as count FROM message_history
-                WHERE sent_at >= datetime('now', '-1 day')
-            ''')
-            active_24h = cursor.fetchone()['count']
-
-            # کاربران فعال در 7 روز اخیر
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as count FROM message_history
-                WHERE sent_at >= datetime('now', '-7 days')
-            ''')
-            active_7d = cursor.fetchone()['count']
-
-            # کاربران فعال در 30 روز اخیر
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as count FROM message_history
-                WHERE sent_at >= datetime('now', '-30 days')
-            ''')
-            active_30d = cursor.fetchone()['count']
+            cursor.execute(USER_ACTIVITY_SQL)
+            row = cursor.fetchone()
 
             conn.close()
 
             return {
-                'active_24h': active_24h,
-                'active_7d': active_7d,
-                'active_30d': active_30d
+                'active_24h': row['active_24h'],
+                'active_7d': row['active_7d'],
+                'active_30d': row['active_30d']
             }
         except Exception as e:
             print(f"خطا در دریافت آمار فعالیت: {e}")
             return {}
 
+    def get_stats_summary(self) -> Dict[str, Any]:
+        """
+        آمار پنل مدیریت از جداول تجمیعی (بدون خواندن تاریخچه خام)
+
+        کاربران جدید بر اساس روز تقویمی (UTC) شمرده می‌شوند: new_users_1d
+        یعنی امروز و new_users_7d یعنی امروز و 6 روز قبل.
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            messages_by_type = {
+                name[len('messages:'):]: value for name, value in counters.items() if name.startswith('messages:')
+            }
+
+            summary = {
+                'total_users': counters.get('users', 0),
+                'active_users': counters.get('active_users', 0),
+                'active_notifications': counters.get('notifications', 0),
+                'total_messages': sum(messages_by_type.values()),
+                'messages_by_type': messages_by_type,
+            }
+
+            for days in (1, 7, 30):
+                cursor.execute('''
+                    SELECT COALESCE(SUM(new_users), 0) AS count FROM daily_user_stats
+                    WHERE day > date('now', '-' || ? || ' days')
+                ''', (days,))
+                summary[f'new_users_{days}d'] = cursor.fetchone()['count']
+
+            for key, window in (('active_24h', '-1 day'), ('active_7d', '-7 days'), ('active_30d', '-30 days')):
+                cursor.execute(
+                    "SELECT COUNT(*) AS count FROM user_activity WHERE last_active_at >= datetime('now', ?)",
+                    (window,)
+                )
+                summary[key] = cursor.fetchone()['count']
+
+            conn.close()
+            return summary
+        except Exception as e:
+            print(f"خطا در دریافت آمار تجمیعی: {e}")
+            return {}
+
     # توابع مدیریت زمان‌بندی اعلان‌ها
 
-    def add_notification_schedule(self, user_id: int, notification_time: str) -> bool:
+    def add_notification_schedule(self, user_id: int, notification_time: str,
+                                  utc_minute: int = None) -> bool:
         """افزودن زمان‌بندی جدید برای کاربر"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
             cursor.execute('''
-                INSERT OR IGNORE INTO notification_schedules (user_id, notification_time, is_active)
-                VALUES (?, ?, 1)
-            ''', (user_id, notification_time))
+                INSERT OR IGNORE INTO notification_schedules (user_id, notification_time, is_active, utc_minute)
+                VALUES (?, ?, 1, ?)
+            ''', (user_id, notification_time, utc_minute))
 
             conn.commit()
             conn.close()
@@ -673,12 +1562,7 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT id, notification_time, is_active, created_at
-                FROM notification_schedules
-                WHERE user_id = ?
-                ORDER BY notification_time
-            ''', (user_id,))
+            cursor.execute(USER_SCHEDULES_SQL, (user_id,))
 
             schedules = [dict(row) for row in cursor.fetchall()]
 
@@ -694,12 +1578,7 @@ class Database:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT ns.id, ns.user_id, ns.notification_time
-                FROM notification_schedules ns
-                JOIN users u ON ns.user_id = u.user_id
-                WHERE ns.is_active = 1 AND u.is_active = 1
-            ''')
+            cursor.execute(ACTIVE_SCHEDULES_SQL)
 
             schedules = [dict(row) for row in cursor.fetchall()]
 
@@ -709,30 +1588,582 @@ class Database:
             print(f"خطا در دریافت زمان‌بندی‌های فعال: {e}")
             return []
 
-    def toggle_schedule_status(self, schedule_id: int) -> bool:
-        """تغییر وضعیت فعال/غیرفعال زمان‌بندی"""
+    def get_active_schedule_minutes(self) -> List[int]:
+        """دریافت دقیقه‌های UTC که حداقل یک زمان‌بندی فعال دارند"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            # دریافت وضعیت فعلی
-            cursor.execute('SELECT is_active FROM notification_schedules WHERE id = ?', (schedule_id,))
-            row = cursor.fetchone()
+            cursor.execute('''
+                SELECT DISTINCT ns.utc_minute
+                FROM notification_schedules ns
+                JOIN users u ON ns.user_id = u.user_id
+                WHERE ns.is_active = 1 AND u.is_active = 1 AND ns.utc_minute IS NOT NULL
+            ''')
 
-            if row:
-                new_status = 0 if row['is_active'] == 1 else 1
-                cursor.execute('''
-                    UPDATE notification_schedules
-                    SET is_active = ?
-                    WHERE id = ?
-                ''', (new_status, schedule_id))
+            minutes = [row['utc_minute'] for row in cursor.fetchall()]
 
-                conn.commit()
-                conn.close()
-                return True
+            conn.close()
+            return minutes
+        except Exception as e:
+            print(f"خطا در دریافت دقیقه‌های زمان‌بندی: {e}")
+            return []
+
+    def get_bucket_schedules(self, utc_minute: int) -> List[Dict[str, Any]]:
+        """دریافت زمان‌بندی‌های فعال یک دقیقه UTC (اعضای یک نوبت ارسال)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute(BUCKET_SCHEDULES_SQL, (utc_minute,))
+
+            schedules = [dict(row) for row in cursor.fetchall()]
 
             conn.close()
-            return False
+            return schedules
         except Exception as e:
-            print(f"خطا در تغییر وضعیت زمان‌بندی: {e}")
+            print(f"خطا در دریافت زمان‌بندی‌های دقیقه {utc_minute}: {e}")
+            return []
+
+    def has_bucket_schedules(self, utc_minute: int) -> bool:
+        """آیا دقیقه UTC مورد نظر حداقل یک زمان‌بندی فعال دارد"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT 1
+                FROM notification_schedules ns
+                JOIN users u ON ns.user_id = u.user_id
+                WHERE ns.utc_minute = ? AND ns.is_active = 1 AND u.is_active = 1
+                LIMIT 1
+            ''', (utc_minute,))
+            exists = cursor.fetchone() is not None
+
+            conn.close()
+            return exists
+        except Exception as e:
+            print(f"خطا در بررسی زمان‌بندی‌های دقیقه {utc_minute}: {e}")
+            return False
+
+    def get_schedule_timezones(self) -> List[str]:
+        """دریافت منطقه‌های زمانی که حداقل یک زمان‌بندی دارند"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT DISTINCT COALESCE(us.timezone, ?) AS timezone
+                FROM notification_schedules ns
+                LEFT JOIN user_settings us ON ns.user_id = us.user_id
+            ''', (TIMEZONE,))
+
+            timezones = [row['timezone'] for row in cursor.fetchall()]
+
+            conn.close()
+            return timezones
+        except Exception as e:
+            print(f"خطا در دریافت منطقه‌های زمانی: {e}")
+            return []
+
+    def get_schedules_with_timezone(self, timezone: str = None,
+                                    user_id: int = None) -> List[Dict[str, Any]]:
+        """دریافت زمان‌بندی‌ها به همراه منطقه زمانی کاربر (فیلتر اختیاری بر اساس منطقه یا کاربر)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            query = '''
+                SELECT ns.id, ns.notification_time, ns.utc_minute,
+                       COALESCE(us.timezone, ?) AS timezone
+                FROM notification_schedules ns
+                LEFT JOIN user_settings us ON ns.user_id = us.user_id
+                WHERE 1 = 1
+            '''
+            params = [TIMEZONE]
+            if timezone is not None:
+                query += ' AND COALESCE(us.timezone, ?) = ?'
+                params += [TIMEZONE, timezone]
+            if user_id is not None:
+                query += ' AND ns.user_id = ?'
+                params.append(user_id)
+
+            cursor.execute(query, params)
+            schedules = [dict(row) for row in cursor.fetchall()]
+
+            conn.close()
+            return schedules
+        except Exception as e:
+            print(f"خطا در دریافت زمان‌بندی‌ها با منطقه زمانی: {e}")
+            return []
+
+    def update_schedule_utc_minutes(self, minutes: Dict[int, int]) -> bool:
+        """به‌روزرسانی دسته‌ای دقیقه UTC زمان‌بندی‌ها ({schedule_id: utc_minute})"""
+        try:
+            if not minutes:
+                return True
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.executemany(
+                'UPDATE notification_schedules SET utc_minute = ? WHERE id = ?',
+                [(utc_minute, schedule_id) for schedule_id, utc_minute in minutes.items()]
+            )
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در به‌روزرسانی دقیقه UTC زمان‌بندی‌ها: {e}")
+            return False
+
+    def toggle_schedule_status(self, schedule_id: int) -> bool:
+        """تغییر وضعیت فعال/غیرفعال زمان‌بندی"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            # دریافت وضعیت فعلی
+            cursor.execute('SELECT is_active FROM notification_schedules WHERE id = ?', (schedule_id,))
+            row = cursor.fetchone()
+
+            if row:
+                new_status = 0 if row['is_active'] == 1 else 1
+                cursor.execute('''
+                    UPDATE notification_schedules
+                    SET is_active = ?
+                    WHERE id = ?
+                ''', (new_status, schedule_id))
+
+                conn.commit()
+                conn.close()
+                return True
+
+            conn.close()
+            return False
+        except Exception as e:
+            print(f"خطا در تغییر وضعیت زمان‌بندی: {e}")
+            return False
+
+    def get_schedule(self, schedule_id: int) -> Optional[Dict[str, Any]]:
+        """دریافت یک زمان‌بندی"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT id, user_id, notification_time, is_active, change_mode, change_threshold,
+                       utc_minute
+                FROM notification_schedules
+                WHERE id = ?
+            ''', (schedule_id,))
+            row = cursor.fetchone()
+
+            conn.close()
+
+            if row:
+                return dict(row)
+            return None
+        except Exception as e:
+            print(f"خطا در دریافت زمان‌بندی: {e}")
+            return None
+
+    def update_schedule_change_mode(self, schedule_id: int, change_mode: str,
+                                    change_threshold: float = None) -> bool:
+        """تغییر حالت ارسال زمان‌بندی (always / skip / brief)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                UPDATE notification_schedules
+                SET change_mode = ?, change_threshold = ?
+                WHERE id = ?
+            ''', (change_mode, change_threshold, schedule_id))
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در تغییر حالت زمان‌بندی: {e}")
+            return False
+
+    # توابع آخرین قیمت‌های ارسال شده
+
+    def get_last_delivered_prices(self, user_ids: List[int]) -> Dict[int, Dict[str, float]]:
+        """
+        دریافت آخرین قیمت‌های ارسال شده برای گروهی از کاربران
+
+        ردیف‌های قدیمی که آرایه‌ای به ترتیب ASSET_SLOTS آن زمان ذخیره کرده‌اند نادیده
+        گرفته می‌شوند (ترتیب خانه‌ها ممکن است تغییر کرده باشد)؛ گزارش بعدی کامل ارسال
+        و ردیف با کلید خانه‌ها بازنویسی می‌شود.
+        """
+        try:
+            if not user_ids:
+                return {}
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            result = {}
+            # تقسیم به بخش‌های کوچک به خاطر محدودیت تعداد پارامترهای SQLite
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(
+                    f'SELECT user_id, prices FROM last_delivered_prices WHERE user_id IN ({placeholders})',
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    prices = json.loads(row['prices'])
+                    if isinstance(prices, dict):
+                        result[row['user_id']] = prices
+
+            conn.close()
+            return result
+        except Exception as e:
+            print(f"خطا در دریافت آخرین قیمت‌های ارسال شده: {e}")
+            return {}
+
+    def save_last_delivered_prices(self, prices_by_user: Dict[int, Dict[str, float]]) -> bool:
+        """ذخیره آخرین قیمت‌های ارسال شده برای گروهی از کاربران در یک تراکنش"""
+        try:
+            if not prices_by_user:
+                return True
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                INSERT INTO last_delivered_prices (user_id, prices, delivered_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    prices = excluded.prices,
+                    delivered_at = excluded.delivered_at
+            ''', [(user_id, json.dumps(prices, separators=(',', ':')))
+                  for user_id, prices in prices_by_user.items()])
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در ذخیره آخرین قیمت‌های ارسال شده: {e}")
+            return False
+
+    # توابع صف پایدار ارسال (outbox)
+
+    def create_outbox_job(self, job_key: str, job_type: str, payload: Dict[str, Any],
+                          user_ids: List[int]) -> bool:
+        """ثبت یک job ارسال و اقلام آن به صورت دسته‌ای (تکرار job_key اثری ندارد)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR IGNORE INTO outbox_jobs (job_key, job_type, payload)
+                VALUES (?, ?, ?)
+            ''', (job_key, job_type, json.dumps(payload, ensure_ascii=False)))
+
+            cursor.executemany('''
+                INSERT OR IGNORE INTO outbox (job_key, user_id)
+                VALUES (?, ?)
+            ''', [(job_key, user_id) for user_id in user_ids])
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در ثبت job ارسال: {e}")
+            return False
+
+    def get_outbox_pending(self, job_key: str) -> List[int]:
+        """کاربرانی از یک job که هنوز برایشان ارسال نشده"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT user_id FROM outbox
+                WHERE job_key = ? AND status = 'pending'
+            ''', (job_key,))
+            users = [row['user_id'] for row in cursor.fetchall()]
+
+            conn.close()
+            return users
+        except Exception as e:
+            print(f"خطا در دریافت اقلام outbox: {e}")
+            return []
+
+    def mark_outbox_items(self, job_key: str, statuses: Dict[int, str]) -> bool:
+        """ثبت دسته‌ای وضعیت اقلام یک job در یک تراکنش"""
+        try:
+            if not statuses:
+                return True
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                UPDATE outbox SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_key = ? AND user_id = ?
+            ''', [(status, job_key, user_id) for user_id, status in statuses.items()])
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در به‌روزرسانی outbox: {e}")
+            return False
+
+    def complete_outbox_job(self, job_key: str, expire_pending: bool = False) -> bool:
+        """
+        بستن job در صورت نداشتن قلم در انتظار
+
+        Args:
+            expire_pending: اقلام باقی‌مانده منقضی شوند (مثلاً گزارش روزانه خیلی دیر شده)
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            if expire_pending:
+                cursor.execute('''
+                    UPDATE outbox SET status = 'expired', updated_at = CURRENT_TIMESTAMP
+                    WHERE job_key = ? AND status = 'pending'
+                ''', (job_key,))
+
+            cursor.execute('''
+                UPDATE outbox_jobs SET completed_at = CURRENT_TIMESTAMP
+                WHERE job_key = ? AND completed_at IS NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM outbox WHERE job_key = ? AND status = 'pending'
+                )
+            ''', (job_key, job_key))
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در بستن job ارسال: {e}")
+            return False
+
+    def get_unfinished_outbox_jobs(self) -> List[Dict[str, Any]]:
+        """job های ارسال نیمه‌تمام (برای از سرگیری بعد از ری‌استارت)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT job_key, job_type, payload, created_at,
+                       (julianday('now') - julianday(created_at)) * 86400 AS age_seconds
+                FROM outbox_jobs
+                WHERE completed_at IS NULL
+                ORDER BY created_at
+            ''')
+
+            jobs = []
+            for row in cursor.fetchall():
+                job = dict(row)
+                job['payload'] = json.loads(job['payload']) if job.get('payload') else {}
+                jobs.append(job)
+
+            conn.close()
+            return jobs
+        except Exception as e:
+            print(f"خطا در دریافت job های نیمه‌تمام: {e}")
+            return []
+
+    def get_outbox_stats(self) -> Dict[str, Any]:
+        """عمق و قدمت صف پایدار ارسال (برای مانیتورینگ)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT COUNT(*) AS pending,
+                       (julianday('now') - julianday(MIN(created_at))) * 86400 AS oldest_age_seconds
+                FROM outbox
+                WHERE status = 'pending'
+            ''')
+            row = cursor.fetchone()
+
+            cursor.execute('SELECT COUNT(*) AS count FROM outbox_jobs WHERE completed_at IS NULL')
+            unfinished_jobs = cursor.fetchone()['count']
+
+            conn.close()
+
+            return {
+                'pending': row['pending'],
+                'oldest_age_seconds': int(row['oldest_age_seconds'] or 0),
+                'unfinished_jobs': unfinished_jobs
+            }
+        except Exception as e:
+            print(f"خطا در دریافت آمار outbox: {e}")
+            return {}
+
+    def purge_outbox(self, days: int = 7) -> int:
+        """حذف job های تکمیل شده قدیمی‌تر از n روز"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                DELETE FROM outbox WHERE job_key IN (
+                    SELECT job_key FROM outbox_jobs
+                    WHERE completed_at IS NOT NULL
+                    AND completed_at < datetime('now', '-' || ? || ' days')
+                )
+            ''', (days,))
+            deleted = cursor.rowcount
+
+            cursor.execute('''
+                DELETE FROM outbox_jobs
+                WHERE completed_at IS NOT NULL
+                AND completed_at < datetime('now', '-' || ? || ' days')
+            ''', (days,))
+
+            conn.commit()
+            conn.close()
+            return deleted
+        except Exception as e:
+            print(f"خطا در پاک‌سازی outbox: {e}")
+            return 0
+
+    # توابع کاربران غیرقابل دسترس
+
+    def deactivate_users(self, user_ids: List[int]) -> int:
+        """غیرفعال کردن دسته‌ای کاربران غیرقابل دسترس و زمان‌بندی‌هایشان"""
+        try:
+            if not user_ids:
+                return 0
+
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            deactivated = 0
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+
+                cursor.execute(f'''
+                    UPDATE users SET is_active = 0, deactivated_at = CURRENT_TIMESTAMP
+                    WHERE is_active = 1 AND user_id IN ({placeholders})
+                ''', chunk)
+                deactivated += cursor.rowcount
+
+                cursor.execute(f'''
+                    UPDATE notification_schedules SET is_active = 0, auto_disabled = 1
+                    WHERE is_active = 1 AND user_id IN ({placeholders})
+                ''', chunk)
+
+            conn.commit()
+            conn.close()
+            return deactivated
+        except Exception as e:
+            print(f"خطا در غیرفعال کردن کاربران: {e}")
+            return 0
+
+    def reactivate_user(self, user_id: int) -> bool:
+        """
+        فعال کردن دوباره کاربری که خودکار غیرفعال شده بود
+
+        Returns:
+            True اگر کاربر واقعاً غیرفعال بوده و دوباره فعال شد
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                UPDATE users SET is_active = 1, deactivated_at = NULL
+                WHERE user_id = ? AND deactivated_at IS NOT NULL
+            ''', (user_id,))
+            reactivated = cursor.rowcount > 0
+
+            if reactivated:
+                cursor.execute('''
+                    UPDATE notification_schedules SET is_active = 1, auto_disabled = 0
+                    WHERE user_id = ? AND auto_disabled = 1
+                ''', (user_id,))
+
+            conn.commit()
+            conn.close()
+            return reactivated
+        except Exception as e:
+            print(f"خطا در فعال‌سازی دوباره کاربر: {e}")
+            return False
+
+    def get_unreachable_stats(self) -> Dict[str, int]:
+        """ظرفیت آزاد شده با غیرفعال‌سازی خودکار کاربران غیرقابل دسترس"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT COUNT(*) AS count FROM users
+                WHERE is_active = 0 AND deactivated_at IS NOT NULL
+            ''')
+            unreachable_users = cursor.fetchone()['count']
+
+            cursor.execute('''
+                SELECT COUNT(*) AS count FROM notification_schedules
+                WHERE is_active = 0 AND auto_disabled = 1
+            ''')
+            disabled_schedules = cursor.fetchone()['count']
+
+            conn.close()
+
+            return {
+                'unreachable_users': unreachable_users,
+                'disabled_schedules': disabled_schedules
+            }
+        except Exception as e:
+            print(f"خطا در دریافت آمار کاربران غیرقابل دسترس: {e}")
+            return {}
+
+    # توابع lease (انتخاب leader بین worker ها)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        گرفتن یا تمدید lease
+
+        Returns:
+            True اگر owner بعد از این فراخوانی صاحب lease باشد
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            now = time.time()
+            cursor.execute('''
+                INSERT INTO leader_leases (name, owner, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE leader_leases.owner = excluded.owner OR leader_leases.expires_at < ?
+            ''', (name, owner, now + ttl, now))
+            acquired = cursor.rowcount > 0
+
+            conn.commit()
+            conn.close()
+            return acquired
+        except Exception as e:
+            print(f"خطا در گرفتن lease: {e}")
+            return False
+
+    def release_lease(self, name: str, owner: str) -> bool:
+        """آزاد کردن lease (فقط توسط صاحب آن)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute('DELETE FROM leader_leases WHERE name = ? AND owner = ?', (name, owner))
+
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"خطا در آزاد کردن lease: {e}")
             return False
@@ -0,0 +1,300 @@
+"""
+صف ارسال هم‌زمان پیام‌های تلگرام با رعایت محدودیت نرخ
+"""
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import (
+    DELIVERY_WORKERS, DELIVERY_RATE_LIMIT, DELIVERY_CHAT_INTERVAL, DELIVERY_MAX_RETRIES,
+    DELIVERY_DRAIN_TIMEOUT
+)
+from priority import BULK, INTERACTIVE, LANES, WaitHistogram
+
+logger = logging.getLogger(__name__)
+
+
+# متن خطاهای BadRequest که یعنی چت دیگر در دسترس نیست
+PERMANENT_BAD_REQUESTS = (
+    'chat not found',
+    'user not found',
+    'peer_id_invalid',
+    'user is deactivated',
+)
+
+
+class UnreachableChat(Exception):
+    """چت به صورت دائمی در دسترس نیست (بلاک، حساب حذف شده، چت پیدا نشد)"""
+
+    def __init__(self, chat_id: int, error: Exception):
+        super().__init__(f"چت {chat_id} در دسترس نیست: {error}")
+        self.chat_id = chat_id
+        self.error = error
+
+
+class QueueStopped(RuntimeError):
+    """صف ارسال متوقف شده است؛ پیام ارسال نشده و در outbox در انتظار می‌ماند"""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    دسته‌بندی خطای تلگرام
+
+    Returns:
+        'permanent' (غیرفعال کردن کاربر)، 'transient' (تلاش مجدد) یا 'failed'
+    """
+    if isinstance(error, Forbidden):
+        return 'permanent'
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if any(text in message for text in PERMANENT_BAD_REQUESTS):
+            return 'permanent'
+        return 'failed'
+    if isinstance(error, NetworkError):
+        # TimedOut و خطاهای موقت شبکه
+        return 'transient'
+    return 'failed'
+
+
+class TokenBucket:
+    """سطل توکن سراسری برای محدود کردن تعداد پیام در ثانیه"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """صبر تا آزاد شدن یک توکن"""
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DeliveryJob:
+    """یک پیام در صف ارسال"""
+
+    __slots__ = ('chat_id', 'send', 'future', 'attempts', 'lane', 'submitted_at')
+
+    def __init__(self, chat_id: int, send: Callable[[], Awaitable[Any]], future: asyncio.Future,
+                 lane: str = BULK):
+        self.chat_id = chat_id
+        self.send = send
+        self.future = future
+        self.attempts = 0
+        self.lane = lane
+        self.submitted_at = time.monotonic()
+
+
+class DeliveryQueue:
+    """
+    صف ارسال با مجموعه محدودی از worker ها
+
+    - سطل توکن سراسری (حدود 30 پیام در ثانیه مجاز تلگرام)
+    - فاصله حداقلی بین دو پیام به یک چت
+    - مدیریت خودکار RetryAfter (flood wait) و بازگرداندن پیام به صف
+    - تلاش مجدد برای خطاهای موقت و گزارش UnreachableChat برای چت‌های غیرقابل دسترس
+    - پیام‌های lane ی interactive همیشه جلوتر از پیام‌های انبوه (bulk) ارسال می‌شوند
+    """
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, rate: float = DELIVERY_RATE_LIMIT,
+                 chat_interval: float = DELIVERY_CHAT_INTERVAL,
+                 max_retries: int = DELIVERY_MAX_RETRIES):
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._tasks = []
+        self._chat_next_at: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self._pending = 0
+        self._futures = set()
+        self._closed = False
+        self._idle: Optional[asyncio.Event] = None
+        self.stats = {'sent': 0, 'failed': 0, 'retry_after': 0, 'retried': 0, 'unreachable': 0}
+        self.wait_stats = {lane: WaitHistogram() for lane in LANES}
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def accepting(self) -> bool:
+        """صف پیام جدید می‌پذیرد (راه‌اندازی شده و close نشده)"""
+        return bool(self._tasks) and not self._closed
+
+    @property
+    def pending(self) -> int:
+        """تعداد پیام‌های ثبت شده‌ای که هنوز نتیجه‌شان مشخص نشده"""
+        return self._pending
+
+    def lane_stats(self) -> Dict[str, Dict[str, float]]:
+        """هیستوگرام زمان انتظار در صف برای هر lane"""
+        return {lane: histogram.summary() for lane, histogram in self.wait_stats.items()}
+
+    async def start(self):
+        """راه‌اندازی worker ها"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"صف ارسال با {self.workers} worker راه‌اندازی شد")
+
+    def close(self):
+        """توقف پذیرش پیام جدید (submit از این به بعد QueueStopped می‌دهد)"""
+        self._closed = True
+
+    async def stop(self, drain: bool = True, timeout: float = DELIVERY_DRAIN_TIMEOUT):
+        """
+        توقف worker ها
+
+        Args:
+            drain: انتظار برای ارسال پیام‌های داخل صف
+            timeout: حداکثر انتظار برای خالی شدن صف (ثانیه)؛ پیام‌های باقی‌مانده با
+                QueueStopped کامل می‌شوند تا در outbox در انتظار بمانند
+        """
+        if not self._tasks:
+            return
+        self.close()
+        if drain and self._pending:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self._pending} پیام تا پایان مهلت توقف صف ارسال نشد")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # پیام‌های داخل صف یا در انتظار تلاش مجدد (ممکن است پیام در حال ارسال به دست
+        # کاربر رسیده باشد؛ از سرگیری outbox در بدترین حالت آن را تکرار می‌کند)
+        for future in list(self._futures):
+            if not future.done():
+                future.set_exception(QueueStopped("صف ارسال متوقف شد"))
+
+    def submit(self, chat_id: int, send: Callable[[], Awaitable[Any]],
+               lane: str = BULK) -> asyncio.Future:
+        """
+        ثبت یک پیام در صف
+
+        Args:
+            chat_id: شناسه چت مقصد (برای فاصله‌گذاری بین پیام‌های یک چت)
+            send: تابعی که با هر بار فراخوانی یک coroutine ارسال برمی‌گرداند
+            lane: INTERACTIVE برای پاسخ به کاربر، BULK برای ارسال انبوه
+
+        Returns:
+            Future که با نتیجه ارسال یا خطای آن کامل می‌شود
+        """
+        if not self.accepting:
+            raise QueueStopped("صف ارسال راه‌اندازی نشده یا متوقف شده است")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        self._futures.add(future)
+        self._idle.clear()
+        future.add_done_callback(self._on_done)
+        self._put(DeliveryJob(chat_id, send, future, lane))
+        return future
+
+    def _put(self, job: DeliveryJob):
+        priority = 0 if job.lane == INTERACTIVE else 1
+        self._queue.put_nowait((priority, next(self._sequence), job))
+
+    def _on_done(self, future: asyncio.Future):
+        self._pending -= 1
+        self._futures.discard(future)
+        if self._pending == 0:
+            self._idle.set()
+
+    def _requeue(self, job: DeliveryJob, delay: float):
+        """بازگرداندن پیام به صف بعد از تاخیر (بدون اشغال worker)"""
+        asyncio.get_running_loop().call_later(delay, self._put, job)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, job: DeliveryJob):
+        if job.future.done():
+            return
+
+        now = time.monotonic()
+        wait = max(self._paused_until, self._chat_next_at.get(job.chat_id, 0.0)) - now
+        if wait > 0:
+            self._requeue(job, wait)
+            return
+
+        await self._bucket.acquire()
+
+        now = time.monotonic()
+        if job.attempts == 0:
+            self.wait_stats[job.lane].observe(now - job.submitted_at)
+        self._chat_next_at[job.chat_id] = now + self.chat_interval
+        if len(self._chat_next_at) > 10000:
+            self._chat_next_at = {
+                chat_id: next_at for chat_id, next_at in self._chat_next_at.items() if next_at > now
+            }
+
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self.stats['retry_after'] += 1
+            # flood wait برای کل ربات اعمال می‌شود
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logger.warning(f"محدودیت نرخ تلگرام: توقف ارسال برای {retry_after} ثانیه")
+
+            job.attempts += 1
+            if job.attempts <= self.max_retries:
+                self._requeue(job, retry_after)
+            else:
+                self.stats['failed'] += 1
+                job.future.set_exception(e)
+            return
+        except Exception as e:
+            kind = classify_error(e)
+
+            if kind == 'transient' and job.attempts < self.max_retries:
+                job.attempts += 1
+                self.stats['retried'] += 1
+                self._requeue(job, min(2 ** job.attempts, 30))
+                return
+
+            self.stats['failed'] += 1
+            if kind == 'permanent':
+                self.stats['unreachable'] += 1
+                job.future.set_exception(UnreachableChat(job.chat_id, e))
+            else:
+                job.future.set_exception(e)
+            return
+
+        self.stats['sent'] += 1
+        job.future.set_result(result)
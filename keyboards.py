@@ -0,0 +1,209 @@
+"""
+کیبوردهای ربات
+
+- کیبوردهای ثابت یک بار هنگام import ساخته می‌شوند (اشیای کیبورد در
+  python-telegram-bot تغییرناپذیرند و بین کاربران به اشتراک گذاشته می‌شوند)
+- در کیبوردهای انتخاب دارایی، انتخاب کاربر به صورت bitmask روی ترتیب ثابت
+  دارایی‌ها نمایش داده می‌شود و کیبورد هر (منو، bitmask) فقط یک بار ساخته می‌شود
+"""
+import functools
+from typing import Iterable, List, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+from config import (
+    CHANNEL_ID, CRYPTO_SYMBOLS, TOP_10_CRYPTOS, FIAT_CURRENCIES, GOLD_COINS, GOLD_ITEMS, PRESET_TIMES,
+    TIMEZONE_CHOICES
+)
+
+# حداکثر کیبوردهای نگهداری شده برای هر منوی انتخاب
+PICKER_CACHE_SIZE = 1024
+
+
+def rows(buttons: List[InlineKeyboardButton], columns: int) -> List[List[InlineKeyboardButton]]:
+    """تقسیم دکمه‌ها به ردیف‌های columns تایی"""
+    return [buttons[i:i + columns] for i in range(0, len(buttons), columns)]
+
+
+class SelectionPicker:
+    """
+    کیبورد انتخاب/لغو چند دارایی
+
+    Args:
+        options: لیست (شناسه، برچسب) به ترتیب نمایش
+        callback_prefix: پیشوند callback_data دکمه هر دارایی
+        columns: تعداد دکمه در هر ردیف
+        done_text: متن دکمه پایانی
+    """
+
+    def __init__(self, options: List[Tuple[str, str]], callback_prefix: str, columns: int = 1,
+                 done_text: str = "✔️ تأیید و ادامه", done_data: str = 'select_assets_main'):
+        self.options = options
+        self.callback_prefix = callback_prefix
+        self.columns = columns
+        self.done_button = InlineKeyboardButton(done_text, callback_data=done_data)
+        self.bits = {asset_id: 1 << i for i, (asset_id, _) in enumerate(options)}
+        self.markup = functools.lru_cache(maxsize=PICKER_CACHE_SIZE)(self._build)
+
+    def mask(self, selected: Iterable[str]) -> int:
+        """bitmask دارایی‌های انتخاب شده (دارایی‌های خارج از این منو نادیده گرفته می‌شوند)"""
+        mask = 0
+        for asset_id in selected or ():
+            mask |= self.bits.get(asset_id, 0)
+        return mask
+
+    def _build(self, mask: int) -> InlineKeyboardMarkup:
+        buttons = [
+            InlineKeyboardButton(
+                f"{'☑️' if mask & self.bits[asset_id] else '⬜️'} {label}",
+                callback_data=f'{self.callback_prefix}{asset_id}'
+            )
+            for asset_id, label in self.options
+        ]
+        return InlineKeyboardMarkup(rows(buttons, self.columns) + [[self.done_button]])
+
+    def keyboard(self, selected: Iterable[str]) -> InlineKeyboardMarkup:
+        return self.markup(self.mask(selected))
+
+
+# منوهای انتخاب دارایی
+CRYPTO_PICKER = SelectionPicker(list(CRYPTO_SYMBOLS.items()), 'toggle_crypto_', columns=2)
+TOP_10_PICKER = SelectionPicker(
+    [(crypto, CRYPTO_SYMBOLS.get(crypto, crypto.upper())) for crypto in TOP_10_CRYPTOS], 'toggle_crypto_'
+)
+FIAT_PICKER = SelectionPicker(
+    [(fiat_id, f"{info['flag']} {info['symbol']}") for fiat_id, info in FIAT_CURRENCIES.items()],
+    'toggle_fiat_', columns=2
+)
+GOLD_COIN_PICKER = SelectionPicker(
+    [(coin_id, info['name']) for coin_id, info in GOLD_COINS.items()], 'toggle_coin_'
+)
+GOLD_ITEM_PICKER = SelectionPicker(
+    [(item_id, info['name']) for item_id, info in GOLD_ITEMS.items()], 'toggle_gold_item_'
+)
+GOLD_SILVER_PICKER = SelectionPicker(
+    [('gold', '🥇 طلا'), ('silver', '🥈 نقره')], 'toggle_asset_', done_text="✔️ تأیید و بازگشت"
+)
+USD_PICKER = SelectionPicker(
+    [('usd', '💵 دلار آمریکا')], 'toggle_asset_', done_text="✔️ تأیید و بازگشت"
+)
+
+
+# منوی اصلی (keyboard پایین صفحه)
+MAIN_MENU_KEYBOARD = ReplyKeyboardMarkup([
+    ['📤 ارسال قیمت الان'],
+    ['🕒 تنظیم زمان ارسال روزانه پیام', '🔔 اعلان تغییر قیمت'],
+    ['❓ راهنما', '⚙️ تنظیمات'],
+    ['👤 پشتیبانی']
+], resize_keyboard=True)
+
+MEMBERSHIP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔗 عضویت در کانال", url=f"https://t.me/{CHANNEL_ID.replace('@', '')}")],
+    [InlineKeyboardButton("✅ عضو شدم", callback_data='check_membership')]
+])
+
+MAIN_MENU_INLINE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📤 ارسال قیمت الان", callback_data='send_prices_now')],
+    [InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main')],
+    [InlineKeyboardButton("⏰ زمان‌بندی", callback_data='setup_schedule')],
+    [InlineKeyboardButton("⚙️ تنظیمات", callback_data='open_settings')]
+])
+
+# زیر پیام قیمت‌ها
+_PRICE_ACTIONS = [
+    InlineKeyboardButton("📋 انتخاب ارزها", callback_data='select_assets_main'),
+    InlineKeyboardButton("⏰ زمان‌بندی ارسال", callback_data='setup_schedule')
+]
+PRICE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')], _PRICE_ACTIONS
+])
+PRICE_RETRY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')], _PRICE_ACTIONS
+])
+SCHEDULED_PRICE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 به‌روزرسانی", callback_data='refresh_prices')]
+])
+SCHEDULED_PRICE_RETRY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 تلاش مجدد", callback_data='refresh_prices')]
+])
+
+
+def price_keyboard(has_error: bool) -> InlineKeyboardMarkup:
+    return PRICE_RETRY_KEYBOARD if has_error else PRICE_KEYBOARD
+
+
+def scheduled_price_keyboard(has_error: bool) -> InlineKeyboardMarkup:
+    return SCHEDULED_PRICE_RETRY_KEYBOARD if has_error else SCHEDULED_PRICE_KEYBOARD
+
+
+# انتخاب دارایی
+ASSET_TYPES_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💰 ارز دیجیتال (Cryptocurrency)", callback_data='asset_type_crypto')],
+    [InlineKeyboardButton("🥇 طلا و نقره", callback_data='asset_type_gold_silver')],
+    [InlineKeyboardButton("💵 دلار", callback_data='asset_type_usd')],
+    [InlineKeyboardButton("💱 ارزهای فیات", callback_data='asset_type_fiat')],
+    [InlineKeyboardButton("🪙 سکه‌های طلا", callback_data='asset_type_gold_coins')],
+    [InlineKeyboardButton("✨ طلا (گرمی، مثقال، اونس)", callback_data='asset_type_gold_items')],
+    [InlineKeyboardButton("📊 بورس ایران (به زودی)", callback_data='asset_type_stock')],
+    [InlineKeyboardButton("🔙 بازگشت", callback_data='back_to_main')]
+])
+
+CRYPTO_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⭐️ ۵ ارز برتر بازار", callback_data='crypto_top5')],
+    [InlineKeyboardButton("🔟 ارزهای منتخب بازار", callback_data='crypto_top10')],
+    [InlineKeyboardButton("✍️ انتخاب دستی", callback_data='crypto_manual')],
+    [InlineKeyboardButton("🔙 بازگشت", callback_data='select_assets_main')]
+])
+
+CRYPTO_TOP5_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✍️ ویرایش دستی", callback_data='crypto_manual')],
+    [InlineKeyboardButton("✔️ تأیید و ادامه", callback_data='select_assets_main')]
+])
+
+# زمان‌بندی
+_ADD_SCHEDULE_BUTTON = InlineKeyboardButton("➕ افزودن زمان جدید", callback_data='add_schedule_time')
+_BACK_TO_MAIN_BUTTON = InlineKeyboardButton("🔙 بازگشت", callback_data='back_to_main')
+SCHEDULES_KEYBOARD = InlineKeyboardMarkup([
+    [_ADD_SCHEDULE_BUTTON],
+    [InlineKeyboardButton("🗑 مدیریت تایم‌ها", callback_data='manage_schedules')],
+    [_BACK_TO_MAIN_BUTTON]
+])
+SCHEDULES_EMPTY_KEYBOARD = InlineKeyboardMarkup([[_ADD_SCHEDULE_BUTTON], [_BACK_TO_MAIN_BUTTON]])
+
+PRESET_TIMES_KEYBOARD = InlineKeyboardMarkup(
+    rows([InlineKeyboardButton(f"🕐 {time_str}", callback_data=f'set_time_{time_str}') for time_str in PRESET_TIMES], 2)
+    + [[InlineKeyboardButton("🔙 بازگشت", callback_data='setup_schedule')]]
+)
+
+SCHEDULE_ADDED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ افزودن تایم دیگر", callback_data='add_schedule_time')],
+    [InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_main')]
+])
+
+SETUP_SCHEDULE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏰ تنظیم زمان‌بندی", callback_data='setup_schedule')]
+])
+
+# تنظیمات
+SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🗑 حذف دارایی از لیست", callback_data='remove_assets')],
+    [InlineKeyboardButton("🕒 تغییر زمان ارسال", callback_data='setup_schedule')],
+    [InlineKeyboardButton("🌍 تغییر منطقه زمانی", callback_data='timezone_menu')],
+    [InlineKeyboardButton("🔕 حذف اعلان تغییر قیمت", callback_data='disable_notification')],
+    [InlineKeyboardButton("🔙 بازگشت به منو", callback_data='back_to_main')]
+])
+
+BACK_TO_SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔙 بازگشت به تنظیمات", callback_data='open_settings')]
+])
+
+
+@functools.lru_cache(maxsize=None)
+def timezone_keyboard(current: str) -> InlineKeyboardMarkup:
+    """لیست منطقه‌های زمانی با علامت منطقه فعلی کاربر"""
+    keyboard = [
+        [InlineKeyboardButton(f"{'✅ ' if timezone == current else ''}{name}", callback_data=f'set_tz_{timezone}')]
+        for timezone, name in TIMEZONE_CHOICES.items()
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت به تنظیمات", callback_data='open_settings')])
+    return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,284 @@
+"""
+snapshot مشترک قیمت‌های بازار در یک فایل memory-mapped با چیدمان ثابت
+
+چیدمان فایل:
+    header: magic (4 بایت) | تعداد خانه‌ها (uint32) | hash چیدمان خانه‌ها (uint64) | seq (uint64) |
+            زمان انتشار (double)
+    برای هر خانه ASSET_SLOTS: قیمت | تغییر 24 ساعته | زمان به‌روزرسانی (سه double)
+
+نویسنده (فقط worker ی که leader است) قبل از نوشتن seq را فرد و بعد از آن
+زوج می‌کند (seqlock). خواننده‌ها در پردازه‌های دیگر بدون قفل مستقیم از
+حافظه مشترک می‌خوانند و اگر seq در طول خواندن عوض شده باشد دوباره
+تلاش می‌کنند؛ بنابراین هیچ‌وقت نیمی از یک انتشار را نمی‌بینند.
+"""
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    ASSET_SLOTS, CRYPTO_SYMBOLS, FIAT_CURRENCIES, GOLD_COINS, GOLD_ITEMS,
+    MARKET_SNAPSHOT_PATH, MARKET_SNAPSHOT_MAX_AGE
+)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ARZS'
+HEADER = struct.Struct('<4sIQQd')
+SEQ_OFFSET = 16
+SEQ = struct.Struct('<Q')
+PUBLISHED_AT = struct.Struct('<d')
+SLOT_FIELDS = 3
+
+# حداکثر تلاش خواننده وقتی هم‌زمان با نوشتن می‌خواند
+MAX_READ_RETRIES = 100
+
+MISSING = float('nan')
+
+
+def layout_hash(slots: List[str]) -> int:
+    """hash ترتیب و نام خانه‌ها؛ با تغییر لیست دارایی‌ها در config تغییر می‌کند حتی اگر تعداد ثابت بماند"""
+    return int.from_bytes(hashlib.blake2b('\n'.join(slots).encode(), digest_size=8).digest(), 'little')
+
+
+def slot_values(prices: Dict) -> Dict[str, tuple]:
+    """تبدیل خروجی get_all_prices به (قیمت، تغییر) برای هر خانه ASSET_SLOTS"""
+    values = {}
+
+    for key in ('usd_irr', 'gold', 'silver'):
+        if prices.get(key) and prices[key].get('price') is not None:
+            values[key] = (prices[key]['price'], prices[key].get('change_24h') or 0)
+
+    for crypto_id, data in (prices.get('cryptos') or {}).items():
+        if data.get('price') is not None:
+            values[f'crypto:{crypto_id}'] = (data['price'], data.get('change_24h') or 0)
+        if data.get('price_toman'):
+            values[f'crypto_irt:{crypto_id}'] = (
+                data['price_toman'], data.get('change_24h_toman', data.get('change_24h')) or 0
+            )
+
+    for fiat_id, data in (prices.get('fiat_currencies') or {}).items():
+        if data.get('buy') is not None:
+            values[f'fiat:{fiat_id}'] = (data['buy'], 0)
+
+    for coin_id, data in (prices.get('gold_coins') or {}).items():
+        if data.get('buy') is not None:
+            values[f'coin:{coin_id}'] = (data['buy'], 0)
+
+    for item_id, data in (prices.get('gold_items') or {}).items():
+        if data.get('price') is not None:
+            values[f'gold_item:{item_id}'] = (data['price'], 0)
+
+    return values
+
+
+def build_prices(slots: Dict[str, tuple], published_at: float) -> Dict:
+    """
+    بازسازی ساختار get_all_prices از خانه‌های snapshot
+
+    نام و نماد اقلام از config خوانده می‌شود (در snapshot فقط اعداد ذخیره می‌شوند).
+    """
+    result = {
+        'cryptos': {},
+        'gold': None,
+        'silver': None,
+        'usd_irr': None,
+        'fiat_currencies': {},
+        'gold_coins': {},
+        'gold_items': {},
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(published_at))
+    }
+
+    if 'usd_irr' in slots:
+        price, change = slots['usd_irr']
+        result['usd_irr'] = {'price': price, 'change_24h': change, 'unit': 'تومان', 'symbol': '💵'}
+    for key, symbol in (('gold', '🥇'), ('silver', '🥈')):
+        if key in slots:
+            price, change = slots[key]
+            result[key] = {'price': price, 'change_24h': change, 'unit': 'USD/oz', 'symbol': symbol}
+
+    for crypto_id, symbol in CRYPTO_SYMBOLS.items():
+        if f'crypto:{crypto_id}' not in slots:
+            continue
+        price, change = slots[f'crypto:{crypto_id}']
+        data = {'price': price, 'change_24h': change, 'symbol': symbol}
+        if f'crypto_irt:{crypto_id}' in slots:
+            data['price_toman'], data['change_24h_toman'] = slots[f'crypto_irt:{crypto_id}']
+        result['cryptos'][crypto_id] = data
+
+    for key, prefix, assets in (('fiat_currencies', 'fiat', FIAT_CURRENCIES),
+                                ('gold_coins', 'coin', GOLD_COINS)):
+        for asset_id, info in assets.items():
+            if f'{prefix}:{asset_id}' in slots:
+                result[key][asset_id] = {
+                    'name': info['name'], 'buy': slots[f'{prefix}:{asset_id}'][0], 'symbol': info['symbol']
+                }
+
+    for item_id, info in GOLD_ITEMS.items():
+        if f'gold_item:{item_id}' in slots:
+            result['gold_items'][item_id] = {
+                'name': info['name'], 'price': slots[f'gold_item:{item_id}'][0], 'symbol': info['symbol']
+            }
+
+    return result
+
+
+class MarketSnapshot:
+    """
+    snapshot قیمت‌ها در حافظه مشترک بین worker ها
+
+    Args:
+        path: مسیر فایل (در همه worker ها یکسان)
+        max_age: حداکثر قدمت هر قیمت برای استفاده (ثانیه)
+        slots: لیست خانه‌ها (پیش‌فرض ASSET_SLOTS)
+    """
+
+    def __init__(self, path: str = MARKET_SNAPSHOT_PATH, max_age: float = MARKET_SNAPSHOT_MAX_AGE,
+                 slots: List[str] = None):
+        self.path = path
+        self.max_age = max_age
+        self.slots = list(slots or ASSET_SLOTS)
+        self.index = {slot: i for i, slot in enumerate(self.slots)}
+        self.layout = layout_hash(self.slots)
+        self.body = struct.Struct('<' + 'd' * (SLOT_FIELDS * len(self.slots)))
+        self.size = HEADER.size + self.body.size
+        self._mm: Optional[mmap.mmap] = None
+        self._inode = None
+        # آخرین داده خوانده شده (تا تغییر seq دوباره decode نمی‌شود)
+        self._cached_seq = None
+        self._cached_values = None
+        self.stats = {'reads': 0, 'retries': 0, 'publishes': 0}
+
+    def _create(self):
+        """ساخت فایل خالی با چیدمان فعلی (با os.replace تا نگاشت خواننده‌های قبلی خراب نشود)"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self.slots), self.layout, 0, 0.0))
+            f.write(self.body.pack(*([MISSING] * (SLOT_FIELDS * len(self.slots)))))
+        os.replace(tmp_path, self.path)
+
+    def _open(self, create: bool = False) -> bool:
+        if self._mm is not None:
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            if not create:
+                return False
+            self._create()
+            fd = os.open(self.path, os.O_RDWR)
+
+        try:
+            stat = os.fstat(fd)
+            if stat.st_size == self.size:
+                mm = mmap.mmap(fd, self.size)
+                magic, slot_count, layout, _, _ = HEADER.unpack_from(mm, 0)
+                if magic == MAGIC and slot_count == len(self.slots) and layout == self.layout:
+                    self._mm = mm
+                    self._inode = stat.st_ino
+                    return True
+                mm.close()
+        finally:
+            os.close(fd)
+
+        # فایل ساخته شده با چیدمان دیگری (مثلاً تغییر لیست دارایی‌ها در config)
+        if not create:
+            logger.warning(f"چیدمان snapshot بازار در {self.path} با این نسخه سازگار نیست")
+            return False
+        self._create()
+        return self._open()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def publish(self, prices: Dict):
+        """
+        نوشتن قیمت‌های جدید (فقط یک نویسنده: leader)
+
+        اقلامی که در این دور دریافت نشده‌اند مقدار و زمان قبلی خود را نگه می‌دارند.
+        """
+        if not self._open(create=True):
+            return
+
+        mm = self._mm
+        now = time.time()
+        seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+        values = list(self.body.unpack_from(mm, HEADER.size))
+
+        for slot, (price, change) in slot_values(prices).items():
+            i = self.index.get(slot)
+            if i is not None:
+                values[i * SLOT_FIELDS:(i + 1) * SLOT_FIELDS] = (float(price), float(change), now)
+
+        # seq فرد: نوشتن در جریان است
+        SEQ.pack_into(mm, SEQ_OFFSET, seq + 1)
+        self.body.pack_into(mm, HEADER.size, *values)
+        PUBLISHED_AT.pack_into(mm, SEQ_OFFSET + SEQ.size, now)
+        SEQ.pack_into(mm, SEQ_OFFSET, seq + 2)
+        self.stats['publishes'] += 1
+
+    def _read_consistent(self):
+        """خواندن seqlock: (seq، زمان انتشار، مقادیر) یا None"""
+        mm = self._mm
+        for _ in range(MAX_READ_RETRIES):
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if seq % 2 == 0:
+                if seq == self._cached_seq:
+                    return seq, None, None
+                published_at = PUBLISHED_AT.unpack_from(mm, SEQ_OFFSET + SEQ.size)[0]
+                values = self.body.unpack_from(mm, HEADER.size)
+                if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq:
+                    return seq, published_at, values
+            self.stats['retries'] += 1
+        return None
+
+    def read(self) -> Optional[Dict]:
+        """
+        خواندن قیمت‌های تازه (قدیمی‌تر از max_age حذف می‌شوند)
+
+        Returns:
+            ساختار get_all_prices یا None اگر snapshot وجود نداشته باشد
+        """
+        if not self._open():
+            return None
+
+        self.stats['reads'] += 1
+        snapshot = self._read_consistent()
+        if snapshot is None:
+            return None
+
+        seq, published_at, values = snapshot
+        if seq != self._cached_seq:
+            self._cached_seq = seq
+            self._cached_values = (published_at, values)
+        published_at, values = self._cached_values
+
+        now = time.time()
+        if now - published_at > self.max_age:
+            self._reopen_if_replaced()
+            return None
+
+        slots = {}
+        for i, slot in enumerate(self.slots):
+            price, change, updated_at = values[i * SLOT_FIELDS:(i + 1) * SLOT_FIELDS]
+            if not math.isnan(price) and now - updated_at <= self.max_age:
+                slots[slot] = (price, change)
+
+        return build_prices(slots, published_at)
+
+    def _reopen_if_replaced(self):
+        """اگر فایل جایگزین شده باشد (مثلاً توسط نسخه جدید) دفعه بعد دوباره باز می‌شود"""
+        try:
+            if os.stat(self.path).st_ino != self._inode:
+                self.close()
+                self._cached_seq = None
+        except FileNotFoundError:
+            self.close()
+            self._cached_seq = None
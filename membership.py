@@ -0,0 +1,78 @@
+"""
+کش نتیجه بررسی عضویت کاربران در کانال
+
+- عضو بودن (مثبت) و عضو نبودن (منفی) با TTL جداگانه نگه داشته می‌شوند؛
+  TTL منفی کوتاه است تا کاربری که تازه عضو شده زود بتواند ادامه دهد
+- تعداد ورودی‌ها محدود است و قدیمی‌ترین ورودی استفاده نشده حذف می‌شود (LRU)
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import MEMBERSHIP_CACHE_TTL, MEMBERSHIP_CACHE_NEGATIVE_TTL, MEMBERSHIP_CACHE_SIZE
+
+# وضعیت‌هایی که عضو کانال حساب می‌شوند
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+
+class MembershipCache:
+    """
+    کش LRU عضویت کاربران با انقضای زمانی
+
+    Args:
+        positive_ttl: مدت اعتبار نتیجه «عضو است» (ثانیه)
+        negative_ttl: مدت اعتبار نتیجه «عضو نیست» (ثانیه)
+        max_size: حداکثر تعداد کاربران در کش
+    """
+
+    def __init__(self, positive_ttl: float = MEMBERSHIP_CACHE_TTL,
+                 negative_ttl: float = MEMBERSHIP_CACHE_NEGATIVE_TTL,
+                 max_size: int = MEMBERSHIP_CACHE_SIZE):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max(1, max_size)
+        self._entries: OrderedDict = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'updates': 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """نتیجه کش شده یا None اگر وجود نداشته باشد یا منقضی شده باشد"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+
+        is_member, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            self.stats['misses'] += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.stats['hits'] += 1
+        return is_member
+
+    def set(self, user_id: int, is_member: bool):
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def update_status(self, user_id: int, status: str):
+        """به‌روزرسانی از روی وضعیت گزارش شده توسط تلگرام (update های chat_member)"""
+        self.set(user_id, status in MEMBER_STATUSES)
+        self.stats['updates'] += 1
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def hit_rate(self) -> float:
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total * 100 if total else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return dict(self.stats, size=len(self._entries), hit_rate=self.hit_rate())
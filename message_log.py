@@ -0,0 +1,108 @@
+"""
+ثبت گروهی تاریخچه پیام‌ها (write-behind)
+
+به جای یک INSERT و commit برای هر پیام ارسال شده، رویدادها در حافظه جمع
+شده و هر MESSAGE_LOG_BATCH_SIZE ردیف یا هر MESSAGE_LOG_FLUSH_INTERVAL ثانیه
+با یک executemany در یک تراکنش ثبت می‌شوند.
+
+تعداد ردیف‌های در انتظار محدود است: وقتی بافر پر باشد log() تا پایان ثبت
+دسته جاری صبر می‌کند (backpressure) و اگر ثبت ناموفق باشد ردیف جدید کنار
+گذاشته و شمرده می‌شود.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Tuple
+
+from config import MESSAGE_LOG_BATCH_SIZE, MESSAGE_LOG_FLUSH_INTERVAL, MESSAGE_LOG_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+# قالب پیش‌فرض CURRENT_TIMESTAMP در SQLite (UTC)
+SENT_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class MessageLogBuffer:
+    """
+    بافر ثبت تاریخچه پیام‌ها
+
+    Args:
+        adb: AsyncDatabase (یا هر شیء با متد async به نام log_messages)
+        batch_size: ثبت بعد از جمع شدن این تعداد ردیف
+        flush_interval: حداکثر ماندن یک ردیف در بافر (ثانیه)
+        max_pending: حداکثر ردیف‌های در انتظار ثبت
+    """
+
+    def __init__(self, adb, batch_size: int = MESSAGE_LOG_BATCH_SIZE,
+                 flush_interval: float = MESSAGE_LOG_FLUSH_INTERVAL,
+                 max_pending: int = MESSAGE_LOG_MAX_PENDING):
+        self.adb = adb
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        self._rows: List[Tuple[int, str, str]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._timer = None
+        self.stats = {'logged': 0, 'written': 0, 'batches': 0, 'failed': 0, 'dropped': 0, 'waits': 0}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def start(self):
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """توقف و ثبت تمام ردیف‌های باقی‌مانده"""
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        while self._rows:
+            if not await self.flush():
+                logger.error(f"{len(self._rows):,} ردیف تاریخچه پیام هنگام توقف ثبت نشد")
+                break
+
+    async def log(self, user_id: int, message_type: str):
+        """افزودن یک رویداد به بافر"""
+        if len(self._rows) >= self.max_pending:
+            self.stats['waits'] += 1
+            await self.flush()
+            if len(self._rows) >= self.max_pending:
+                self.stats['dropped'] += 1
+                return
+
+        self._rows.append((user_id, message_type, time.strftime(SENT_AT_FORMAT, time.gmtime())))
+        self.stats['logged'] += 1
+        if len(self._rows) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> bool:
+        """ثبت ردیف‌های بافر در یک تراکنش"""
+        async with self._flush_lock:
+            if not self._rows:
+                return True
+
+            rows, self._rows = self._rows, []
+            if await self.adb.log_messages(rows):
+                self.stats['written'] += len(rows)
+                self.stats['batches'] += 1
+                return True
+
+            # بازگرداندن به ابتدای بافر برای تلاش در دور بعد (با رعایت سقف)
+            self.stats['failed'] += 1
+            self._rows = rows + self._rows
+            overflow = len(self._rows) - self.max_pending
+            if overflow > 0:
+                del self._rows[:overflow]
+                self.stats['dropped'] += overflow
+            return False
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"خطا در ثبت گروهی تاریخچه پیام‌ها: {e}")
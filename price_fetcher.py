@@ -7,7 +7,7 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from config import (
     COINGECKO_API, CRYPTO_SYMBOLS, BINANCE_SYMBOLS,
-    FIAT_CURRENCIES, GOLD_COINS, GOLD_ITEMS
+    FIAT_CURRENCIES, GOLD_COINS, GOLD_ITEMS, ASSET_SLOTS
 )
 from bonbast_monitor import BonbastScraper
 
@@ -23,6 +23,8 @@ class PriceFetcher:
         self.bonbast_scraper = BonbastScraper()
         self._bonbast_cache = None
         self._bonbast_cache_time = None
+        # snapshot مشترک بازار در حالت چند worker (market_snapshot.MarketSnapshot)
+        self.snapshot = None
 
     def safe_float(self, value, default: float = 0.0) -> float:
         """تبدیل امن به float با مدیریت None و مقادیر نامعتبر"""
@@ -599,10 +601,14 @@ class PriceFetcher:
                       include_usd: bool = True,
                       fiat_currency_ids: List[str] = None,
                       gold_coin_ids: List[str] = None,
-                      gold_item_ids: List[str] = None) -> Dict:
+                      gold_item_ids: List[str] = None,
+                      use_snapshot: bool = True) -> Dict:
         """
         دریافت تمام قیمت‌ها
 
+        اگر snapshot مشترک بازار تنظیم شده و تازه باشد و همه اقلام خواسته شده
+        را داشته باشد، قیمت‌ها از آن خوانده می‌شوند و درخواستی به APIها ارسال نمی‌شود.
+
         Returns:
             dict: {
                 'cryptos': {...},
@@ -614,6 +620,14 @@ class PriceFetcher:
                 'gold_items': {...}
             }
         """
+        if use_snapshot and self.snapshot is not None:
+            cached = self.select_from_snapshot(
+                self.snapshot.read(), crypto_ids, include_gold, include_silver, include_usd,
+                fiat_currency_ids, gold_coin_ids, gold_item_ids
+            )
+            if cached is not None:
+                return cached
+
         result = {
             'cryptos': {},
             'gold': None,
@@ -664,6 +678,58 @@ class PriceFetcher:
 
         return result
 
+    async def get_market_snapshot(self) -> Dict:
+        """دریافت قیمت تمام اقلام پشتیبانی شده (برای انتشار snapshot مشترک)"""
+        return await self.get_all_prices(
+            crypto_ids=list(CRYPTO_SYMBOLS.keys()),
+            fiat_currency_ids=list(FIAT_CURRENCIES.keys()),
+            gold_coin_ids=list(GOLD_COINS.keys()),
+            gold_item_ids=list(GOLD_ITEMS.keys()),
+            use_snapshot=False
+        )
+
+    @staticmethod
+    def select_from_snapshot(snapshot: Optional[Dict], crypto_ids: List[str] = None,
+                             include_gold: bool = True, include_silver: bool = True,
+                             include_usd: bool = True, fiat_currency_ids: List[str] = None,
+                             gold_coin_ids: List[str] = None,
+                             gold_item_ids: List[str] = None) -> Optional[Dict]:
+        """
+        انتخاب اقلام خواسته شده از snapshot
+
+        Returns:
+            قیمت‌ها با همان ساختار get_all_prices، یا None اگر قلمی در snapshot نباشد
+        """
+        if not snapshot:
+            return None
+
+        result = {
+            'cryptos': {},
+            'gold': None,
+            'silver': None,
+            'usd_irr': None,
+            'fiat_currencies': {},
+            'gold_coins': {},
+            'gold_items': {},
+            'timestamp': snapshot.get('timestamp')
+        }
+
+        for key, ids in (('cryptos', crypto_ids), ('fiat_currencies', fiat_currency_ids),
+                         ('gold_coins', gold_coin_ids), ('gold_items', gold_item_ids)):
+            available = snapshot.get(key) or {}
+            for asset_id in ids or []:
+                if asset_id not in available:
+                    return None
+                result[key][asset_id] = available[asset_id]
+
+        for key, included in (('gold', include_gold), ('silver', include_silver), ('usd_irr', include_usd)):
+            if included:
+                if not snapshot.get(key):
+                    return None
+                result[key] = snapshot[key]
+
+        return result
+
     def format_price_message(self, prices: Dict) -> tuple:
         """
         فرمت کردن قیمت‌ها به صورت پیام تلگرام (فرمت فشرده)
@@ -763,3 +829,57 @@ class PriceFetcher:
             has_error = True
 
         return "\n".join(lines), has_error
+
+    def price_vector(self, prices: Dict) -> Dict[str, float]:
+        """
+        تبدیل خروجی get_all_prices به قیمت‌های فشرده با کلید خانه‌های ASSET_SLOTS
+
+        کلید شناسه خانه است (نه جایگاه آن) تا اضافه یا حذف شدن دارایی در config
+        قیمت‌های ذخیره شده قبلی را به دارایی اشتباه نسبت ندهد.
+
+        Returns:
+            dict: شناسه خانه -> قیمت (دارایی‌های انتخاب نشده یا بدون قیمت حذف می‌شوند)
+        """
+        values = {}
+
+        for key in ('usd_irr', 'gold', 'silver'):
+            if prices.get(key):
+                values[key] = prices[key].get('price')
+
+        for crypto_id, data in (prices.get('cryptos') or {}).items():
+            values[f'crypto:{crypto_id}'] = data.get('price')
+            values[f'crypto_irt:{crypto_id}'] = data.get('price_toman')
+
+        for fiat_id, data in (prices.get('fiat_currencies') or {}).items():
+            values[f'fiat:{fiat_id}'] = data.get('buy')
+
+        for coin_id, data in (prices.get('gold_coins') or {}).items():
+            values[f'coin:{coin_id}'] = data.get('buy')
+
+        for item_id, data in (prices.get('gold_items') or {}).items():
+            values[f'gold_item:{item_id}'] = data.get('price')
+
+        vector = {}
+        for slot in ASSET_SLOTS:
+            value = self.safe_float(values.get(slot), 0)
+            if value > 0:
+                vector[slot] = value
+        return vector
+
+    @staticmethod
+    def max_change_percent(old: Dict[str, float], new: Dict[str, float]) -> float:
+        """
+        بیشترین درصد تغییر بین دو مجموعه قیمت (خروجی price_vector)
+
+        اگر دارایی جدیدی نسبت به قیمت‌های قبلی اضافه شده باشد، بی‌نهایت برگردانده می‌شود
+        تا گزارش کامل ارسال شود.
+        """
+        max_change = 0.0
+        for slot, new_price in new.items():
+            old_price = old.get(slot)
+            if not old_price:
+                return float('inf')
+            change = abs(new_price - old_price) / old_price * 100
+            if change > max_change:
+                max_change = change
+        return max_change
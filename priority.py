@@ -0,0 +1,169 @@
+"""
+زمان‌بندی اولویت‌دار منابع مشترک (دریافت قیمت و ارسال پیام)
+
+درخواست‌های تعاملی کاربران (lane ی interactive) همیشه جلوتر از کارهای
+انبوه مثل ارسال زمان‌بندی شده (lane ی bulk) قرار می‌گیرند و کارهای انبوه
+فقط سهم محدودی از ظرفیت را اشغال می‌کنند.
+"""
+import asyncio
+import bisect
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+# مرزهای بازه‌های هیستوگرام زمان انتظار (میلی‌ثانیه)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class WaitHistogram:
+    """هیستوگرام زمان انتظار در صف"""
+
+    def __init__(self, buckets_ms=WAIT_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float):
+        """ثبت یک زمان انتظار (ثانیه)"""
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> float:
+        """حد بالای بازه‌ای که صدک p در آن قرار دارد (میلی‌ثانیه)"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.buckets_ms[i], self.max_ms) if i < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'max_ms': self.max_ms
+        }
+
+
+class PriorityGate:
+    """
+    محدودکننده هم‌زمانی با دو lane
+
+    - lane ی interactive به محض آزاد شدن ظرفیت جلوتر از bulk سرویس می‌گیرد
+    - lane ی bulk حداکثر bulk_share از ظرفیت را هم‌زمان اشغال می‌کند
+    """
+
+    def __init__(self, capacity: int, bulk_share: float):
+        self.capacity = max(1, capacity)
+        self.bulk_limit = max(1, min(self.capacity, int(self.capacity * bulk_share)))
+        self._in_use = {lane: 0 for lane in LANES}
+        self._waiters = {lane: deque() for lane in LANES}
+        self.wait_stats = {lane: WaitHistogram() for lane in LANES}
+
+    @property
+    def in_use(self) -> int:
+        return sum(self._in_use.values())
+
+    def waiting(self, lane: str) -> int:
+        return len(self._waiters[lane])
+
+    def _can_start(self, lane: str) -> bool:
+        if self.in_use >= self.capacity:
+            return False
+        if lane == BULK:
+            return not self._waiters[INTERACTIVE] and self._in_use[BULK] < self.bulk_limit
+        return True
+
+    def _wake(self):
+        """واگذاری ظرفیت آزاد شده به منتظرها (اول interactive)"""
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and self._can_start_waiter(lane):
+                future = waiters.popleft()
+                if not future.done():
+                    self._in_use[lane] += 1
+                    future.set_result(None)
+
+    def _can_start_waiter(self, lane: str) -> bool:
+        if self.in_use >= self.capacity:
+            return False
+        if lane == BULK:
+            return self._in_use[BULK] < self.bulk_limit
+        return True
+
+    async def acquire(self, lane: str = BULK):
+        started = time.monotonic()
+
+        if not self._waiters[lane] and self._can_start(lane):
+            self._in_use[lane] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[lane].append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # ظرفیت گرفته شده بود ولی استفاده نشد
+                    self._release(lane)
+                else:
+                    self._waiters[lane].remove(future)
+                raise
+
+        self.wait_stats[lane].observe(time.monotonic() - started)
+
+    def _release(self, lane: str):
+        self._in_use[lane] -= 1
+        self._wake()
+
+    def release(self, lane: str = BULK):
+        self._release(lane)
+
+    @asynccontextmanager
+    async def slot(self, lane: str = BULK):
+        """گرفتن یک واحد ظرفیت در lane مشخص"""
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for lane in LANES:
+            summary = self.wait_stats[lane].summary()
+            summary['in_use'] = self._in_use[lane]
+            summary['waiting'] = len(self._waiters[lane])
+            result[lane] = summary
+        return result
+
+
+def format_lane_stats(stats: Dict[str, Dict[str, float]]) -> List[str]:
+    """خلاصه متنی آمار lane ها برای نمایش در پنل ادمین"""
+    names = {INTERACTIVE: 'تعاملی', BULK: 'انبوه'}
+    lines = []
+    for lane in LANES:
+        lane_stats = stats[lane]
+        line = (
+            f"• {names[lane]}: {lane_stats['count']:,} | "
+            f"p50 {lane_stats['p50_ms']:.0f}ms | p95 {lane_stats['p95_ms']:.0f}ms | "
+            f"max {lane_stats['max_ms']:.0f}ms"
+        )
+        if 'waiting' in lane_stats:
+            line += f" | در انتظار {lane_stats['waiting']:,}"
+        lines.append(line)
+    return lines
@@ -0,0 +1,150 @@
+"""
+بایگانی و حذف تاریخچه قدیمی پیام‌ها
+
+ردیف‌های message_history قدیمی‌تر از HISTORY_RETENTION_DAYS در دسته‌های
+HISTORY_ARCHIVE_BATCH تایی خوانده، به فایل ماهانه
+HISTORY_ARCHIVE_DIR/message_history-YYYY-MM.csv.gz اضافه و سپس حذف می‌شوند.
+هر دسته یک تراکنش کوتاه حذف است و نوشتن فایل بیرون از تراکنش انجام می‌شود.
+
+آمار کلی پنل مدیریت از جداول تجمیعی خوانده می‌شود و با حذف تاریخچه تغییر نمی‌کند.
+
+هر دسته یک member جدید gzip به انتهای فایل اضافه می‌کند (zcat و gzip.open
+همه را پشت سر هم می‌خوانند). اگر پردازه بین نوشتن فایل و حذف متوقف شود
+حداکثر یک دسته دوباره بایگانی می‌شود؛ ستون id برای حذف تکرار در فایل هست.
+
+نحوه اجرای دستی:
+    python retention.py                              # یک دور بایگانی
+    python retention.py --enable-incremental-vacuum  # یک بار برای فایل‌های قدیمی (ربات متوقف)
+"""
+import argparse
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from config import HISTORY_RETENTION_DAYS, HISTORY_ARCHIVE_DIR, HISTORY_ARCHIVE_BATCH
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'message_type', 'sent_at')
+
+# مکث بین دسته‌ها تا نوشتن‌های ربات منتظر قفل نمانند (ثانیه)
+BATCH_PAUSE = 0.05
+
+
+def archive_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f'message_history-{month}.csv.gz')
+
+
+def write_archive(archive_dir: str, rows: List[Dict]) -> Dict[str, int]:
+    """افزودن ردیف‌ها به فایل ماهانه هر کدام؛ Returns: تعداد ردیف هر ماه"""
+    by_month: Dict[str, List[Dict]] = {}
+    for row in rows:
+        by_month.setdefault(str(row['sent_at'])[:7], []).append(row)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, month_rows in by_month.items():
+        path = archive_path(archive_dir, month)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=ARCHIVE_COLUMNS)
+        if not os.path.exists(path):
+            writer.writeheader()
+        writer.writerows(month_rows)
+
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(buffer.getvalue().encode()))
+            f.flush()
+            os.fsync(f.fileno())
+
+    return {month: len(month_rows) for month, month_rows in by_month.items()}
+
+
+class HistoryArchiver:
+    """
+    بایگانی تاریخچه پیام‌ها (هم‌زمان؛ در ربات با asyncio.to_thread اجرا می‌شود)
+
+    Args:
+        db: نمونه Database
+        archive_dir: پوشه فایل‌های بایگانی
+        retention_days: نگهداری ردیف‌های جدیدتر از این تعداد روز
+        batch_size: تعداد ردیف در هر دسته
+    """
+
+    def __init__(self, db, archive_dir: str = HISTORY_ARCHIVE_DIR,
+                 retention_days: int = HISTORY_RETENTION_DAYS, batch_size: int = HISTORY_ARCHIVE_BATCH):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = max(1, batch_size)
+        self.stats = {'archived': 0, 'runs': 0, 'freed_pages': 0}
+
+    def cutoff(self) -> str:
+        """مرز قدیمی بودن با همان قالب CURRENT_TIMESTAMP (UTC)"""
+        return (datetime.utcnow() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def run_once(self, max_batches: int = None) -> int:
+        """
+        بایگانی تمام ردیف‌های قدیمی (یا حداکثر max_batches دسته) و به‌روزرسانی آمار پایگاه داده
+
+        Returns:
+            تعداد ردیف‌های بایگانی و حذف شده
+        """
+        archived = 0
+        if self.retention_days > 0:
+            archived = self._archive(max_batches)
+
+        # نگهداری دوره‌ای: آمار طرح اجرا بعد از تغییر حجم و توزیع داده‌ها
+        self.db.analyze()
+        self.stats['archived'] += archived
+        self.stats['runs'] += 1
+        return archived
+
+    def _archive(self, max_batches: int = None) -> int:
+        before = self.cutoff()
+        archived = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            rows = self.db.get_history_batch(before, self.batch_size)
+            if not rows:
+                break
+
+            write_archive(self.archive_dir, rows)
+            deleted = self.db.delete_history_through(rows[-1]['id'], before)
+            if deleted != len(rows):
+                logger.warning(f"بایگانی تاریخچه: {len(rows):,} ردیف نوشته و {deleted:,} ردیف حذف شد")
+            archived += len(rows)
+            batches += 1
+            time.sleep(BATCH_PAUSE)
+
+        if archived:
+            self.stats['freed_pages'] += self.db.incremental_vacuum()
+            logger.info(f"{archived:,} ردیف تاریخچه پیام تا {before} بایگانی شد")
+        return archived
+
+
+def main():
+    from database import Database
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='بایگانی تاریخچه پیام‌ها')
+    parser.add_argument('--days', type=int, default=HISTORY_RETENTION_DAYS)
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='تبدیل فایل پایگاه داده موجود به auto_vacuum=INCREMENTAL (ربات باید متوقف باشد)')
+    args = parser.parse_args()
+
+    db = Database()
+    if args.enable_incremental_vacuum:
+        print("✅ فعال شد" if db.enable_incremental_vacuum() else "❌ خطا در فعال‌سازی")
+        return
+
+    archiver = HistoryArchiver(db, retention_days=args.days)
+    archived = archiver.run_once()
+    print(f"ردیف‌های بایگانی شده: {archived:,} | صفحات آزاد شده: {archiver.stats['freed_pages']:,}")
+
+
+if __name__ == '__main__':
+    main()
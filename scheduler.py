@@ -0,0 +1,302 @@
+"""
+مدیریت افزایشی job های زمان‌بندی ارسال روزانه
+
+زمان‌بندی‌ها بر اساس دقیقه UTC (با در نظر گرفتن منطقه زمانی هر کاربر)
+گروه‌بندی می‌شوند؛ بنابراین تعداد job ها حداکثر 1440 است.
+
+هر job فقط دقیقه خود را نگه می‌دارد و لیست کاربران در لحظه اجرا
+از دیتابیس (با ایندکس روی utc_minute) خوانده می‌شود. افزودن، حذف یا
+تغییر یک زمان‌بندی فقط job همان دقیقه را لمس می‌کند.
+
+دسترسی به دیتابیس از طریق AsyncDatabase است تا event loop منتظر دیسک نماند؛
+تغییر job ها بعد از آخرین await هر متد انجام می‌شود تا بین بررسی و تغییر
+handler دیگری job همان دقیقه را عوض نکند.
+"""
+import functools
+import logging
+import math
+import zlib
+from datetime import datetime, time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import pytz
+
+from config import (
+    TIMEZONE, DELIVERY_RATE_LIMIT, SCHEDULE_SPREAD_MINUTES,
+    SCHEDULE_SPREAD_MAX_MINUTES, SCHEDULE_DELIVERY_SLO
+)
+
+logger = logging.getLogger(__name__)
+
+# فاصله بررسی تغییر ساعت تابستانی (ثانیه)
+DST_CHECK_INTERVAL = 3600
+
+
+@functools.lru_cache(maxsize=None)
+def get_zone(name: str):
+    """شیء منطقه زمانی pytz (کش شده)؛ نام نامعتبر به منطقه پیش‌فرض برمی‌گردد"""
+    try:
+        return pytz.timezone(name or TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        logger.warning(f"منطقه زمانی نامعتبر: {name}")
+        return pytz.timezone(TIMEZONE)
+
+
+def minute_key(utc_minute: int) -> str:
+    """نمایش دقیقه UTC به صورت HH:MM"""
+    return f'{utc_minute // 60:02d}:{utc_minute % 60:02d}'
+
+
+def local_to_utc_minute(time_str: str, timezone: str, now: datetime = None) -> int:
+    """تبدیل ساعت محلی HH:MM کاربر به دقیقه UTC با offset فعلی منطقه زمانی"""
+    zone = get_zone(timezone)
+    hour, minute = map(int, time_str.split(':'))
+    local_date = (now or datetime.now(pytz.utc)).astimezone(zone).date()
+    local_dt = zone.localize(datetime.combine(local_date, time(hour=hour, minute=minute)))
+    utc_dt = local_dt.astimezone(pytz.utc)
+    return utc_dt.hour * 60 + utc_dt.minute
+
+
+def spread_window(bucket_size: int) -> int:
+    """
+    تعداد دقیقه‌هایی که کاربران یک نوبت ارسال در آن پخش می‌شوند
+
+    اگر تعداد کاربران بیشتر از ظرفیت ارسال در SLO باشد (نرخ ارسال ×
+    SCHEDULE_DELIVERY_SLO) پنجره به صورت خودکار تا سقف مجاز گسترش می‌یابد.
+    """
+    required = math.ceil(bucket_size / max(DELIVERY_RATE_LIMIT * SCHEDULE_DELIVERY_SLO, 1))
+    return max(1, min(max(SCHEDULE_SPREAD_MINUTES, required), SCHEDULE_SPREAD_MAX_MINUTES))
+
+
+def spread_slot(user_id: int, window: int) -> int:
+    """دقیقه ثابت کاربر در پنجره پخش (بر اساس hash شناسه کاربر)"""
+    if window <= 1:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % window
+
+
+def split_by_slot(user_ids: List[int], window: int) -> Dict[int, List[int]]:
+    """تقسیم کاربران یک نوبت بر اساس دقیقه آن‌ها در پنجره پخش"""
+    slots: Dict[int, List[int]] = {}
+    for user_id in user_ids:
+        slots.setdefault(spread_slot(user_id, window), []).append(user_id)
+    return slots
+
+
+class ScheduleManager:
+    """نگهداری یک job روزانه برای هر دقیقه UTC که حداقل یک زمان‌بندی فعال دارد"""
+
+    JOB_PREFIX = 'schedule_'
+    DST_JOB_NAME = 'timezone_dst_check'
+    RESYNC_JOB_NAME = 'resync_schedules'
+
+    def __init__(self, database, callback: Callable):
+        """
+        Args:
+            database: AsyncDatabase
+            callback: callback اجرای هر نوبت زمان‌بندی
+        """
+        self.db = database
+        self.callback = callback
+        self.job_queue = None
+        self.active = False
+        self._zone_offsets: Dict[str, object] = {}
+
+    def attach(self, job_queue):
+        """اتصال به JobQueue برنامه"""
+        self.job_queue = job_queue
+
+    async def activate(self, resync_interval: int = None) -> int:
+        """
+        شروع مدیریت job ها در این پردازه (در حالت چند worker فقط leader)
+
+        Args:
+            resync_interval: فاصله هماهنگ‌سازی کامل دوره‌ای (ثانیه)؛ در حالت چند
+                worker زمان‌بندی‌هایی که در worker های دیگر تغییر کرده‌اند را پیدا می‌کند
+
+        Returns:
+            تعداد job های فعال
+        """
+        if not self.job_queue:
+            logger.error("JobQueue در دسترس نیست")
+            return 0
+
+        self.active = True
+        if not self.job_queue.get_jobs_by_name(self.DST_JOB_NAME):
+            self.job_queue.run_repeating(
+                self._dst_job, interval=DST_CHECK_INTERVAL,
+                first=DST_CHECK_INTERVAL, name=self.DST_JOB_NAME
+            )
+        if resync_interval and not self.job_queue.get_jobs_by_name(self.RESYNC_JOB_NAME):
+            self.job_queue.run_repeating(
+                self._resync_job, interval=resync_interval,
+                first=resync_interval, name=self.RESYNC_JOB_NAME
+            )
+        return await self.load_all()
+
+    def deactivate(self):
+        """حذف تمام job های زمان‌بندی این پردازه (مثلاً بعد از از دست دادن leadership)"""
+        self.active = False
+        if not self.job_queue:
+            return
+        for job in self.job_queue.jobs():
+            if job.name and (job.name.startswith(self.JOB_PREFIX)
+                             or job.name in (self.DST_JOB_NAME, self.RESYNC_JOB_NAME)):
+                job.schedule_removal()
+
+    @classmethod
+    def job_name(cls, utc_minute: int) -> str:
+        return f'{cls.JOB_PREFIX}{minute_key(utc_minute).replace(":", "")}'
+
+    async def user_utc_minute(self, user_id: int, time_str: str) -> int:
+        """دقیقه UTC ساعت محلی کاربر"""
+        settings = await self.db.get_user_settings(user_id)
+        timezone = (settings or {}).get('timezone') or TIMEZONE
+        return local_to_utc_minute(time_str, timezone)
+
+    def _get_job(self, utc_minute: int):
+        jobs = self.job_queue.get_jobs_by_name(self.job_name(utc_minute))
+        return jobs[0] if jobs else None
+
+    def _add_job(self, utc_minute: int):
+        self.job_queue.run_daily(
+            self.callback,
+            time=time(hour=utc_minute // 60, minute=utc_minute % 60, tzinfo=pytz.utc),
+            data={'minute': utc_minute},
+            name=self.job_name(utc_minute)
+        )
+
+    async def sync_bucket(self, utc_minute: Optional[int]) -> Optional[bool]:
+        """
+        هماهنگ کردن job یک دقیقه با دیتابیس
+
+        Returns:
+            True اگر job ایجاد شد، False اگر حذف شد، None اگر تغییری لازم نبود
+        """
+        if utc_minute is None or not self.active:
+            return None
+        if not self.job_queue:
+            logger.error("JobQueue در دسترس نیست")
+            return None
+
+        needed = await self.db.has_bucket_schedules(utc_minute)
+        if not self.active:
+            return None
+        job = self._get_job(utc_minute)
+
+        if needed and not job:
+            self._add_job(utc_minute)
+            logger.info(f"job زمان‌بندی {minute_key(utc_minute)} UTC ایجاد شد")
+            return True
+        if job and not needed:
+            job.schedule_removal()
+            logger.info(f"job زمان‌بندی {minute_key(utc_minute)} UTC حذف شد")
+            return False
+        return None
+
+    async def sync_buckets(self, utc_minutes: Iterable[Optional[int]]):
+        """هماهنگ کردن چند دقیقه (بدون تکرار)"""
+        for utc_minute in set(utc_minutes):
+            await self.sync_bucket(utc_minute)
+
+    async def recompute_minutes(self, timezone: str = None, user_id: int = None) -> Set[int]:
+        """
+        محاسبه دوباره دقیقه UTC زمان‌بندی‌ها و ذخیره موارد تغییر کرده
+
+        Returns:
+            دقیقه‌های قبلی و جدید زمان‌بندی‌هایی که تغییر کردند
+        """
+        now = datetime.now(pytz.utc)
+        changed = {}
+        affected = set()
+
+        for schedule in await self.db.get_schedules_with_timezone(timezone=timezone, user_id=user_id):
+            utc_minute = local_to_utc_minute(schedule['notification_time'], schedule['timezone'], now)
+            if utc_minute != schedule['utc_minute']:
+                changed[schedule['id']] = utc_minute
+                affected.add(utc_minute)
+                if schedule['utc_minute'] is not None:
+                    affected.add(schedule['utc_minute'])
+
+        await self.db.update_schedule_utc_minutes(changed)
+        return affected
+
+    async def sync_user(self, user_id: int):
+        """هماهنگ‌سازی زمان‌بندی‌های یک کاربر (مثلاً بعد از تغییر منطقه زمانی)"""
+        await self.sync_buckets(await self.recompute_minutes(user_id=user_id))
+
+    async def check_dst(self) -> int:
+        """
+        بررسی تغییر offset منطقه‌های زمانی در حال استفاده
+
+        فقط زمان‌بندی‌های منطقه‌هایی که offset آن‌ها عوض شده دوباره محاسبه
+        و فقط job دقیقه‌های تحت تاثیر هماهنگ می‌شوند.
+
+        Returns:
+            تعداد منطقه‌های زمانی تغییر کرده
+        """
+        now = datetime.now(pytz.utc)
+        changed_zones = 0
+
+        for timezone in await self.db.get_schedule_timezones():
+            offset = now.astimezone(get_zone(timezone)).utcoffset()
+            previous = self._zone_offsets.get(timezone)
+            self._zone_offsets[timezone] = offset
+
+            if previous is None or previous == offset:
+                continue
+
+            changed_zones += 1
+            affected = await self.recompute_minutes(timezone=timezone)
+            await self.sync_buckets(affected)
+            logger.info(f"تغییر ساعت در {timezone}: {len(affected)} دقیقه زمان‌بندی به‌روزرسانی شد")
+
+        return changed_zones
+
+    async def _resync_job(self, context):
+        try:
+            await self.load_all()
+        except Exception as e:
+            logger.error(f"خطا در هماهنگ‌سازی دوره‌ای زمان‌بندی‌ها: {e}")
+
+    async def _dst_job(self, context):
+        try:
+            await self.check_dst()
+        except Exception as e:
+            logger.error(f"خطا در بررسی تغییر ساعت: {e}")
+
+    async def load_all(self) -> int:
+        """
+        هماهنگ‌سازی کامل job ها با دیتابیس (هنگام راه‌اندازی یا resync دوره‌ای)
+
+        Returns:
+            تعداد job های فعال
+        """
+        if not self.active:
+            return 0
+        if not self.job_queue:
+            logger.error("JobQueue در دسترس نیست")
+            return 0
+
+        # تکمیل دقیقه UTC زمان‌بندی‌های قدیمی و ثبت offset فعلی منطقه‌ها
+        if await self.recompute_minutes():
+            # آمار قبلی (utc_minute خالی) کوئری هر نوبت را به خواندن کامل جدول می‌کشاند
+            await self.db.analyze('notification_schedules')
+        await self.check_dst()
+
+        utc_minutes = set(await self.db.get_active_schedule_minutes())
+        if not self.active:
+            return 0
+        total = len(utc_minutes)
+
+        for job in self.job_queue.jobs():
+            if job.name and job.name.startswith(self.JOB_PREFIX):
+                if job.data.get('minute') not in utc_minutes:
+                    job.schedule_removal()
+                else:
+                    utc_minutes.discard(job.data['minute'])
+
+        for utc_minute in utc_minutes:
+            self._add_job(utc_minute)
+
+        return total
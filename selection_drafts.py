@@ -0,0 +1,126 @@
+"""
+پیش‌نویس انتخاب دارایی‌ها در منوهای چند انتخابی
+
+هر کلیک در منوی انتخاب فقط پیش‌نویس حافظه‌ای کاربر را تغییر می‌دهد و کیبورد
+فوراً از روی آن ساخته می‌شود. پیش‌نویس یک بار ذخیره می‌شود:
+- وقتی کاربر از منو خارج می‌شود (تأیید/بازگشت یا هر update دیگری از همان کاربر)
+- بعد از SELECTION_DRAFT_IDLE_TIMEOUT ثانیه بدون کلیک
+- هنگام توقف ربات
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from config import (
+    SELECTION_DRAFT_IDLE_TIMEOUT, DEFAULT_CRYPTOS, DEFAULT_FIAT_CURRENCIES, DEFAULT_COINS, DEFAULT_GOLD_ITEMS
+)
+
+logger = logging.getLogger(__name__)
+
+# نوع انتخاب: (کلید در تنظیمات کاربر، متد ذخیره در Database، انتخاب کاربر بدون تنظیمات)
+DRAFT_KINDS = {
+    'crypto': ('selected_cryptos', 'update_selected_cryptos', DEFAULT_CRYPTOS),
+    'fiat': ('selected_fiat_currencies', 'update_selected_fiat_currencies', DEFAULT_FIAT_CURRENCIES),
+    'coin': ('selected_gold_coins', 'update_selected_gold_coins', DEFAULT_COINS),
+    'gold_item': ('selected_gold_items', 'update_selected_gold_items', DEFAULT_GOLD_ITEMS),
+}
+
+
+class SelectionDrafts:
+    """
+    پیش‌نویس انتخاب‌های کاربران
+
+    Args:
+        adb: AsyncDatabase (یا هر شیء با متدهای async تنظیمات)
+        idle_timeout: ذخیره خودکار بعد از این مدت بدون کلیک (ثانیه)
+    """
+
+    def __init__(self, adb, idle_timeout: float = SELECTION_DRAFT_IDLE_TIMEOUT):
+        self.adb = adb
+        self.idle_timeout = idle_timeout
+        # user_id -> نوع انتخاب -> لیست انتخاب شده
+        self._drafts: Dict[int, Dict[str, List[str]]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._idle_saves = set()
+        self.stats = {'toggles': 0, 'saves': 0, 'writes': 0, 'idle_saves': 0, 'failed': 0}
+
+    def __len__(self) -> int:
+        return len(self._drafts)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._drafts
+
+    async def get(self, user_id: int, kind: str) -> List[str]:
+        """انتخاب فعلی (پیش‌نویس یا مقدار ذخیره شده)"""
+        draft = self._drafts.get(user_id, {}).get(kind)
+        if draft is not None:
+            return list(draft)
+
+        field, _, default = DRAFT_KINDS[kind]
+        settings = await self.adb.get_user_settings(user_id)
+        return list(settings.get(field, []) if settings else default)
+
+    async def toggle(self, user_id: int, kind: str, asset_id: str, min_selected: int = 0) -> Optional[List[str]]:
+        """
+        انتخاب/لغو یک دارایی در پیش‌نویس
+
+        Returns:
+            انتخاب جدید یا None اگر کمتر از min_selected دارایی باقی بماند (بدون تغییر)
+        """
+        selected = await self.get(user_id, kind)
+        if asset_id in selected:
+            selected.remove(asset_id)
+        else:
+            selected.append(asset_id)
+
+        if len(selected) < min_selected:
+            return None
+
+        self._drafts.setdefault(user_id, {})[kind] = selected
+        self.stats['toggles'] += 1
+        self._schedule_idle_save(user_id)
+        return list(selected)
+
+    async def save(self, user_id: int) -> bool:
+        """ذخیره تمام پیش‌نویس‌های کاربر (یک نوشتن برای هر نوع انتخاب)"""
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        drafts = self._drafts.pop(user_id, None)
+        if not drafts:
+            return True
+
+        saved = True
+        for kind, selected in drafts.items():
+            _, method, _ = DRAFT_KINDS[kind]
+            if await getattr(self.adb, method)(user_id, selected):
+                self.stats['writes'] += 1
+            else:
+                saved = False
+                self.stats['failed'] += 1
+                logger.error(f"خطا در ذخیره انتخاب {kind} کاربر {user_id}")
+        self.stats['saves'] += 1
+        return saved
+
+    async def stop(self):
+        """ذخیره تمام پیش‌نویس‌ها هنگام توقف"""
+        if self._idle_saves:
+            await asyncio.gather(*self._idle_saves, return_exceptions=True)
+        for user_id in list(self._drafts):
+            await self.save(user_id)
+
+    def _schedule_idle_save(self, user_id: int):
+        timer = self._timers.get(user_id)
+        if timer is not None:
+            timer.cancel()
+        self._timers[user_id] = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._save_idle, user_id
+        )
+
+    def _save_idle(self, user_id: int):
+        self._timers.pop(user_id, None)
+        self.stats['idle_saves'] += 1
+        task = asyncio.create_task(self.save(user_id))
+        self._idle_saves.add(task)
+        task.add_done_callback(self._idle_saves.discard)
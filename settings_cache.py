@@ -0,0 +1,151 @@
+"""
+کش تنظیمات کاربران (write-through)
+
+- تنظیمات باز شده (JSON به لیست) هر کاربر در یک کش LRU محدود نگه داشته می‌شود
+- متدهای تغییر تنظیمات در Database بعد از commit، ورودی کش را هم به‌روز می‌کنند
+  (در اجرای دسته‌ای AsyncDatabase بعد از commit کل دسته)
+- حالت local: کش تنها منبع معتبر است (یک پردازه)
+- حالت version: در هر برخورد، ستون settings_version با یک کوئری کلید اصلی بررسی
+  می‌شود تا تغییرات پردازه‌های دیگر (worker ها، اسکریپت‌ها) دیده شوند
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import SETTINGS_CACHE_SIZE, SETTINGS_CACHE_MODE
+
+CACHE_MODES = ('local', 'version')
+
+# ستون‌های لیستی که به caller کپی آن‌ها داده می‌شود
+LIST_FIELDS = ('selected_cryptos', 'selected_fiat_currencies', 'selected_gold_coins', 'selected_gold_items')
+
+
+def copy_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """کپی تنظیمات تا تغییر لیست‌ها توسط caller روی کش اثر نگذارد"""
+    settings = dict(settings)
+    for field in LIST_FIELDS:
+        if field in settings:
+            settings[field] = list(settings[field])
+    return settings
+
+
+class SettingsCache:
+    """
+    کش LRU تنظیمات کاربران (thread-safe؛ Database از چند thread استفاده می‌شود)
+
+    Args:
+        max_size: حداکثر تعداد کاربران در کش (0 = غیرفعال)
+        mode: local یا version
+    """
+
+    def __init__(self, max_size: int = SETTINGS_CACHE_SIZE, mode: str = SETTINGS_CACHE_MODE):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"حالت نامعتبر کش تنظیمات: {mode}")
+        self.max_size = max(0, max_size)
+        self.mode = mode
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # با هر تغییر افزایش می‌یابد؛ خواندنی که قبل از یک تغییر شروع شده در کش ثبت نمی‌شود
+        self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'writes': 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def versioned(self) -> bool:
+        return self.mode == 'version'
+
+    def get(self, user_id: int, version: int = None) -> Optional[Dict[str, Any]]:
+        """
+        کپی تنظیمات کش شده یا None
+
+        Args:
+            version: settings_version فعلی ردیف در پایگاه داده (حالت version)؛
+                ورودی با نسخه متفاوت حذف و miss حساب می‌شود
+        """
+        with self._lock:
+            settings = self._entries.get(user_id)
+            if settings is not None and version is not None and settings.get('settings_version') != version:
+                del self._entries[user_id]
+                self.stats['stale'] += 1
+                settings = None
+            if settings is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.stats['hits'] += 1
+        return copy_settings(settings)
+
+    def get_many(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """کپی ورودی‌های موجود بدون تغییر آمار و ترتیب LRU (خواندن‌های انبوه)"""
+        with self._lock:
+            found = {user_id: self._entries[user_id] for user_id in user_ids if user_id in self._entries}
+        return {user_id: copy_settings(settings) for user_id, settings in found.items()}
+
+    def set(self, user_id: int, settings: Dict[str, Any], generation: int):
+        """
+        ثبت تنظیمات خوانده شده از پایگاه داده
+
+        Args:
+            generation: مقدار self.generation قبل از شروع خواندن
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = settings
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def refresh(self, user_id: int, settings: Dict[str, Any], generation: int):
+        """جایگزینی فقط اگر کاربر در کش باشد (خواندن‌های انبوه کاربران پرکاربرد را بیرون نمی‌کنند)"""
+        with self._lock:
+            if generation == self.generation and user_id in self._entries:
+                self._entries[user_id] = settings
+
+    def update(self, user_id: int, **fields):
+        """
+        write-through بعد از commit یک UPDATE موفق روی ردیف کاربر
+
+        settings_version هم مثل trigger پایگاه داده یک واحد افزایش می‌یابد؛ اگر در این
+        فاصله پردازه دیگری هم ردیف را تغییر داده باشد نسخه‌ها برابر نمی‌شوند و خواندن
+        بعدی ورودی را دوباره بارگذاری می‌کند.
+        """
+        with self._lock:
+            self.generation += 1
+            settings = self._entries.get(user_id)
+            if settings is None:
+                return
+            settings = dict(settings, **fields)
+            if 'settings_version' in settings:
+                settings['settings_version'] += 1
+            self._entries[user_id] = settings
+            self.stats['writes'] += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def hit_rate(self) -> float:
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total * 100 if total else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return dict(self.stats, size=len(self._entries), hit_rate=self.hit_rate())
@@ -0,0 +1,126 @@
+"""
+پردازش هم‌زمان update ها با ترتیب ثابت برای هر کاربر
+
+- سقف سراسری برای تعداد update های در حال پردازش
+- قفل جداگانه برای هر کاربر تا callback های یک کاربر (مثل toggle_crypto)
+  روی ردیف user_settings او با هم تداخل نکنند
+- رد محترمانه update ها وقتی ربات بیش از حد شلوغ است
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_OVERLOAD_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_MESSAGE = "⏳ ربات در حال حاضر شلوغ است، لطفاً چند لحظه دیگر دوباره تلاش کنید."
+
+
+class _UserLock:
+    """قفل یک کاربر به همراه تعداد update های منتظر آن"""
+
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UserSerializingProcessor(BaseUpdateProcessor):
+    """
+    پردازشگر update با هم‌زمانی محدود و ترتیب ثابت برای هر کاربر
+
+    Args:
+        concurrency: حداکثر update های در حال اجرا به صورت هم‌زمان
+        max_pending: حداکثر update های پذیرفته شده (در حال اجرا + منتظر)
+        overload_timeout: حداکثر زمان انتظار هر update قبل از رد شدن (ثانیه)
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY,
+                 max_pending: int = UPDATE_MAX_PENDING,
+                 overload_timeout: float = UPDATE_OVERLOAD_TIMEOUT):
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self.overload_timeout = overload_timeout
+        self._running: Optional[asyncio.Semaphore] = None
+        self._user_locks: Dict[int, _UserLock] = {}
+        self.stats = {'processed': 0, 'rejected': 0, 'failed': 0}
+        # فراخوانی بعد از پایان هر update (مثلاً برای ثبت زمان کامل پردازش در webhook)
+        self.on_processed: Optional[Callable[[object], None]] = None
+
+    async def initialize(self) -> None:
+        self._running = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self) -> None:
+        self._user_locks.clear()
+
+    @property
+    def active_users(self) -> int:
+        """تعداد کاربرانی که update در حال پردازش یا منتظر دارند"""
+        return len(self._user_locks)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = None
+        if isinstance(update, Update) and update.effective_user:
+            user_id = update.effective_user.id
+
+        user_lock = None
+        if user_id is not None:
+            user_lock = self._user_locks.get(user_id)
+            if user_lock is None:
+                user_lock = self._user_locks[user_id] = _UserLock()
+            user_lock.users += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.overload_timeout
+        locked = False
+        running = False
+
+        try:
+            try:
+                if user_lock:
+                    await asyncio.wait_for(user_lock.lock.acquire(), max(deadline - loop.time(), 0))
+                    locked = True
+                await asyncio.wait_for(self._running.acquire(), max(deadline - loop.time(), 0))
+                running = True
+            except asyncio.TimeoutError:
+                self.stats['rejected'] += 1
+                coroutine.close()
+                logger.warning(f"update کاربر {user_id} به دلیل شلوغی رد شد")
+                await self._reject(update)
+                return
+
+            try:
+                await coroutine
+                self.stats['processed'] += 1
+            except Exception:
+                self.stats['failed'] += 1
+                raise
+        finally:
+            if self.on_processed:
+                self.on_processed(update)
+            if running:
+                self._running.release()
+            if user_lock:
+                if locked:
+                    user_lock.lock.release()
+                user_lock.users -= 1
+                if user_lock.users == 0:
+                    self._user_locks.pop(user_id, None)
+
+    async def _reject(self, update: object):
+        """اطلاع به کاربر در صورت رد شدن update"""
+        if not isinstance(update, Update):
+            return
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(OVERLOAD_MESSAGE)
+            elif update.message:
+                await update.message.reply_text(OVERLOAD_MESSAGE)
+        except TelegramError as e:
+            logger.error(f"خطا در ارسال پیام شلوغی: {e}")
@@ -0,0 +1,173 @@
+"""
+سرور webhook داخلی (aiohttp) برای دریافت update ها از تلگرام
+
+- بررسی هدر X-Telegram-Bot-Api-Secret-Token
+- پاسخ فوری 200 و قرار دادن update در صف داخلی application
+  (پردازش توسط update_processor به صورت هم‌زمان انجام می‌شود)
+- ثبت زمان پاسخ (ack) و زمان کامل پردازش هر update
+- در حالت چند worker: پورت عمومی مشترک (SO_REUSEPORT) و ارسال update های
+  کاربران سایر worker ها به پورت داخلی worker مسئول
+"""
+import asyncio
+import hmac
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from telegram import Update
+
+from cluster import internal_url, shard_for
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WORKER_COUNT, WORKER_ID, WORKER_INTERNAL_PORT
+)
+from priority import WaitHistogram
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# حداکثر حجم بدنه درخواست (بایت)
+MAX_BODY_SIZE = 1024 * 1024
+
+# هدر update هایی که از worker دیگر ارسال شده‌اند (دوباره ارسال نمی‌شوند)
+FORWARDED_HEADER = 'X-Arzalan-Forwarded'
+
+# حداکثر زمان ارسال update به worker مسئول (ثانیه)
+FORWARD_TIMEOUT = 2
+
+
+class WebhookServer:
+    """
+    سرور webhook
+
+    Args:
+        bot: شیء Bot برای ساخت Update از JSON
+        update_queue: صف update های application
+        secret_token: توکن مخفی ثبت شده در setWebhook (خالی = بدون بررسی)
+        worker_count: تعداد worker ها (بیشتر از 1 = تقسیم update ها بر اساس کاربر)
+        worker_id: شماره این worker
+    """
+
+    def __init__(self, bot, update_queue, secret_token: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 worker_count: int = WORKER_COUNT, worker_id: int = WORKER_ID):
+        self.bot = bot
+        self.update_queue = update_queue
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self.worker_count = worker_count
+        self.worker_id = worker_id
+        self._runner = None
+        self._session: Optional[ClientSession] = None
+        self._received_at: Dict[int, float] = {}
+        self.ack_latency = WaitHistogram()
+        self.handler_latency = WaitHistogram()
+        self.stats = {'received': 0, 'unauthorized': 0, 'invalid': 0, 'forwarded': 0, 'forward_failed': 0}
+
+    @property
+    def clustered(self) -> bool:
+        return self.worker_count > 1
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=MAX_BODY_SIZE)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        return app
+
+    async def start(self):
+        """راه‌اندازی سرور"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+
+        if self.clustered:
+            # همه worker ها روی پورت عمومی گوش می‌دهند و هر کدام یک پورت داخلی دارند
+            await web.TCPSite(self._runner, self.host, self.port, reuse_port=True).start()
+            internal_port = WORKER_INTERNAL_PORT + self.worker_id
+            await web.TCPSite(self._runner, '127.0.0.1', internal_port).start()
+            self._session = ClientSession(timeout=ClientTimeout(total=FORWARD_TIMEOUT))
+            logger.info(f"worker {self.worker_id}: پورت داخلی {internal_port}")
+        else:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+
+        logger.info(f"سرور webhook روی {self.host}:{self.port}{self.path} راه‌اندازی شد")
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def owner_of(self, update: Update) -> int:
+        """worker مسئول update (update های بدون کاربر در همین worker پردازش می‌شوند)"""
+        if not self.clustered or not update.effective_user:
+            return self.worker_id
+        return shard_for(update.effective_user.id, self.worker_count)
+
+    async def forward(self, worker_id: int, body: bytes) -> bool:
+        """ارسال update به worker مسئول؛ False در صورت خطا"""
+        headers = {FORWARDED_HEADER: '1', 'Content-Type': 'application/json'}
+        if self.secret_token:
+            headers[SECRET_HEADER] = self.secret_token
+        try:
+            async with self._session.post(internal_url(worker_id, self.path), data=body, headers=headers) as response:
+                return response.status == 200
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"خطا در ارسال update به worker {worker_id}: {e}")
+            return False
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text='ok')
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        started = time.monotonic()
+
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ''), self.secret_token
+        ):
+            self.stats['unauthorized'] += 1
+            return web.Response(status=403)
+
+        try:
+            body = await request.read()
+            data = json.loads(body)
+            update = Update.de_json(data, self.bot)
+        except Exception as e:
+            self.stats['invalid'] += 1
+            logger.warning(f"update نامعتبر در webhook: {e}")
+            return web.Response(status=400)
+
+        if update is None:
+            self.stats['invalid'] += 1
+            return web.Response(status=400)
+
+        self.stats['received'] += 1
+
+        owner = self.owner_of(update)
+        if owner != self.worker_id and not request.headers.get(FORWARDED_HEADER):
+            if await self.forward(owner, body):
+                self.stats['forwarded'] += 1
+                self.ack_latency.observe(time.monotonic() - started)
+                return web.Response()
+            # در صورت در دسترس نبودن worker مسئول، update همین‌جا پردازش می‌شود
+            self.stats['forward_failed'] += 1
+
+        self._received_at[update.update_id] = started
+        self.update_queue.put_nowait(update)
+
+        self.ack_latency.observe(time.monotonic() - started)
+        return web.Response()
+
+    def mark_processed(self, update: object):
+        """ثبت زمان کامل پردازش update (از دریافت تا پایان handler ها)"""
+        if not isinstance(update, Update):
+            return
+        received_at = self._received_at.pop(update.update_id, None)
+        if received_at is not None:
+            self.handler_latency.observe(time.monotonic() - received_at)